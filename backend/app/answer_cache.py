@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from .cache import TTLCache, normalize_question
+from .db import SessionLocal
+from .models import AnswerCacheEntry
+from .settings import settings
+from .chat_client import routes
+from .llm import PROMPT_VERSION, answer_with_citations, stream_answer
+
+# Answer cache for /ask: (chat model, prompt version, question, ordered evidence
+# chunk ids, packed blocks included) -> LLM result. Backends: "memory" (per process LRU) or "postgres"
+# (answer_cache table, shared across workers). Concurrent identical requests are
+# coalesced onto a single in-flight LLM call (streamed or not). LLM failures are never cached.
+
+def answer_key(chat_routes: List[Dict[str, str]], prompt_version: str, question: str, chunk_ids: List[int]) -> str:
+    """chat_routes: chat_client.routes(); endpoint + model of every route (in order) is part of
+    the key, so switching CHAT_BASE_URL or the fallbacks never serves answers of the old setup."""
+    endpoints = [[r["base_url"], r["model"]] for r in chat_routes]
+    raw = json.dumps([endpoints, prompt_version, normalize_question(question), list(chunk_ids)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def evidence_chunk_ids(evidence: List[Dict[str, Any]]) -> List[int]:
+    return [i for e in evidence for i in (e.get("chunk_ids") or [e["chunk_id"]])]
+
+class MemoryBackend:
+    name = "memory"
+
+    def __init__(self):
+        self._cache = TTLCache(settings.answer_cache_size, settings.answer_cache_ttl)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._cache.get(key)
+
+    def set(self, key: str, chat_model: str, result: Dict[str, Any]) -> None:
+        self._cache.set(key, result)
+
+    def info(self) -> Dict[str, Any]:
+        return self._cache.info()
+
+class PostgresBackend:
+    name = "postgres"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            return db.execute(
+                text("SELECT result FROM answer_cache WHERE key = :key AND expires_at > now()"),
+                {"key": key},
+            ).scalar()
+        finally:
+            db.close()
+
+    def set(self, key: str, chat_model: str, result: Dict[str, Any]) -> None:
+        db = SessionLocal()
+        try:
+            expires = datetime.now(timezone.utc) + timedelta(seconds=settings.answer_cache_ttl)
+            stmt = pg_insert(AnswerCacheEntry).values(key=key, chat_model=chat_model, result=result, expires_at=expires)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=["key"], set_={"result": stmt.excluded.result, "expires_at": stmt.excluded.expires_at},
+            ))
+            db.execute(text("DELETE FROM answer_cache WHERE expires_at < now()"))
+            db.commit()
+        finally:
+            db.close()
+
+    def info(self) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            return {"entries": db.execute(text("SELECT count(*) FROM answer_cache WHERE expires_at > now()")).scalar()}
+        finally:
+            db.close()
+
+class AnswerCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def join(self, key: str) -> Optional[Dict[str, Any]]:
+        """Result of the computation in flight for `key` (the caller is coalesced onto it),
+        or None if there is none or it ended without a result (an abandoned stream)."""
+        pending = self._inflight.get(key)
+        if pending is None:
+            return None
+        self.coalesced += 1
+        return await asyncio.shield(pending)
+
+    async def get_or_compute(self, key: str, chat_model: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        joined = await self.join(key)
+        if joined is not None:
+            return joined
+
+        cached = await self.lookup(key)
+        if cached is not None:
+            return cached
+
+        # Lookup sırasında aynı anahtar için başka bir istek hesaplamaya başlamış olabilir
+        joined = await self.join(key)
+        if joined is not None:
+            return joined
+
+        self.misses += 1
+        # Hesaplama ayrı bir task'ta: isteği başlatan çağıran iptal edilse (istemci
+        # koptu, /ask/batch iptali) bile birleştirilen bekleyenler sonucu alır ve önbellek dolar
+        task = asyncio.get_running_loop().create_task(self._compute(key, chat_model, compute))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())  # "never retrieved" uyarısı çıkmasın
+        self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _compute(self, key: str, chat_model: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        try:
+            result = await compute()
+            await self.store(key, chat_model, result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    async def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            cached = await asyncio.to_thread(self.backend.get, key)
+        except Exception as e:
+            print(f"Answer cache lookup failed: {e}")
+            return None
+        if cached is not None:
+            self.hits += 1
+        return cached
+
+    async def store(self, key: str, chat_model: str, result: Dict[str, Any]) -> None:
+        if result.get("llm_failed") or result.get("llm_fallback"):
+            return
+        try:
+            await asyncio.to_thread(self.backend.set, key, chat_model, result)
+        except Exception as e:
+            print(f"Answer cache store failed: {e}")
+
+    def info(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"backend": self.backend.name, "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+        try:
+            out["store"] = self.backend.info()
+        except Exception:
+            out["store"] = None
+        return out
+
+_cache: Optional[AnswerCache] = None
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    global _cache
+    backend = settings.answer_cache_backend.lower()
+    if backend == "none":
+        return None
+    if _cache is None:
+        _cache = AnswerCache(PostgresBackend() if backend == "postgres" else MemoryBackend())
+    return _cache
+
+async def answer_with_cache(question: str, evidence: List[Dict[str, Any]]) -> Dict[str, Any]:
+    cache = get_answer_cache()
+    if cache is None:
+        return await answer_with_citations(question, evidence)
+    chat_routes = routes()
+    chat_model = chat_routes[0]["model"]
+    key = answer_key(chat_routes, PROMPT_VERSION, question, evidence_chunk_ids(evidence))
+    return await cache.get_or_compute(key, chat_model, lambda: answer_with_citations(question, evidence))
+
+def _replay(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    events = [{"type": "token", "text": result["answer"]}] if result.get("answer") else []
+    return events + [{"type": "final", **result}]
+
+async def stream_with_cache(question: str, evidence: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """stream_answer with the answer cache: a hit, or the result of an identical /ask or
+    stream already in flight, is replayed as a single token event; otherwise the stream
+    is registered as in flight (so identical requests join it) and its result stored
+    like a /ask result."""
+    cache = get_answer_cache()
+    if cache is None:
+        async for event in stream_answer(question, evidence):
+            yield event
+        return
+    chat_routes = routes()
+    chat_model = chat_routes[0]["model"]
+    key = answer_key(chat_routes, PROMPT_VERSION, question, evidence_chunk_ids(evidence))
+    result = await cache.join(key)
+    if result is None:
+        result = await cache.lookup(key)
+    if result is None:
+        result = await cache.join(key)  # lookup sırasında başlamış olabilir
+    if result is not None:
+        for event in _replay(result):
+            yield event
+        return
+    cache.misses += 1
+    fut = asyncio.get_running_loop().create_future()
+    cache._inflight[key] = fut
+    try:
+        async for event in stream_answer(question, evidence):
+            if event["type"] == "final":
+                result = {k: v for k, v in event.items() if k != "type"}
+                await cache.store(key, chat_model, result)
+                fut.set_result(result)
+            yield event
+    finally:
+        cache._inflight.pop(key, None)
+        if not fut.done():
+            # İstemci koptu / akış hata verdi: bekleyenler None alır ve kendileri hesaplar
+            fut.set_result(None)
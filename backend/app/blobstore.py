@@ -0,0 +1,185 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+from fastapi import UploadFile
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from .db import async_engine, engine
+from .models import Document
+from .settings import settings
+
+# PDF byte storage, two backends (BLOB_STORE):
+#   local: content-addressed files, pdfs/<h[:2]>/<h>.pdf (documents.file_path)
+#   pg:    Postgres large objects (documents.blob_oid), for hosts without a disk (Render)
+# Uploads are streamed in UPLOAD_READ_CHUNK pieces and hashed (sha256) on the way,
+# so the whole PDF is never held in memory. Reads are ranged (read_range) for
+# /files; ingest gets a file path (open_source). This module is the only code that
+# touches PDF bytes: the documents row holds just the reference (path / oid).
+# Large objects are written in the request's transaction: a failed or duplicate
+# upload rolls back and leaves nothing behind.
+
+def backend() -> str:
+    return settings.blob_store
+
+def check_legacy() -> None:
+    """Warn at startup if migrate.sql hasn't moved the old bytea column out of documents yet."""
+    with engine.connect() as conn:
+        legacy = conn.execute(text(
+            "SELECT count(*) FROM information_schema.columns WHERE table_name = 'documents' AND column_name = 'file_data'"
+        )).scalar()
+    if legacy:
+        print("documents.file_data still exists: run app/migrate.sql to move stored PDFs into large objects "
+              "(until then those documents have no file)")
+
+def content_path(sha256: str) -> str:
+    return os.path.abspath(os.path.join(settings.files_dir, "pdfs", sha256[:2], sha256 + ".pdf"))
+
+async def _save_local(file: UploadFile) -> Dict:
+    incoming = os.path.join(settings.files_dir, "pdfs", ".incoming")
+    os.makedirs(incoming, exist_ok=True)
+    h = hashlib.sha256()
+    size = 0
+    fd, tmp = tempfile.mkstemp(suffix=".pdf", dir=incoming)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                piece = await file.read(settings.upload_read_chunk)
+                if not piece:
+                    break
+                h.update(piece)
+                f.write(piece)
+                size += len(piece)
+        sha256 = h.hexdigest()
+        path = content_path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(tmp)  # aynı içerik zaten diskte
+        else:
+            os.replace(tmp, path)  # aynı dosya sisteminde atomik
+        return {"file_path": path, "blob_oid": None, "file_size": size, "content_sha256": sha256}
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+async def _save_pg(db: AsyncSession, file: UploadFile) -> Dict:
+    oid = (await db.execute(text("SELECT lo_create(0)"))).scalar()
+    h = hashlib.sha256()
+    size = 0
+    while True:
+        piece = await file.read(settings.upload_read_chunk)
+        if not piece:
+            break
+        await db.execute(text("SELECT lo_put(:oid, :off, :data)"), {"oid": oid, "off": size, "data": piece})
+        h.update(piece)
+        size += len(piece)
+    return {"file_path": None, "blob_oid": oid, "file_size": size, "content_sha256": h.hexdigest()}
+
+async def save_upload(db: AsyncSession, file: UploadFile) -> Dict:
+    """Store an upload; returns the Document storage columns
+    (file_path, blob_oid, file_size, content_sha256). pg: commit with the document."""
+    if backend() == "pg":
+        return await _save_pg(db, file)
+    return await _save_local(file)
+
+def _spill_large_object(db: Session, oid: int) -> str:
+    shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=shm_dir)
+    step = settings.blob_read_chunk
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pos = 0
+            while True:
+                piece = db.execute(text("SELECT lo_get(:oid, :off, :n)"), {"oid": oid, "off": pos, "n": step}).scalar()
+                if not piece:
+                    break
+                f.write(piece)
+                pos += len(piece)
+        db.commit()
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+@asynccontextmanager
+async def open_source(db: Session, doc: Document) -> AsyncIterator[str]:
+    """Path of the PDF for PyMuPDF. Large objects are copied piecewise to a temp file
+    (tmpfs when available) for the duration of the block; the extraction pool then
+    opens it by path like any local file."""
+    if doc.blob_oid is not None:
+        path = await asyncio.to_thread(_spill_large_object, db, doc.blob_oid)
+        try:
+            yield path
+        finally:
+            os.remove(path)
+    elif doc.file_path and os.path.exists(doc.file_path):
+        yield doc.file_path
+    else:
+        raise FileNotFoundError(f"PDF file not found for document {doc.id}")
+
+def exists(doc: Document) -> bool:
+    return doc.blob_oid is not None or bool(doc.file_path and os.path.exists(doc.file_path))
+
+def size(doc: Document) -> int:
+    return doc.file_size if doc.file_size is not None else os.path.getsize(doc.file_path)
+
+async def read_range(doc: Document, start: int, end: int) -> AsyncIterator[bytes]:
+    """Yield bytes [start, end] (inclusive) in BLOB_READ_CHUNK pieces."""
+    step = settings.blob_read_chunk
+    if doc.blob_oid is not None:
+        # Autocommit: each lo_get is its own short transaction, so a slow client
+        # doesn't keep a transaction open while the response drains
+        async with async_engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            pos = start
+            while pos <= end:
+                n = min(step, end + 1 - pos)
+                yield (await conn.execute(
+                    text("SELECT lo_get(:oid, :off, :n)"), {"oid": doc.blob_oid, "off": pos, "n": n}
+                )).scalar()
+                pos += n
+    else:
+        with open(doc.file_path, "rb") as f:
+            f.seek(start)
+            remaining = end + 1 - start
+            while remaining > 0:
+                piece = await asyncio.to_thread(f.read, min(step, remaining))
+                if not piece:
+                    break
+                remaining -= len(piece)
+                yield piece
+
+def _unreferenced(path: Optional[str], oid: Optional[int]):
+    if oid is not None:
+        return select(func.count()).where(Document.blob_oid == oid)
+    return select(func.count()).where(Document.file_path == path)
+
+def _remove_file(path: str) -> None:
+    try:
+        if os.path.exists(path):
+            os.remove(path)
+    except Exception:
+        pass
+
+def remove_if_unreferenced(db: Session, path: Optional[str] = None, oid: Optional[int] = None) -> None:
+    """Delete a stored PDF once no document points at it. Call after committing."""
+    if (path is None and oid is None) or db.execute(_unreferenced(path, oid)).scalar():
+        return
+    if oid is not None:
+        db.execute(text("SELECT lo_unlink(:oid)"), {"oid": oid})
+        db.commit()
+    else:
+        _remove_file(path)
+
+async def remove_if_unreferenced_async(db: AsyncSession, path: Optional[str] = None, oid: Optional[int] = None) -> None:
+    if (path is None and oid is None) or (await db.execute(_unreferenced(path, oid))).scalar():
+        return
+    if oid is not None:
+        await db.execute(text("SELECT lo_unlink(:oid)"), {"oid": oid})
+        await db.commit()
+    else:
+        _remove_file(path)
@@ -0,0 +1,110 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import bindparam, insert, text, update
+from sqlalchemy.orm import Session
+from .models import Page, Chunk
+
+# Bulk writers for the ingest / reindex hot paths.
+# Primary path: psycopg3 COPY ... FROM STDIN (FORMAT BINARY); the pgvector
+# `embedding` column is sent in pgvector's binary wire format.
+# Fallback (COPY unavailable, vector type missing, non-psycopg driver):
+# executemany INSERT/UPDATE through SQLAlchemy Core.
+# Both paths run inside the caller's transaction; the caller commits.
+
+PAGE_COLUMNS = ("document_id", "page_no", "text_raw", "content_hash", "headings")
+PAGE_TYPES = ("int4", "int4", "text", "text", "jsonb")
+CHUNK_COLUMNS = ("document_id", "section_path", "page_start", "page_end", "chunk_text", "embedding")
+CHUNK_TYPES = ("int4", "text", "int4", "int4", "text", "vector")
+
+_vector_info = None
+
+def _raw_connection(db: Session):
+    return db.connection().connection.driver_connection
+
+def _vector_type_info(conn):
+    global _vector_info
+    if _vector_info is None:
+        from psycopg.types import TypeInfo
+        _vector_info = TypeInfo.fetch(conn, "vector")
+        if _vector_info is None:
+            raise RuntimeError("vector type not found in the database")
+    return _vector_info
+
+def _copy_rows(db: Session, table: str, columns: Sequence[str], types: Sequence[str], rows: List[Tuple[Any, ...]]) -> None:
+    conn = _raw_connection(db)
+    with conn.cursor() as cur:
+        if "vector" in types:
+            # Dumper'ları sadece bu cursor'a kaydet; havuzdaki bağlantının adaptörleri değişmesin
+            from pgvector.psycopg import register_vector_info
+            register_vector_info(cur, _vector_type_info(conn))
+        sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN (FORMAT BINARY)"
+        with cur.copy(sql) as copy:
+            copy.set_types(list(types))
+            for row in rows:
+                copy.write_row(row)
+
+def _copy_or_fallback(db: Session, table: str, columns, types, rows, fallback) -> str:
+    if not rows:
+        return "noop"
+    try:
+        with db.begin_nested():
+            _copy_rows(db, table, columns, types, rows)
+        return "copy"
+    except Exception as e:
+        print(f"COPY into {table} failed ({e}), falling back to executemany")
+        fallback()
+        return "executemany"
+
+def write_pages(db: Session, pages: List[Dict[str, Any]]) -> str:
+    """Bulk insert pages: [{document_id, page_no, text_raw, content_hash, headings}, ...]. Returns the path used."""
+    rows = [tuple(p.get(c) for c in PAGE_COLUMNS) for p in pages]
+    return _copy_or_fallback(
+        db, "pages", PAGE_COLUMNS, PAGE_TYPES, rows,
+        lambda: db.execute(insert(Page), [{c: p.get(c) for c in PAGE_COLUMNS} for p in pages]),
+    )
+
+def write_chunks(db: Session, chunks: List[Dict[str, Any]]) -> str:
+    """Bulk insert chunks: [{document_id, section_path, page_start, page_end, chunk_text, embedding}, ...]."""
+    rows = [tuple(c.get(col) for col in CHUNK_COLUMNS) for c in chunks]
+    return _copy_or_fallback(
+        db, "chunks", CHUNK_COLUMNS, CHUNK_TYPES, rows,
+        lambda: db.execute(insert(Chunk), [{col: c.get(col) for col in CHUNK_COLUMNS} for c in chunks]),
+    )
+
+def update_embeddings(db: Session, pairs: List[Tuple[int, Optional[List[float]]]], column: str = "embedding") -> str:
+    """Bulk set chunks.<column> for [(chunk_id, embedding), ...].
+    COPY into a temp table, then one UPDATE ... FROM join.
+    column: embedding, or the reindex shadow column (see reindex.py).
+    """
+    pairs = [(cid, emb) for cid, emb in pairs if emb is not None]
+    if not pairs:
+        return "noop"
+
+    def fallback():
+        if column != "embedding":
+            # Gölge kolon ORM modelinde yok
+            db.execute(
+                text(f"UPDATE chunks SET {column} = CAST(:emb AS vector) WHERE id = :cid"),
+                [{"cid": cid, "emb": emb} for cid, emb in pairs],
+            )
+            return
+        t = Chunk.__table__
+        db.execute(
+            update(t).where(t.c.id == bindparam("cid")).values(embedding=bindparam("emb")),
+            [{"cid": cid, "emb": emb} for cid, emb in pairs],
+        )
+
+    try:
+        with db.begin_nested():
+            db.execute(text("CREATE TEMP TABLE IF NOT EXISTS _embedding_updates (id int4, embedding vector) ON COMMIT DROP"))
+            db.execute(text("TRUNCATE _embedding_updates"))
+            _copy_rows(db, "_embedding_updates", ("id", "embedding"), ("int4", "vector"), pairs)
+            db.execute(text(f"""
+                UPDATE chunks c SET {column} = u.embedding
+                FROM _embedding_updates u
+                WHERE c.id = u.id
+            """))
+        return "copy"
+    except Exception as e:
+        print(f"COPY embedding update failed ({e}), falling back to executemany")
+        fallback()
+        return "executemany"
@@ -0,0 +1,110 @@
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from .settings import settings
+
+# In-process caches for /ask: question -> query embedding, and
+# (question, sources, top_k, index generation) -> evidence list.
+#
+# Invalidation: every change to a document's chunks (ingest batch, reindex batch)
+# stamps documents.index_generation with nextval('index_generation_seq') in the
+# same transaction. Retrieval keys embed the generations of the scoped documents
+# (or count + max generation for "all documents"), so a stale evidence list can
+# never be served, even when the write happened in another worker process.
+
+_MISSING = object()
+
+class TTLCache:
+    """Size-bounded LRU with per-entry TTL. Thread-safe."""
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.maxsize = maxsize
+        self.ttl = ttl_seconds
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING or item[0] < time.monotonic():
+                if item is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def info(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+query_embedding_cache = TTLCache(settings.query_cache_size, settings.query_cache_ttl)
+retrieval_cache = TTLCache(settings.retrieval_cache_size, settings.retrieval_cache_ttl)
+
+def normalize_question(q: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", q or "").casefold().split())
+
+def bump_generation(db: Session, doc_ids: Iterable[int]) -> None:
+    """Mark documents' indexed content as changed. Call inside the writing transaction."""
+    ids = sorted(set(doc_ids))
+    if ids:
+        db.execute(
+            text("UPDATE documents SET index_generation = nextval('index_generation_seq') WHERE id = ANY(:ids)"),
+            {"ids": ids},
+        )
+
+_GENERATIONS_SQL = text("SELECT id, index_generation FROM documents WHERE id = ANY(:ids) ORDER BY id")
+# Tüm belgeler: silme count'u, yükleme/reindex max(generation)'ı değiştirir
+_GENERATION_ALL_SQL = text("SELECT count(*), coalesce(max(index_generation), 0) FROM documents")
+
+def generation_key(db: Session, source_ids: Optional[List[int]]) -> Tuple:
+    if source_ids:
+        rows = db.execute(_GENERATIONS_SQL, {"ids": sorted(set(source_ids))}).all()
+        return tuple((r[0], r[1]) for r in rows)
+    row = db.execute(_GENERATION_ALL_SQL).first()
+    return ("all", row[0], row[1])
+
+async def generation_key_async(db: AsyncSession, source_ids: Optional[List[int]]) -> Tuple:
+    if source_ids:
+        rows = (await db.execute(_GENERATIONS_SQL, {"ids": sorted(set(source_ids))})).all()
+        return tuple((r[0], r[1]) for r in rows)
+    row = (await db.execute(_GENERATION_ALL_SQL)).first()
+    return ("all", row[0], row[1])
+
+def _retrieval_key(question: str, source_ids: Optional[List[int]], limit: int, has_embedding: bool, knobs: Tuple, generations: Tuple) -> Tuple:
+    sources = tuple(sorted(set(source_ids))) if source_ids else None
+    return (normalize_question(question), sources, limit, has_embedding, knobs, generations)
+
+def retrieval_key(db: Session, question: str, source_ids: Optional[List[int]], limit: int, has_embedding: bool, knobs: Tuple = ()) -> Tuple:
+    return _retrieval_key(question, source_ids, limit, has_embedding, knobs, generation_key(db, source_ids))
+
+async def retrieval_key_async(db: AsyncSession, question: str, source_ids: Optional[List[int]], limit: int, has_embedding: bool, knobs: Tuple = ()) -> Tuple:
+    return _retrieval_key(question, source_ids, limit, has_embedding, knobs, await generation_key_async(db, source_ids))
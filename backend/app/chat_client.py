@@ -0,0 +1,181 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional
+from urllib.parse import urlsplit
+import httpx
+from .http_pool import RETRY_STATUS, backoff_delay, get_client, retry_after_seconds
+from .settings import settings, get_chat_settings
+
+# Chat completions client: one pooled httpx client (keep-alive connections) for every
+# provider, at most CHAT_CONCURRENCY requests in flight per provider (base_url host),
+# separate connect / whole answer (CHAT_TIMEOUT) / between stream chunks timeouts,
+# 429/5xx and dropped connections retried with jittered backoff (Retry-After
+# honoured up to CHAT_RETRY_MAX_WAIT).
+# Routes are tried in order: the chat settings (CHAT_* or POST /settings), then the
+# fallbacks (CHAT_FALLBACKS or POST /settings chat_fallbacks). A route that times
+# out, rejects the request or stays rate limited hands over to the next one;
+# ChatError only when every route failed.
+
+class ChatError(Exception):
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors) or "no chat route configured")
+        self.errors = errors
+
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+_stats: Dict[str, Dict[str, int]] = {}
+_totals = {"fallbacks": 0, "failures": 0}
+
+def routes() -> List[Dict[str, str]]:
+    """[{base_url, model, api_key}] in the order they are tried (duplicates dropped)."""
+    chat = get_chat_settings()
+    out = [{"base_url": chat["chat_base_url"], "model": chat["chat_model"], "api_key": chat["chat_api_key"]}]
+    for r in chat["chat_fallbacks"]:
+        route = {"base_url": r["base_url"], "model": r["model"], "api_key": r.get("api_key") or chat["chat_api_key"]}
+        if all((o["base_url"], o["model"]) != (route["base_url"], route["model"]) for o in out):
+            out.append(route)
+    return out
+
+def provider(base_url: str) -> str:
+    return urlsplit(base_url).netloc or base_url
+
+def _semaphore(name: str) -> asyncio.Semaphore:
+    sem = _semaphores.get(name)
+    if sem is None:
+        sem = _semaphores[name] = asyncio.Semaphore(max(1, settings.chat_concurrency))
+    return sem
+
+def _count(name: str, key: str) -> None:
+    stats = _stats.setdefault(name, {"requests": 0, "retries": 0, "errors": 0})
+    stats[key] += 1
+
+def _client() -> httpx.AsyncClient:
+    # Varsayılan read: stream'de iki parça arası bekleme; complete() kendi zaman aşımını verir
+    return get_client(
+        "chat",
+        httpx.Timeout(settings.chat_stream_read_timeout, connect=settings.chat_connect_timeout),
+        max_connections=max(1, settings.chat_concurrency) * 4,
+    )
+
+def _complete_timeout() -> httpx.Timeout:
+    # Tek parça yanıt üretim bitince gelir: read beklemesi cevabın tamamını kapsar
+    return httpx.Timeout(settings.chat_timeout, connect=settings.chat_connect_timeout)
+
+def _request(route: Dict[str, str], payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "url": route["base_url"].rstrip("/") + "/chat/completions",
+        "json": {**payload, "model": route["model"]},
+        "headers": {"Authorization": f"Bearer {route['api_key']}"},
+    }
+
+def _retry_wait(error: Exception, response: Optional[httpx.Response], attempt: int) -> Optional[float]:
+    """Seconds to wait before trying the same route again, or None: go to the next route."""
+    if attempt >= settings.chat_max_retries or isinstance(error, httpx.TimeoutException):
+        # Zaman aşımı: aynı rotada bir kez daha beklemek yerine sıradaki (yavaş ama sağlıklı
+        # bir model için CHAT_TIMEOUT yükseltilmeli; yoksa her cevap yedeğe de ödenir)
+        return None
+    if isinstance(error, httpx.TransportError):
+        return backoff_delay(attempt, cap=settings.chat_retry_max_wait)  # kopan keep-alive bağlantısı vb.
+    if response is None or response.status_code not in RETRY_STATUS:
+        return None
+    retry_after = retry_after_seconds(response)
+    if retry_after is not None and retry_after > settings.chat_retry_max_wait:
+        return None
+    return backoff_delay(attempt, cap=settings.chat_retry_max_wait, retry_after=retry_after)
+
+def _describe(route: Dict[str, str], error: Exception, response: Optional[httpx.Response]) -> str:
+    reason = f"HTTP {response.status_code}" if response is not None and response.status_code >= 400 else type(error).__name__
+    return f"{provider(route['base_url'])}/{route['model']}: {reason}"
+
+def _answered(i: int, route: Dict[str, str]) -> Dict[str, Any]:
+    if i:
+        _totals["fallbacks"] += 1
+    return {"model": route["model"], "fallback": i > 0}
+
+async def complete(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """POST /chat/completions: {"content", "model", "fallback"} of the first route that answers."""
+    errors: List[str] = []
+    for i, route in enumerate(routes()):
+        name = provider(route["base_url"])
+        for attempt in range(settings.chat_max_retries + 1):
+            response = None
+            try:
+                _count(name, "requests")
+                async with _semaphore(name):
+                    response = await _client().post(**_request(route, payload), timeout=_complete_timeout())
+                response.raise_for_status()
+                content = response.json()["choices"][0]["message"]["content"]
+                return {"content": content, **_answered(i, route)}
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                _count(name, "errors")
+                wait = _retry_wait(e, response, attempt)
+                if wait is None:
+                    errors.append(_describe(route, e, response))
+                    break
+                _count(name, "retries")
+                await asyncio.sleep(wait)
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                _count(name, "errors")
+                errors.append(f"{name}/{route['model']}: malformed response ({type(e).__name__})")
+                break
+    _totals["failures"] += 1
+    raise ChatError(errors)
+
+async def stream(payload: Dict[str, Any], meta: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    """Streamed completion, yields content deltas. Retries and fallbacks only until the
+    first delta; an error after that is raised to the caller. `meta` gets the
+    answering route's "model" and "fallback"."""
+    errors: List[str] = []
+    for i, route in enumerate(routes()):
+        name = provider(route["base_url"])
+        for attempt in range(settings.chat_max_retries + 1):
+            response = None
+            started = False
+            try:
+                _count(name, "requests")
+                request = _request(route, {**payload, "stream": True})
+                async with _semaphore(name):
+                    async with _client().stream("POST", request.pop("url"), **request) as response:
+                        response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[5:].strip()
+                            if data == "[DONE]":
+                                break
+                            try:
+                                delta = json.loads(data)["choices"][0].get("delta", {}).get("content") or ""
+                            except (ValueError, KeyError, IndexError, AttributeError):
+                                continue
+                            if not delta:
+                                continue
+                            if not started:
+                                started = True
+                                answered = _answered(i, route)
+                                if meta is not None:
+                                    meta.update(answered)
+                            yield delta
+                if not started:
+                    answered = _answered(i, route)
+                    if meta is not None:
+                        meta.update(answered)
+                return
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                _count(name, "errors")
+                if started:
+                    raise
+                wait = _retry_wait(e, response, attempt)
+                if wait is None:
+                    errors.append(_describe(route, e, response))
+                    break
+                _count(name, "retries")
+                await asyncio.sleep(wait)
+    _totals["failures"] += 1
+    raise ChatError(errors)
+
+def info() -> Dict[str, Any]:
+    return {
+        "routes": [{"base_url": r["base_url"], "model": r["model"]} for r in routes()],
+        "concurrency_per_provider": settings.chat_concurrency,
+        "providers": _stats,
+        **_totals,
+    }
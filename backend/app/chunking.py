@@ -1,49 +1,254 @@
-from typing import List, Dict
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from .settings import settings
 
-def chunk_pages(pages: List[Dict], max_chars: int = 1800) -> List[Dict]:
-    """Very simple paragraph chunker.
-    pages: [{page_no:int, text:str}, ...]
-    Returns chunks with page_start/page_end and chunk_text.
+class IncrementalChunker:
+    """Very simple paragraph chunker, fed one page at a time.
+    feed() returns the chunks that filled up while consuming the page; finish() flushes the rest.
+    Chunks have page_start/page_end and chunk_text.
     """
-    chunks = []
-    buf = []
-    buf_len = 0
-    page_start = None
-    last_page = None
-
-    def flush():
-        nonlocal buf, buf_len, page_start, last_page
-        if not buf:
+
+    def __init__(self, max_chars: int = 1800):
+        self.max_chars = max_chars
+        self.buf: List[str] = []
+        self.buf_len = 0
+        self.page_start: Optional[int] = None
+        self.last_page: Optional[int] = None
+
+    def _flush(self, out: List[Dict]) -> None:
+        if not self.buf:
             return
-        chunk_text = "\n\n".join(buf).strip()
+        chunk_text = "\n\n".join(self.buf).strip()
         if chunk_text:
-            chunks.append({
-                "page_start": page_start,
-                "page_end": last_page,
+            out.append({
+                "page_start": self.page_start,
+                "page_end": self.last_page,
                 "section_path": None,
                 "chunk_text": chunk_text
             })
-        buf = []
-        buf_len = 0
-        page_start = None
-        last_page = None
+        self.buf = []
+        self.buf_len = 0
+        self.page_start = None
+        self.last_page = None
 
-    for p in pages:
-        page_no = p["page_no"]
-        text = (p.get("text") or "").strip()
+    def feed(self, page_no: int, text: Optional[str], headings: Optional[List[list]] = None) -> List[Dict]:
+        out: List[Dict] = []
+        text = (text or "").strip()
         if not text:
-            continue
+            return out
         paras = [x.strip() for x in text.split("\n\n") if x.strip()]
         for para in paras:
-            if page_start is None:
-                page_start = page_no
-            last_page = page_no
-            if buf_len + len(para) > max_chars:
-                flush()
-                page_start = page_no
-                last_page = page_no
-            buf.append(para)
-            buf_len += len(para)
-
-    flush()
-    return chunks
+            if self.page_start is None:
+                self.page_start = page_no
+            self.last_page = page_no
+            if self.buf_len + len(para) > self.max_chars:
+                self._flush(out)
+                self.page_start = page_no
+                self.last_page = page_no
+            self.buf.append(para)
+            self.buf_len += len(para)
+        return out
+
+    def finish(self) -> List[Dict]:
+        out: List[Dict] = []
+        self._flush(out)
+        return out
+
+# Cümle sonu: . ! ? … (ve ; :) ardından boşluk
+_SENTENCE_END = re.compile(r"(?<=[.!?…;:])\s+")
+
+def split_sentences(text: str) -> List[str]:
+    return [x for x in _SENTENCE_END.split(text) if x]
+
+def _fit(sentence: str, max_chars: int) -> List[str]:
+    """A sentence longer than max_chars, cut at word boundaries (mid-word only for a single giant word)."""
+    parts, cur = [], ""
+    for word in sentence.split():
+        while len(word) > max_chars:
+            if cur:
+                parts.append(cur)
+                cur = ""
+            parts.append(word[:max_chars])
+            word = word[max_chars:]
+        if cur and len(cur) + 1 + len(word) > max_chars:
+            parts.append(cur)
+            cur = word
+        else:
+            cur = f"{cur} {word}" if cur else word
+    if cur:
+        parts.append(cur)
+    return parts
+
+def split_paragraph(para: str, max_chars: int) -> List[str]:
+    """Pieces of at most max_chars, cut on sentence boundaries."""
+    pieces, cur = [], ""
+    for sentence in split_sentences(para):
+        for part in (_fit(sentence, max_chars) if len(sentence) > max_chars else [sentence]):
+            if cur and len(cur) + 1 + len(part) > max_chars:
+                pieces.append(cur)
+                cur = part
+            else:
+                cur = f"{cur} {part}" if cur else part
+    if cur:
+        pieces.append(cur)
+    return pieces
+
+def _letters(s: str) -> str:
+    return "".join(ch for ch in s.casefold() if ch.isalnum())
+
+def split_heading(block: str, title: str) -> Tuple[str, str]:
+    """(title lines, rest) of a heading's block: the leading lines that spell the
+    title (at least the first line); the rest is body text on the same block."""
+    lines = block.split("\n")
+    key, seen, n = _letters(title), _letters(lines[0]), 1
+    while n < len(lines) and len(seen) < len(key):
+        nxt = seen + _letters(lines[n])
+        if not key.startswith(nxt[:len(key)]):
+            break
+        seen = nxt
+        n += 1
+    return "\n".join(lines[:n]), "\n".join(lines[n:]).strip()
+
+class StructureChunker:
+    """Section-aware chunker (CHUNKER=structure), fed one page at a time like
+    IncrementalChunker, with the headings pdf_extract.page_structure found on the page.
+    - A heading closes the current chunk and updates the section stack; chunks get
+      section_path "Chapter > Section > ..." and start with their heading.
+    - Paragraphs are packed up to max_chars; a longer paragraph is split on sentence
+      boundaries, so no chunk exceeds max_chars.
+    - A chunk closed for size hands its last overlap_chars worth of sentences to the
+      next chunk of the same section.
+    - Of a heading's paragraph only the title lines are the heading; text after them
+      on the same block (run-in headings, a body block the TOC entry fell back to)
+      is packed like any paragraph.
+    Nothing is dropped except carried overlap: headings that can't share a chunk with
+    the text after them are emitted on their own.
+    Every paragraph is split and copied a bounded number of times: linear in the text.
+    """
+
+    def __init__(self, max_chars: int = 1800, overlap_chars: int = 200):
+        self.max_chars = max_chars
+        self.overlap_chars = min(overlap_chars, max_chars // 2)
+        self.stack: List[Tuple[float, str]] = []  # (rank, title)
+        self.section: Optional[str] = None
+        self.buf: List[str] = []
+        self.buf_len = 0
+        self.has_body = False  # buf holds text beyond headings / carried overlap
+        self.carried = False  # buf starts with the previous chunk's overlap
+        self.page_start: Optional[int] = None
+        self.last_page: Optional[int] = None
+
+    def _path(self) -> Optional[str]:
+        return " > ".join(t for _, t in self.stack)[:1024] or None
+
+    def _overlap(self) -> str:
+        tail, n = [], 0
+        for sentence in reversed(split_sentences(self.buf[-1])):
+            if n + len(sentence) + 1 > self.overlap_chars:
+                break
+            tail.append(sentence)
+            n += len(sentence) + 1
+        return " ".join(reversed(tail))
+
+    def _reset(self) -> None:
+        self.buf, self.buf_len, self.has_body, self.carried = [], 0, False, False
+        self.page_start = None
+
+    def _flush(self, out: List[Dict], carry: bool = False) -> None:
+        if not self.buf or (self.carried and not self.has_body):
+            self._reset()  # yalnızca önceki chunk'tan taşınan overlap: yeni metin yok
+            return
+        out.append({
+            "page_start": self.page_start,
+            "page_end": self.last_page,
+            "section_path": self.section,
+            "chunk_text": "\n\n".join(self.buf),
+        })
+        tail = self._overlap() if carry and self.has_body and self.overlap_chars else ""
+        self._reset()
+        if tail:
+            self.buf, self.buf_len, self.carried, self.page_start = [tail], len(tail), True, self.last_page
+
+    def _add(self, page_no: int, unit: str, out: List[Dict], body: bool = True) -> None:
+        if self.buf and self.buf_len + 2 + len(unit) > self.max_chars:
+            self._flush(out, carry=True)
+            if self.buf and self.buf_len + 2 + len(unit) > self.max_chars:
+                self._reset()  # overlap doesn't fit next to this unit: drop it
+        if self.page_start is None:
+            self.page_start = page_no
+        if not self.buf:
+            self.section = self._path()
+        self.buf.append(unit)
+        self.buf_len += len(unit) + 2
+        self.has_body = self.has_body or body
+        self.last_page = page_no
+
+    def _heading(self, rank: float, title: str, out: List[Dict]) -> None:
+        if self.has_body:
+            self._flush(out)
+        elif self.carried:
+            self._reset()  # overlap belongs to the previous section
+        while self.stack and self.stack[-1][0] >= rank:
+            self.stack.pop()
+        self.stack.append((rank, title))
+        self.section = self._path()
+
+    def _body(self, page_no: int, para: str, out: List[Dict]) -> None:
+        waiting = self.buf_len + 2 if self.buf and not self.has_body else 0  # başlık / overlap
+        if len(para) > self.max_chars or (waiting and not self.carried and waiting + len(para) > self.max_chars):
+            # İlk parça başlıkların yanına sığsın
+            for unit in split_paragraph(para, max(self.max_chars - waiting, self.max_chars // 2)):
+                self._add(page_no, unit, out)
+        else:
+            self._add(page_no, para, out)
+
+    def feed(self, page_no: int, text: Optional[str], headings: Optional[List[list]] = None) -> List[Dict]:
+        out: List[Dict] = []
+        paras = [p.strip() for p in (text or "").split("\n\n")]
+        heads = sorted(headings or [], key=lambda h: h[2])
+        titles = {h[2]: h[1] for h in heads}
+        h = 0
+        for i, para in enumerate(paras):
+            while h < len(heads) and heads[h][2] <= i:
+                self._heading(heads[h][0], heads[h][1], out)
+                h += 1
+            if not para:
+                continue
+            if i in titles:
+                title, rest = split_heading(para, titles[i])
+                if len(title) <= self.max_chars:
+                    self._add(page_no, title, out, body=False)
+                else:
+                    rest = f"{title}\n{rest}" if rest else title
+                if rest:
+                    self._body(page_no, rest, out)
+            else:
+                self._body(page_no, para, out)
+        for rank, title, _ in heads[h:]:
+            self._heading(rank, title, out)
+        return out
+
+    def finish(self) -> List[Dict]:
+        out: List[Dict] = []
+        self._flush(out)
+        return out
+
+def new_chunker():
+    """The chunker selected by CHUNKER (paragraph | structure)."""
+    if settings.chunker == "structure":
+        return StructureChunker(max_chars=settings.chunk_max_chars, overlap_chars=settings.chunk_overlap_chars)
+    return IncrementalChunker(max_chars=settings.chunk_max_chars)
+
+def iter_chunks(pages: Iterable[Dict], max_chars: int = 1800) -> Iterator[Dict]:
+    """Streaming form of chunk_pages: yields chunks as soon as they fill."""
+    chunker = IncrementalChunker(max_chars=max_chars)
+    for p in pages:
+        yield from chunker.feed(p["page_no"], p.get("text"))
+    yield from chunker.finish()
+
+def chunk_pages(pages: List[Dict], max_chars: int = 1800) -> List[Dict]:
+    """Very simple paragraph chunker.
+    pages: [{page_no:int, text:str}, ...]
+    Returns chunks with page_start/page_end and chunk_text.
+    """
+    return list(iter_chunks(pages, max_chars=max_chars))
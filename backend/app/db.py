@@ -1,10 +1,38 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from .settings import settings
 
-engine = create_engine(settings.database_url, pool_pre_ping=True)
+# Session defaults for ANN search (pgvector GUCs); requests may override them with SET LOCAL
+_search_options = f"-c hnsw.ef_search={settings.hnsw_ef_search} -c ivfflat.probes={settings.ivfflat_probes}"
+
+engine = create_engine(
+    settings.database_url,
+    pool_pre_ping=True,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    connect_args={"options": _search_options},
+)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+# Request path (/ask, /upload): async engine so a slow query doesn't block the event loop.
+# postgresql+psycopg resolves to psycopg's async driver under create_async_engine.
+# The statement timeout is set only here; ingestion, COPY and index builds use the sync engine.
+_connect_args = {"options": _search_options}
+if settings.db_statement_timeout_ms > 0:
+    _connect_args["options"] += f" -c statement_timeout={settings.db_statement_timeout_ms}"
+
+async_engine = create_async_engine(
+    settings.database_url,
+    pool_pre_ping=True,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    connect_args=_connect_args,
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 class Base(DeclarativeBase):
     pass
 
@@ -14,3 +42,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,19 @@
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import Document
+
+# Duplicate uploads.
+# Uploads are hashed (sha256) while they are stored (blobstore.py). A new upload
+# whose hash matches a document that isn't failed is answered with that document
+# instead of being ingested again. Several documents may still share a stored file
+# (e.g. a retry after a failed ingest), so blobstore removes files only when no
+# document references them.
+
+async def find_duplicate(db: AsyncSession, sha256: str) -> Optional[Document]:
+    return (await db.execute(
+        select(Document)
+        .where(Document.content_sha256 == sha256, Document.ingest_status != "failed")
+        .order_by(Document.id)
+        .limit(1)
+    )).scalars().first()
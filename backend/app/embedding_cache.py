@@ -0,0 +1,217 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from .db import SessionLocal
+from .models import EmbeddingCacheEntry
+from .settings import settings
+
+# Content-addressed embedding cache: (model, dim, normalized text) -> vector.
+# Backends: "postgres" (embedding_cache table, shared by all workers),
+# "sqlite" (local file, for dev) or "none". Eviction is age-based
+# (EMBED_CACHE_MAX_AGE_DAYS) plus LRU by last_used_at (EMBED_CACHE_MAX_ENTRIES).
+
+def normalize_text(t: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", t or "").split())
+
+def cache_key(model: str, dim: int, t: str) -> str:
+    return hashlib.sha256(f"{model}\x1f{dim}\x1f{normalize_text(t)}".encode("utf-8")).hexdigest()
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self.errors = 0
+
+    def as_dict(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "tokens_saved": self.tokens_saved,
+            "errors": self.errors,
+        }
+
+class PostgresBackend:
+    name = "postgres"
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        db = SessionLocal()
+        try:
+            rows = db.query(EmbeddingCacheEntry.key, EmbeddingCacheEntry.embedding).filter(
+                EmbeddingCacheEntry.key.in_(keys)
+            ).all()
+            found = {k: [float(x) for x in v] for k, v in rows}
+            if found:
+                # LRU için last_used_at'i tazele; her hit'te yazmamak için saatte bir
+                db.execute(text("""
+                    UPDATE embedding_cache SET last_used_at = now()
+                    WHERE key = ANY(:keys) AND last_used_at < now() - interval '1 hour'
+                """), {"keys": list(found)})
+                db.commit()
+            return found
+        finally:
+            db.close()
+
+    def put_many(self, model: str, dim: int, entries: List[Tuple[str, List[float]]]) -> None:
+        db = SessionLocal()
+        try:
+            db.execute(
+                pg_insert(EmbeddingCacheEntry).on_conflict_do_nothing(index_elements=["key"]),
+                [{"key": k, "model": model, "dim": dim, "embedding": v} for k, v in entries],
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def evict(self, max_entries: int, max_age_days: float) -> int:
+        db = SessionLocal()
+        try:
+            removed = 0
+            if max_age_days > 0:
+                removed += db.execute(text("""
+                    DELETE FROM embedding_cache
+                    WHERE last_used_at < now() - make_interval(secs => :secs)
+                """), {"secs": max_age_days * 86400}).rowcount or 0
+            if max_entries > 0:
+                removed += db.execute(text("""
+                    DELETE FROM embedding_cache WHERE key IN (
+                        SELECT key FROM embedding_cache
+                        ORDER BY last_used_at DESC
+                        OFFSET :max_entries
+                    )
+                """), {"max_entries": max_entries}).rowcount or 0
+            db.commit()
+            return removed
+        finally:
+            db.close()
+
+    def size(self) -> int:
+        db = SessionLocal()
+        try:
+            return db.execute(text("SELECT count(*) FROM embedding_cache")).scalar() or 0
+        finally:
+            db.close()
+
+class SqliteBackend:
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL,
+                    embedding BLOB NOT NULL, created_at REAL NOT NULL, last_used_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_embedding_cache_last_used ON embedding_cache(last_used_at)")
+            self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                q = f"SELECT key, embedding FROM embedding_cache WHERE key IN ({','.join('?' * len(part))})"
+                for k, blob in self._conn.execute(q, part):
+                    found[k] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embedding_cache SET last_used_at = ? WHERE key = ?", [(now, k) for k in found])
+                self._conn.commit()
+        return found
+
+    def put_many(self, model: str, dim: int, entries: List[Tuple[str, List[float]]]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embedding_cache VALUES (?, ?, ?, ?, ?, ?)",
+                [(k, model, dim, array("f", v).tobytes(), now, now) for k, v in entries],
+            )
+            self._conn.commit()
+
+    def evict(self, max_entries: int, max_age_days: float) -> int:
+        removed = 0
+        with self._lock:
+            if max_age_days > 0:
+                removed += self._conn.execute(
+                    "DELETE FROM embedding_cache WHERE last_used_at < ?", (time.time() - max_age_days * 86400,)
+                ).rowcount
+            if max_entries > 0:
+                removed += self._conn.execute("""
+                    DELETE FROM embedding_cache WHERE key IN (
+                        SELECT key FROM embedding_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                    )
+                """, (max_entries,)).rowcount
+            self._conn.commit()
+        return removed
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM embedding_cache").fetchone()[0]
+
+class EmbeddingCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.stats = CacheStats()
+        self._puts = 0
+
+    def lookup(self, model: str, dim: int, texts: List[str]) -> Tuple[List[str], Dict[str, List[float]]]:
+        """Returns (keys aligned with texts, {key: embedding} for the hits)."""
+        keys = [cache_key(model, dim, t) for t in texts]
+        try:
+            found = self.backend.get_many(list(set(keys)))
+        except Exception as e:
+            print(f"Embedding cache lookup failed: {e}")
+            self.stats.errors += 1
+            found = {}
+        return keys, found
+
+    def store(self, model: str, dim: int, entries: List[Tuple[str, List[float]]]) -> None:
+        if not entries:
+            return
+        try:
+            self.backend.put_many(model, dim, entries)
+            self._puts += 1
+            if self._puts % max(1, settings.embed_cache_evict_every) == 0:
+                self.evict()
+        except Exception as e:
+            print(f"Embedding cache store failed: {e}")
+            self.stats.errors += 1
+
+    def evict(self) -> int:
+        return self.backend.evict(settings.embed_cache_max_entries, settings.embed_cache_max_age_days)
+
+    def info(self) -> Dict[str, object]:
+        out: Dict[str, object] = {"backend": self.backend.name, **self.stats.as_dict()}
+        try:
+            out["entries"] = self.backend.size()
+        except Exception:
+            out["entries"] = None
+        return out
+
+_cache: Optional[EmbeddingCache] = None
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    global _cache
+    backend = settings.embed_cache_backend.lower()
+    if backend == "none":
+        return None
+    if _cache is None:
+        if backend == "sqlite":
+            path = settings.embed_cache_path or os.path.join(settings.files_dir, "embedding_cache.sqlite3")
+            _cache = EmbeddingCache(SqliteBackend(path))
+        else:
+            _cache = EmbeddingCache(PostgresBackend())
+    return _cache
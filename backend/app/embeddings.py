@@ -1,29 +1,149 @@
+import asyncio
 from typing import List, Optional
 import httpx
 from .settings import settings
+from .embedding_cache import get_embedding_cache
+from .http_pool import RETRY_STATUS, RateLimiter, backoff_delay, get_client, retry_after_seconds
 
-async def embed_texts(texts: List[str]) -> Optional[List[List[float]]]:
-    """Optional embeddings. Returns None if provider=none or no API key."""
+# Embedding client: one pooled httpx client for the app's lifetime, requests split
+# by item count and an approximate token budget, up to EMBED_CONCURRENCY batches
+# in flight under a requests/sec + tokens/min limiter, retries with backoff on
+# 429/5xx. A failed batch only blanks its own items (None) instead of the whole call.
+
+_limiter: Optional[RateLimiter] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+def approx_tokens(text: str) -> int:
+    # Kaba tahmin (~4 karakter/token); tokenizer bağımlılığı eklemeden bütçe için yeterli
+    return max(1, len(text) // 4)
+
+def _get_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter(settings.embed_requests_per_sec, settings.embed_tokens_per_min)
+    return _limiter
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(max(1, settings.embed_concurrency))
+    return _semaphore
+
+def make_batches(texts: List[str], max_items: int, max_tokens: int) -> List[List[int]]:
+    """Group text indices into request batches bounded by item count and token budget."""
+    batches: List[List[int]] = []
+    cur: List[int] = []
+    cur_tokens = 0
+    for i, t in enumerate(texts):
+        n = approx_tokens(t)
+        if cur and (len(cur) >= max_items or cur_tokens + n > max_tokens):
+            batches.append(cur)
+            cur, cur_tokens = [], 0
+        cur.append(i)
+        cur_tokens += n
+    if cur:
+        batches.append(cur)
+    return batches
+
+async def _post_batch(inputs: List[str], model: str) -> Optional[List[List[float]]]:
+    # OpenAI-compatible embeddings endpoint: POST /embeddings
+    url = settings.openai_base_url.rstrip("/") + "/embeddings"
+    headers = {"Authorization": f"Bearer {settings.openai_api_key}"}
+    payload = {"model": model, "input": inputs}
+    client = get_client(
+        "embeddings",
+        httpx.Timeout(settings.embed_read_timeout, connect=settings.embed_connect_timeout),
+        max_connections=max(1, settings.embed_concurrency) * 2,
+    )
+    tokens = sum(approx_tokens(t) for t in inputs)
+
+    for attempt in range(settings.embed_max_retries + 1):
+        response = None
+        try:
+            await _get_limiter().acquire(tokens)
+            async with _get_semaphore():
+                response = await client.post(url, json=payload, headers=headers)
+            if response.status_code in RETRY_STATUS:
+                raise httpx.HTTPStatusError("retryable status", request=response.request, response=response)
+            response.raise_for_status()
+            data = response.json()
+            # Expect: {"data":[{"embedding":[...],"index":i},...]}
+            items = sorted(data["data"], key=lambda d: d.get("index", 0))
+            if len(items) != len(inputs):
+                raise ValueError(f"expected {len(inputs)} embeddings, got {len(items)}")
+            return [d["embedding"] for d in items]
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            retryable = response is None or response.status_code in RETRY_STATUS
+            if not retryable or attempt >= settings.embed_max_retries:
+                print(f"Embedding batch failed ({len(inputs)} items): {e}")
+                return None
+            await asyncio.sleep(backoff_delay(attempt, retry_after=retry_after_seconds(response)))
+        except Exception as e:
+            print(f"Embedding batch failed ({len(inputs)} items): {e}")
+            return None
+    return None
+
+async def embed_texts(
+    texts: List[str], model: Optional[str] = None, dim: Optional[int] = None,
+) -> Optional[List[Optional[List[float]]]]:
+    """Optional embeddings. Returns None if provider=none or no API key.
+    Otherwise returns one entry per input text; entries of batches that failed are None.
+    model/dim default to OPENAI_MODEL / EMBEDDING_DIM (reindex.py passes a new model).
+    """
     if settings.embeddings_provider.lower() == "none":
         return None
-    
+
     # Check if API key is set
     if not settings.openai_api_key or settings.openai_api_key.strip() == "":
         print("Warning: EMBEDDING_API_KEY not set, using FTS only")
         return None
 
-    # OpenAI-compatible embeddings endpoint: POST /embeddings
-    url = settings.openai_base_url.rstrip("/") + "/embeddings"
-    headers = {"Authorization": f"Bearer {settings.openai_api_key}"}
-    payload = {"model": settings.openai_model, "input": texts}
-
-    try:
-        async with httpx.AsyncClient(timeout=120) as client:
-            r = await client.post(url, json=payload, headers=headers)
-            r.raise_for_status()
-            data = r.json()
-            # Expect: {"data":[{"embedding":[...],...},...]}
-            return [d["embedding"] for d in data["data"]]
-    except Exception as e:
-        print(f"Embedding error: {e}, falling back to FTS only")
-        return None
+    if not texts:
+        return []
+
+    # Sağlayıcı limitini aşan tek metni kırp (aksi halde tüm batch reddedilir)
+    max_chars = settings.embed_max_tokens_per_item * 4
+    inputs = [t[:max_chars] for t in texts]
+
+    model = model or settings.openai_model
+    dim = dim or settings.embedding_dim
+    cache = get_embedding_cache()
+    if cache is None:
+        return await _embed_uncached(inputs, model)
+
+    keys, found = await asyncio.to_thread(cache.lookup, model, dim, inputs)
+    # Aynı metin bir çağrıda birden fazla geçebilir; sağlayıcıya bir kez gönder
+    miss_keys: List[str] = []
+    miss_texts: List[str] = []
+    seen = set(found)
+    for k, t in zip(keys, inputs):
+        if k not in seen:
+            seen.add(k)
+            miss_keys.append(k)
+            miss_texts.append(t)
+    cache.stats.hits += len(inputs) - len(miss_texts)
+    cache.stats.misses += len(miss_texts)
+    cache.stats.tokens_saved += sum(approx_tokens(t) for k, t in zip(keys, inputs) if k in found)
+
+    if miss_texts:
+        fresh = await _embed_uncached(miss_texts, model)
+        new_entries = [(k, v) for k, v in zip(miss_keys, fresh) if v is not None]
+        found.update(new_entries)
+        await asyncio.to_thread(cache.store, model, dim, new_entries)
+    return [found.get(k) for k in keys]
+
+async def _embed_uncached(inputs: List[str], model: str) -> List[Optional[List[float]]]:
+    batches = make_batches(inputs, settings.embed_batch_max_items, settings.embed_batch_max_tokens)
+    results = await asyncio.gather(*[_post_batch([inputs[i] for i in b], model) for b in batches])
+
+    out: List[Optional[List[float]]] = [None] * len(inputs)
+    failed = 0
+    for idxs, vecs in zip(batches, results):
+        if vecs is None:
+            failed += len(idxs)
+            continue
+        for i, v in zip(idxs, vecs):
+            out[i] = v
+    if failed:
+        print(f"Embedding: {failed}/{len(inputs)} texts without embedding (FTS only for those)")
+    return out
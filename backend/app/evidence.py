@@ -0,0 +1,154 @@
+import re
+from typing import Any, Dict, List, Optional, Set
+from .chunking import split_sentences
+from .embeddings import approx_tokens
+from .llm import evidence_block, prompt_overhead_tokens
+from .settings import settings, get_chat_settings
+
+# Evidence packing for the LLM prompt (/ask, /ask/stream).
+# Retrieval returns up to 12 ranked chunks; the prompt gets what fits the chat
+# model's context, in rank order:
+#   1. neighbouring chunks of one document and section (consecutive ids, or the
+#      same pages) become one block; text repeated by chunk overlap is removed
+#   2. near-duplicate blocks (word-shingle containment >= EVIDENCE_DEDUP_THRESHOLD)
+#      are dropped, the higher ranked one stays
+#   3. blocks are taken while the budget lasts; a block over its share
+#      (EVIDENCE_BLOCK_MAX_TOKENS, or what is left) keeps only the sentences that
+#      share words with the question, in document order, gaps marked "…"
+# Budget: the chat model's context (CHAT_CONTEXT_TOKENS, per model
+# CHAT_CONTEXT_TOKENS_BY_MODEL) minus CHAT_MAX_TOKENS minus the rest of the prompt,
+# capped at EVIDENCE_MAX_TOKENS. Counts are approx_tokens estimates.
+
+_WORD = re.compile(r"\w+")
+_SHINGLE = 4
+_PREFIX = 5  # Türkçe ekler: "kanunnamesinde" ~ "kanun"
+_MIN_BLOCK_TOKENS = 40  # bundan az yer kaldıysa yeni blok eklenmez
+_GAP = "…"
+
+def context_tokens(chat_model: str) -> int:
+    """Context window of chat_model: CHAT_CONTEXT_TOKENS_BY_MODEL ("model=tokens,..."), else CHAT_CONTEXT_TOKENS."""
+    for item in settings.chat_context_tokens_by_model.split(","):
+        name, _, n = item.partition("=")
+        if name.strip() == chat_model and n.strip():
+            return int(n)
+    return settings.chat_context_tokens
+
+def evidence_budget(question: str, chat_model: Optional[str] = None) -> int:
+    model = chat_model or get_chat_settings()["chat_model"]
+    room = context_tokens(model) - settings.chat_max_tokens - prompt_overhead_tokens(question)
+    if settings.evidence_max_tokens > 0:
+        room = min(room, settings.evidence_max_tokens)
+    return max(0, room)
+
+def _words(text: str) -> List[str]:
+    return _WORD.findall(text.casefold())
+
+def _terms(text: str) -> Set[str]:
+    return {w[:_PREFIX] for w in _words(text) if len(w) >= 3}
+
+def _shingles(text: str) -> Set[int]:
+    words = _words(text)
+    if len(words) <= _SHINGLE:
+        return {hash(tuple(words))}
+    return {hash(tuple(words[i:i + _SHINGLE])) for i in range(len(words) - _SHINGLE + 1)}
+
+def _join(a: str, b: str) -> str:
+    """a + b without the text b repeats from the end of a (chunk overlap)."""
+    for k in range(min(len(a), len(b), 4 * settings.chunk_overlap_chars), 19, -1):
+        if a.endswith(b[:k]):
+            return a + b[k:]
+    return f"{a}\n\n{b}"
+
+def merge_adjacent(evidence: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Blocks of neighbouring chunks, ordered by their best rank. Each block:
+    {rank, chunk_ids, document_id, document_title, section_path, page_start, page_end, text}."""
+    blocks: List[Dict[str, Any]] = []
+    members = sorted(enumerate(evidence), key=lambda x: (x[1]["document_id"], x[1]["chunk_id"]))
+    for rank, e in members:
+        text = (e.get("chunk_text") or e["excerpt"]).strip()
+        cur = blocks[-1] if blocks else None
+        if (cur and cur["document_id"] == e["document_id"] and cur["section_path"] == e["section_path"]
+                and (e["chunk_id"] == cur["chunk_ids"][-1] + 1 or e["page_start"] <= cur["page_end"])):
+            consecutive = e["chunk_id"] == cur["chunk_ids"][-1] + 1
+            cur["text"] = _join(cur["text"], text) if consecutive else f"{cur['text']}\n{_GAP}\n{text}"
+            cur["chunk_ids"].append(e["chunk_id"])
+            cur["rank"] = min(cur["rank"], rank)
+            cur["page_start"] = min(cur["page_start"], e["page_start"])
+            cur["page_end"] = max(cur["page_end"], e["page_end"])
+            continue
+        blocks.append({
+            "rank": rank, "chunk_ids": [e["chunk_id"]], "document_id": e["document_id"],
+            "document_title": e["document_title"], "section_path": e["section_path"],
+            "page_start": e["page_start"], "page_end": e["page_end"], "text": text,
+        })
+    return sorted(blocks, key=lambda b: b["rank"])
+
+def drop_near_duplicates(blocks: List[Dict[str, Any]], threshold: float) -> List[Dict[str, Any]]:
+    kept, seen = [], []
+    for b in blocks:
+        sh = _shingles(b["text"])
+        if any(len(sh & s) / min(len(sh), len(s)) >= threshold for s in seen):
+            continue
+        kept.append(b)
+        seen.append(sh)
+    return kept
+
+def trim_to_question(text: str, question_terms: Set[str], max_tokens: int) -> str:
+    """The sentences of text that best match the question, within max_tokens, in their original order."""
+    if approx_tokens(text) <= max_tokens:
+        return text
+    sentences = split_sentences(" ".join(text.split()))
+    scores = [len(question_terms & _terms(s)) for s in sentences]
+    # en çok soru terimi geçen cümleler önce; hiç eşleşme yoksa baştan
+    order = sorted(range(len(sentences)), key=lambda i: (-scores[i], i))
+    chosen, used = set(), 0
+    for i in order:
+        n = approx_tokens(sentences[i]) + 1
+        if used + n > max_tokens:
+            continue
+        chosen.add(i)
+        used += n
+    if not chosen:
+        # tek cümle bile sığmıyor: en iyi cümleyi kelime sınırında kes
+        words, out = sentences[order[0]].split(), []
+        for w in words:
+            if approx_tokens(" ".join(out + [w])) > max_tokens - 1:
+                break
+            out.append(w)
+        return " ".join(out) + " …"
+    parts, prev = [], -1
+    for i in sorted(chosen):
+        if i != prev + 1:
+            parts.append(_GAP)
+        parts.append(sentences[i])
+        prev = i
+    if prev != len(sentences) - 1:
+        parts.append(_GAP)
+    return " ".join(parts)
+
+def pack_evidence(question: str, evidence: List[Dict[str, Any]], budget: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Ranked search results -> prompt evidence within the token budget (evidence_budget by default).
+    Items keep the search result shape; merged items list all their chunk ids in chunk_ids."""
+    if not evidence:
+        return []
+    budget = evidence_budget(question) if budget is None else budget
+    blocks = drop_near_duplicates(merge_adjacent(evidence), settings.evidence_dedup_threshold)
+    terms = _terms(question)
+    packed: List[Dict[str, Any]] = []
+    remaining = budget
+    for b in blocks:
+        item = {
+            "chunk_id": b["chunk_ids"][0], "chunk_ids": b["chunk_ids"], "document_id": b["document_id"],
+            "document_title": b["document_title"], "section_path": b["section_path"],
+            "page_start": b["page_start"], "page_end": b["page_end"], "excerpt": "",
+        }
+        header = approx_tokens(evidence_block(len(packed) + 1, item)) + 1  # + "\n\n" ayırıcı
+        room = remaining - header
+        if settings.evidence_block_max_tokens > 0:
+            room = min(room, settings.evidence_block_max_tokens)
+        if room < _MIN_BLOCK_TOKENS and packed:
+            break
+        item["excerpt"] = trim_to_question(b["text"], terms, max(room, 1))
+        packed.append(item)
+        remaining -= header + approx_tokens(item["excerpt"])
+    return packed
@@ -0,0 +1,85 @@
+import asyncio
+import random
+import time
+from typing import Dict, Optional
+import httpx
+
+# Shared, connection-pooled httpx clients for outbound provider calls.
+# One AsyncClient per name lives for the app's lifetime (closed on shutdown),
+# so TCP/TLS connections are reused instead of re-established on every call.
+
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+def get_client(name: str, timeout: httpx.Timeout, max_connections: int = 20) -> httpx.AsyncClient:
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        _clients[name] = client
+    return client
+
+async def close_clients() -> None:
+    clients = list(_clients.values())
+    _clients.clear()
+    await asyncio.gather(*(c.aclose() for c in clients), return_exceptions=True)
+
+def retry_after_seconds(response: Optional[httpx.Response]) -> Optional[float]:
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 20.0, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff; honours Retry-After when the provider sends one."""
+    if retry_after is not None:
+        return min(cap, retry_after) + random.uniform(0, base)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class RateLimiter:
+    """Async token buckets for requests/sec and tokens/min. A limit <= 0 disables that bucket."""
+
+    def __init__(self, requests_per_sec: float, tokens_per_min: float):
+        self.rps = requests_per_sec
+        self.tpm = tokens_per_min
+        self._req_tokens = max(1.0, requests_per_sec)
+        self._tok_tokens = float(tokens_per_min)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last
+        self._last = now
+        if self.rps > 0:
+            self._req_tokens = min(max(1.0, self.rps), self._req_tokens + elapsed * self.rps)
+        if self.tpm > 0:
+            self._tok_tokens = min(self.tpm, self._tok_tokens + elapsed * self.tpm / 60.0)
+
+    async def acquire(self, tokens: int = 0) -> None:
+        async with self._lock:
+            # Tek istek bucket kapasitesinden büyükse sonsuza kadar beklemesin
+            if self.tpm > 0:
+                tokens = min(tokens, int(self.tpm))
+            while True:
+                self._refill()
+                wait = 0.0
+                if self.rps > 0 and self._req_tokens < 1:
+                    wait = max(wait, (1 - self._req_tokens) / self.rps)
+                if self.tpm > 0 and self._tok_tokens < tokens:
+                    wait = max(wait, (tokens - self._tok_tokens) * 60.0 / self.tpm)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.rps > 0:
+                self._req_tokens -= 1
+            if self.tpm > 0:
+                self._tok_tokens -= tokens
@@ -0,0 +1,155 @@
+import asyncio
+from typing import AsyncIterator, Callable, Dict, List, Tuple
+from sqlalchemy.orm import Session
+from .models import Document, Page, Chunk
+from .pdf_extract import aiter_page_batches, pdf_page_count, page_fingerprints, extract_pages
+from .chunking import new_chunker
+from .bulk import write_pages, write_chunks
+from .cache import bump_generation
+from .embeddings import embed_texts
+from .blobstore import open_source
+from .settings import settings
+
+# progress(stage, pages_done=None, pages_total=None); writes to the DB, called via asyncio.to_thread
+ProgressFn = Callable[..., None]
+
+async def _persist_chunks(db: Session, document_id: int, chunks: List[Dict], progress: ProgressFn, reuse: Dict) -> int:
+    """Embed (skipping texts whose embedding is in `reuse`) and write one batch. Returns reused count."""
+    await asyncio.to_thread(progress, "embedding")
+    todo = list(dict.fromkeys(c["chunk_text"] for c in chunks if c["chunk_text"] not in reuse))
+    fresh = dict(zip(todo, await embed_texts(todo) or [])) if todo else {}
+    rows = [
+        {**c, "document_id": document_id, "embedding": reuse.get(c["chunk_text"], fresh.get(c["chunk_text"]))}
+        for c in chunks
+    ]
+    await asyncio.to_thread(_write_batch, db, document_id, rows)
+    return sum(1 for c in chunks if c["chunk_text"] in reuse)
+
+def _write_batch(db: Session, document_id: int, rows: List[Dict]) -> None:
+    write_chunks(db, rows)
+    bump_generation(db, [document_id])
+    # Commit now: bump_generation locks the documents row, and progress() updates
+    # documents.ingest_status from its own session (would wait on this transaction)
+    db.commit()
+
+def _reset_previous(db: Session, doc: Document, structured: bool) -> Tuple[Dict[str, Tuple], Dict]:
+    """Read what the previous edition (or an interrupted attempt) left, then delete it.
+    Returns (page fingerprint -> (text, headings), chunk text -> embedding)."""
+    # Önceki sürümden kalanlar: sayfa parmak izi -> (metin, başlıklar), chunk metni -> embedding.
+    # Sayfalar yalnızca aynı CHUNKER moduyla çıkarıldıysa kullanılır (structure: headings dolu).
+    previous = {
+        h: (t or "", hd) for h, t, hd in
+        db.query(Page.content_hash, Page.text_raw, Page.headings).filter(
+            Page.document_id == doc.id, Page.content_hash.isnot(None),
+            Page.headings.isnot(None) if structured else Page.headings.is_(None),
+        )
+    }
+    reuse: Dict = {}
+    if previous:
+        reuse = {
+            t: e for t, e in
+            db.query(Chunk.chunk_text, Chunk.embedding).filter(Chunk.document_id == doc.id, Chunk.embedding.isnot(None))
+        }
+    db.query(Chunk).filter(Chunk.document_id == doc.id).delete(synchronize_session=False)
+    db.query(Page).filter(Page.document_id == doc.id).delete(synchronize_session=False)
+    bump_generation(db, [doc.id])
+    db.commit()
+    db.refresh(doc)  # commit expired it; reload here rather than lazily on the event loop
+    return previous, reuse
+
+def _with_headings(pages: List[tuple], structured: bool) -> List[tuple]:
+    return pages if structured else [(n, t, None) for n, t in pages]
+
+async def _page_batches(source, structured: bool) -> AsyncIterator[List[tuple]]:
+    """aiter_page_batches as (page_no, text, headings); headings is None unless structured."""
+    async for batch in aiter_page_batches(source, structured=structured):
+        yield _with_headings(batch, structured)
+
+async def _revised_page_batches(
+    source, fingerprints: List[str], previous: Dict[str, Tuple], structured: bool,
+) -> AsyncIterator[List[tuple]]:
+    """Like _page_batches, but pages whose fingerprint matches a page of the
+    previous edition take its stored text (and headings); only the others are extracted."""
+    step = settings.extract_batch_pages
+    for start in range(0, len(fingerprints), step):
+        window = range(start + 1, min(start + step, len(fingerprints)) + 1)
+        changed = [n for n in window if fingerprints[n - 1] not in previous]
+        fresh = {}
+        if changed:
+            pages = await asyncio.to_thread(extract_pages, source, changed, structured)
+            fresh = {p[0]: p for p in _with_headings(pages, structured)}
+        yield [fresh[n] if n in fresh else (n, *previous[fingerprints[n - 1]]) for n in window]
+
+async def ingest_document(db: Session, doc: Document, progress: ProgressFn) -> bool:
+    """Extract → chunk → embed → persist for one document, streamed in bounded batches:
+    pages arrive batch by batch, chunks are emitted as they fill, and every
+    INGEST_CHUNK_BATCH chunks are embedded and written. Peak memory is O(batch).
+    CHUNKER picks the chunker (chunking.new_chunker); structure mode also stores the
+    page headings it chunked by.
+    Safe to re-run: rows left over from an interrupted attempt are removed first.
+    Re-ingesting a revised edition (/upload?replaces=) reuses what the previous rows
+    still cover: pages whose content fingerprint is unchanged are not extracted
+    again, and chunks whose text is unchanged keep their embedding.
+    Returns True if chunks were created (document has a text layer).
+    """
+    structured = settings.chunker == "structure"
+    previous, reuse = await asyncio.to_thread(_reset_previous, db, doc, structured)
+
+    async with open_source(db, doc) as source:
+        return await _ingest_source(db, doc, source, previous, reuse, structured, progress)
+
+async def _ingest_source(
+    db: Session, doc: Document, source: str, previous: Dict[str, Tuple], reuse: Dict, structured: bool,
+    progress: ProgressFn,
+) -> bool:
+    pages_total = await asyncio.to_thread(pdf_page_count, source)
+    await asyncio.to_thread(progress, "extracting", pages_done=0, pages_total=pages_total)
+    fingerprints = await asyncio.to_thread(page_fingerprints, source)
+    changed = sum(1 for h in fingerprints if h not in previous)
+    if previous and changed <= settings.ingest_reuse_max_changed * len(fingerprints):
+        print(f"[ingest] doc {doc.id}: {changed}/{len(fingerprints)} pages changed, reusing the rest")
+        page_batches = _revised_page_batches(source, fingerprints, previous, structured)
+    else:
+        # First ingest or mostly new content: full (parallel) extraction
+        previous, reuse = {}, {}
+        page_batches = _page_batches(source, structured)
+
+    chunker = new_chunker()
+    batch_size = settings.ingest_chunk_batch
+    pending: List[Dict] = []
+    has_text_layer = False
+    chunk_count = 0
+    reused = 0
+    pages_done = 0
+
+    doc_id = doc.id
+    async for batch in page_batches:
+        await asyncio.to_thread(write_pages, db, [
+            {"document_id": doc_id, "page_no": page_no, "text_raw": text if text else None,
+             "content_hash": fingerprints[page_no - 1], "headings": headings}
+            for page_no, text, headings in batch
+        ])
+        for page_no, text, headings in batch:
+            if text:
+                has_text_layer = True
+                pending.extend(chunker.feed(page_no, text, headings))
+        while len(pending) >= batch_size:
+            reused += await _persist_chunks(db, doc_id, pending[:batch_size], progress, reuse)
+            chunk_count += batch_size
+            pending = pending[batch_size:]
+        await asyncio.to_thread(db.commit)
+        pages_done += len(batch)
+        await asyncio.to_thread(progress, "extracting", pages_done=pages_done)
+
+    pending.extend(chunker.finish())
+    if pending:
+        reused += await _persist_chunks(db, doc_id, pending, progress, reuse)
+        chunk_count += len(pending)
+    if reuse:
+        print(f"[ingest] doc {doc_id}: reused {reused}/{chunk_count} chunk embeddings")
+
+    await asyncio.to_thread(progress, "persisting")
+    doc.has_text_layer = has_text_layer
+    db.add(doc)
+    await asyncio.to_thread(db.commit)
+    return chunk_count > 0
@@ -0,0 +1,215 @@
+import asyncio
+import threading
+import traceback
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from .db import SessionLocal
+from .models import Document, IngestJob
+from .settings import settings
+from .ingest import ingest_document
+from . import vector_index
+
+# Postgres-backed ingestion queue.
+# Jobs live in `ingest_jobs`; workers claim them with FOR UPDATE SKIP LOCKED so
+# several workers (and several uvicorn processes) never pick the same job.
+# A running job whose heartbeat (updated_at) is older than INGEST_STALE_SECONDS
+# is considered orphaned (process restart/crash) and is claimed again.
+# The claim is identified by (job id, attempts): a heartbeat thread keeps it fresh
+# while the job runs, and every commit of the ingest session first checks that the
+# claim is still ours, so a worker whose job was requeued never writes over the new owner.
+
+_workers: List[asyncio.Task] = []
+
+class ClaimLost(Exception):
+    """The job was requeued and claimed by another worker while this one was running it."""
+
+def enqueue_ingest(db: Session, doc: Document) -> IngestJob:
+    job = IngestJob(document_id=doc.id, status="queued", stage="queued")
+    doc.ingest_status = "queued"
+    db.add(doc)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+async def enqueue_ingest_async(db: AsyncSession, doc: Document) -> IngestJob:
+    """Async variant for the request path; the document and its job commit together."""
+    doc.ingest_status = "queued"
+    db.add(doc)
+    await db.flush()
+    job = IngestJob(document_id=doc.id, status="queued", stage="queued")
+    db.add(job)
+    await db.commit()
+    return job
+
+def _fail_exhausted(db: Session) -> None:
+    db.execute(text("""
+        UPDATE ingest_jobs
+        SET status = 'failed', stage = 'failed', finished_at = now(),
+            error = coalesce(error, 'worker lost (stale heartbeat)')
+        WHERE status = 'running'
+          AND updated_at < now() - make_interval(secs => :stale)
+          AND attempts >= :max_attempts
+    """), {"stale": settings.ingest_stale_seconds, "max_attempts": settings.ingest_max_attempts})
+    db.execute(text("""
+        UPDATE documents d SET ingest_status = 'failed'
+        FROM ingest_jobs j
+        WHERE j.document_id = d.id AND j.status = 'failed' AND d.ingest_status NOT IN ('done', 'failed')
+    """))
+
+def claim_next_job() -> Optional[Tuple[int, int, int]]:
+    """Atomically claim the oldest runnable job. Returns (job_id, document_id, attempt) or None."""
+    db = SessionLocal()
+    try:
+        _fail_exhausted(db)
+        row = db.execute(text("""
+            UPDATE ingest_jobs
+            SET status = 'running', attempts = attempts + 1, error = NULL,
+                started_at = now(), updated_at = now()
+            WHERE id = (
+                SELECT id FROM ingest_jobs
+                WHERE status = 'queued'
+                   OR (status = 'running' AND updated_at < now() - make_interval(secs => :stale))
+                ORDER BY id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, document_id, attempts
+        """), {"stale": settings.ingest_stale_seconds}).first()
+        db.commit()
+        return (row[0], row[1], row[2]) if row else None
+    finally:
+        db.close()
+
+def _update_job(job_id: int, document_id: int, attempt: int, **fields) -> bool:
+    """Update job fields (and mirror the stage onto documents.ingest_status). Also acts as heartbeat.
+
+    Only applies while the claim `attempt` is still current; returns False if the job has moved on.
+    """
+    db = SessionLocal()
+    try:
+        sets = ", ".join(f"{k} = :{k}" for k in fields)
+        owned = db.execute(
+            text(f"UPDATE ingest_jobs SET {sets}{', ' if sets else ''}updated_at = now() "
+                 "WHERE id = :job_id AND attempts = :attempt AND status = 'running'"),
+            {**fields, "job_id": job_id, "attempt": attempt},
+        ).rowcount > 0
+        if owned and "stage" in fields:
+            db.execute(
+                text("UPDATE documents SET ingest_status = :stage WHERE id = :doc_id"),
+                {"stage": fields["stage"], "doc_id": document_id},
+            )
+        db.commit()
+        return owned
+    finally:
+        db.close()
+
+def _heartbeat(job_id: int, document_id: int, attempt: int, stop: threading.Event) -> None:
+    # Ayrı thread: uzun bir aşama (büyük sayfa çıkarımı, yavaş embedding) sürerken de
+    # updated_at tazelenir; event loop meşgul olsa bile.
+    while not stop.wait(settings.ingest_heartbeat_seconds):
+        try:
+            if not _update_job(job_id, document_id, attempt):
+                return
+        except Exception as e:
+            print(f"Ingest job {job_id}: heartbeat failed: {e}")
+
+def _guard_claim(db: Session, job_id: int, attempt: int) -> None:
+    """Refuse to commit the ingest session once the claim is lost.
+
+    FOR SHARE holds the job row until the commit finishes, so the claim cannot be
+    taken over between the check and the commit.
+    """
+    @event.listens_for(db, "before_commit")
+    def _check(session: Session) -> None:
+        owned = session.execute(text("""
+            SELECT 1 FROM ingest_jobs
+            WHERE id = :id AND attempts = :attempt AND status = 'running'
+            FOR SHARE
+        """), {"id": job_id, "attempt": attempt}).first()
+        if not owned:
+            raise ClaimLost(f"ingest job {job_id} attempt {attempt} was claimed by another worker")
+
+def _fail_or_requeue(db: Session, job_id: int, document_id: int, attempt: int, error: str) -> None:
+    db.rollback()
+    if attempt >= settings.ingest_max_attempts:
+        _update_job(job_id, document_id, attempt, status="failed", stage="failed", error=error,
+                    finished_at=datetime.now(timezone.utc))
+    else:
+        _update_job(job_id, document_id, attempt, status="queued", stage="queued", error=error)
+
+async def run_job(job_id: int, document_id: int, attempt: int) -> None:
+    def progress(stage: str, pages_done: Optional[int] = None, pages_total: Optional[int] = None):
+        fields = {"stage": stage}
+        if pages_done is not None:
+            fields["pages_done"] = pages_done
+        if pages_total is not None:
+            fields["pages_total"] = pages_total
+        _update_job(job_id, document_id, attempt, **fields)
+
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job_id, document_id, attempt, stop),
+                     name=f"ingest-heartbeat-{job_id}", daemon=True).start()
+    # Sync DB calls run in a thread (ingest_document calls progress() the same way)
+    # so a slow write doesn't stall the event loop shared with requests
+    db = SessionLocal()
+    _guard_claim(db, job_id, attempt)
+    try:
+        doc = await asyncio.to_thread(db.get, Document, document_id)
+        if not doc:
+            # Belge job beklerken silinmiş (cascade job'u da siler); yapacak iş yok
+            return
+        await ingest_document(db, doc, progress)
+        await asyncio.to_thread(_update_job, job_id, document_id, attempt, status="done", stage="done",
+                                finished_at=datetime.now(timezone.utc))
+        if settings.vector_index_auto_rebuild and not vector_index.is_running():
+            # rebuild() yalnızca eşik aşıldıysa (veya config değiştiyse) indeksi yeniden kurar
+            vector_index.start_rebuild()
+    except asyncio.CancelledError:
+        # Graceful shutdown: hand the job back instead of waiting for the stale timeout
+        await asyncio.to_thread(db.rollback)
+        await asyncio.to_thread(_update_job, job_id, document_id, attempt, status="queued", stage="queued")
+        raise
+    except ClaimLost as e:
+        # Job artık başka bir worker'da; hiçbir şey yazmadan bırak
+        print(f"Ingest job {job_id}: {e}; abandoning")
+        await asyncio.to_thread(db.rollback)
+    except Exception as e:
+        print(f"Ingest job {job_id} failed: {e}")
+        traceback.print_exc()
+        await asyncio.to_thread(_fail_or_requeue, db, job_id, document_id, attempt, str(e))
+    finally:
+        stop.set()
+        await asyncio.to_thread(db.close)
+
+async def _worker_loop(n: int) -> None:
+    while True:
+        try:
+            claimed = await asyncio.to_thread(claim_next_job)
+        except Exception as e:
+            print(f"Ingest worker {n}: queue unavailable: {e}")
+            claimed = None
+        if not claimed:
+            await asyncio.sleep(settings.ingest_poll_seconds)
+            continue
+        await run_job(*claimed)
+
+def start_workers() -> None:
+    for n in range(max(0, settings.ingest_workers)):
+        _workers.append(asyncio.create_task(_worker_loop(n)))
+
+async def stop_workers() -> None:
+    for t in _workers:
+        t.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+def job_eta_seconds(job: IngestJob) -> Optional[float]:
+    if job.status != "running" or not job.started_at or not job.pages_total or not job.pages_done:
+        return None
+    elapsed = (datetime.now(timezone.utc) - job.started_at).total_seconds()
+    remaining = max(0, job.pages_total - job.pages_done)
+    return round(elapsed / job.pages_done * remaining, 1)
@@ -1,6 +1,10 @@
-import httpx
-from typing import List, Dict, Any
-from .settings import get_chat_settings
+import json
+import re
+from typing import List, Dict, Any, AsyncIterator
+from . import chat_client
+from .chat_client import ChatError
+from .embeddings import approx_tokens
+from .settings import settings, get_chat_settings
 
 SYSTEM = (
     "Sen akademik bir asistan olarak çalışıyorsun. "
@@ -13,15 +17,32 @@ SYSTEM = (
     "Gerekirse 2-4 paragraf kullan, ancak kanıt dışına çıkma."
 )
 
-async def answer_with_citations(question: str, evidence: List[Dict[str, Any]]) -> Dict[str, Any]:
-    # evidence items: {document_title, section_path, page_start, page_end, excerpt}
-    # Build compact context
-    blocks = []
-    for i, e in enumerate(evidence, start=1):
-        sec = e.get("section_path") or ""
-        pages = f"s.{e['page_start']}" if e["page_start"] == e["page_end"] else f"s.{e['page_start']}-{e['page_end']}"
-        header = f"[{i}] {e['document_title']} | {sec} | {pages}"
-        blocks.append(header + "\n" + e["excerpt"])
+# SYSTEM veya kullanıcı prompt şablonu değişince artır (answer_cache anahtarının parçası)
+PROMPT_VERSION = "2"
+
+def format_pages(e: Dict[str, Any]) -> str:
+    return f"s.{e['page_start']}" if e["page_start"] == e["page_end"] else f"s.{e['page_start']}-{e['page_end']}"
+
+def evidence_citations(evidence: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Citations built directly from evidence (used when the LLM gives none or is unreachable)."""
+    return [
+        {
+            "document_id": e["document_id"],
+            "document": e["document_title"],
+            "section": e.get("section_path"),
+            "pages": format_pages(e),
+            "excerpt": e.get("excerpt") or e.get("chunk_text") or "",
+        }
+        for e in evidence
+    ]
+
+def evidence_block(i: int, e: Dict[str, Any]) -> str:
+    sec = e.get("section_path") or ""
+    return f"[{i}] {e['document_title']} | {sec} | {format_pages(e)}\n{e['excerpt']}"
+
+def _build_payload(question: str, evidence: List[Dict[str, Any]], chat_settings: Dict[str, str]) -> Dict[str, Any]:
+    # evidence items: {document_title, section_path, page_start, page_end, excerpt}, packed by evidence.py
+    blocks = [evidence_block(i, e) for i, e in enumerate(evidence, start=1)]
     context = "\n\n".join(blocks) if blocks else "(KANIT YOK)"
 
     user = (
@@ -40,52 +61,36 @@ async def answer_with_citations(question: str, evidence: List[Dict[str, Any]]) -
         "}\n"
     )
 
-    chat_settings = get_chat_settings()
-    url = chat_settings["chat_base_url"].rstrip("/") + "/chat/completions"
-    headers = {"Authorization": f"Bearer {chat_settings['chat_api_key']}"}
-    payload = {
+    return {
         "model": chat_settings["chat_model"],
         "temperature": 0.2,
-        "max_tokens": 2000,
+        "max_tokens": settings.chat_max_tokens,
         "messages": [
             {"role": "system", "content": SYSTEM},
             {"role": "user", "content": user},
         ],
     }
 
-    try:
-        async with httpx.AsyncClient(timeout=120) as client:
-            r = await client.post(url, json=payload, headers=headers)
-            r.raise_for_status()
-            data = r.json()
-            content = data["choices"][0]["message"]["content"]
-    except Exception:
-        if not evidence:
-            return {"answer": "Bu kaynaklarda bulunamadı", "citations": []}
+def prompt_overhead_tokens(question: str) -> int:
+    """Prompt tokens apart from the evidence blocks (system message, question, instructions)."""
+    payload = _build_payload(question, [], {"chat_model": ""})
+    return sum(approx_tokens(m["content"]) for m in payload["messages"])
 
-        citations = []
-        for e in evidence:
-            pages = f"s.{e['page_start']}" if e["page_start"] == e["page_end"] else f"s.{e['page_start']}-{e['page_end']}"
-            citations.append({
-                "document_id": e["document_id"],
-                "document": e["document_title"],
-                "section": e.get("section_path"),
-                "pages": pages,
-                "excerpt": e.get("excerpt") or e.get("chunk_text") or "",
-            })
-        return {"answer": "LLM erişilemedi. Kanıtlar aşağıda listelenmiştir.", "citations": citations}
+def _llm_unreachable(evidence: List[Dict[str, Any]]) -> Dict[str, Any]:
+    if not evidence:
+        return {"answer": "Bu kaynaklarda bulunamadı", "citations": []}
+    return {"answer": "LLM erişilemedi. Kanıtlar aşağıda listelenmiştir.", "citations": evidence_citations(evidence), "llm_failed": True}
+
+def parse_answer(content: str, evidence: List[Dict[str, Any]]) -> Dict[str, Any]:
     # Best-effort JSON parse - try to extract JSON from mixed content
-    import json
-    import re
-    
     parsed = None
     content = content.strip()
-    
+
     # Markdown code block içindeki JSON'u çıkar
     code_block_match = re.search(r'```(?:json)?\s*([\s\S]*?)```', content)
     if code_block_match:
         content = code_block_match.group(1).strip()
-    
+
     # İlk olarak direkt JSON parse dene
     try:
         parsed = json.loads(content)
@@ -102,7 +107,7 @@ async def answer_with_citations(question: str, evidence: List[Dict[str, Any]]) -
                 answer_match = re.search(r'"answer"\s*:\s*"((?:[^"\\]|\\.)*)"', json_str)
                 if answer_match:
                     parsed = {"answer": answer_match.group(1), "citations": []}
-    
+
     if not parsed:
         # Hala parse edemediyse, düz metin olarak kullan
         clean_answer = re.sub(r'KANIT METİNLERİ \[(\d+)\]', r'[\1]', content)
@@ -121,14 +126,108 @@ async def answer_with_citations(question: str, evidence: List[Dict[str, Any]]) -
         ref = c.get("ref")
         if isinstance(ref, int) and ref in evidence_map:
             e = evidence_map[ref]
-            pages = f"s.{e['page_start']}" if e["page_start"] == e["page_end"] else f"s.{e['page_start']}-{e['page_end']}"
             citations.append({
                 "ref": ref,  # Frontend için ref numarasını ekle
                 "document_id": e["document_id"],
                 "document": e["document_title"],
                 "section": e.get("section_path"),
-                "pages": pages,
+                "pages": format_pages(e),
                 "excerpt": e.get("excerpt") or e.get("chunk_text") or "",
             })
 
     return {"answer": answer, "citations": citations}
+
+def _mark_fallback(result: Dict[str, Any], route: Dict[str, Any]) -> Dict[str, Any]:
+    # Yedek modelin cevabı: answer_cache birincil modelin anahtarıyla saklamaz
+    if route.get("fallback"):
+        result["llm_fallback"] = route["model"]
+    return result
+
+async def answer_with_citations(question: str, evidence: List[Dict[str, Any]]) -> Dict[str, Any]:
+    payload = _build_payload(question, evidence, get_chat_settings())
+    try:
+        out = await chat_client.complete(payload)
+    except ChatError as e:
+        print(f"LLM unreachable: {e}")
+        return _llm_unreachable(evidence)
+    return _mark_fallback(parse_answer(out["content"], evidence), out)
+
+class AnswerStreamExtractor:
+    """Incrementally pulls the "answer" string out of a streamed JSON completion,
+    so clients see readable text instead of raw JSON while tokens arrive.
+    Completions that don't start with JSON ({ or ```) are passed through as-is.
+    """
+
+    _KEY = re.compile(r'"answer"\s*:\s*"')
+    _ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+    def __init__(self):
+        self.buf = ""
+        self.pos = 0
+        self.mode = "detect"  # detect | seek | value | raw | done
+
+    def feed(self, delta: str) -> str:
+        self.buf += delta
+        out = []
+        if self.mode == "detect":
+            stripped = self.buf.lstrip()
+            if not stripped:
+                return ""
+            self.mode = "seek" if stripped[0] in "{`" else "raw"
+        if self.mode == "raw":
+            out.append(self.buf[self.pos:])
+            self.pos = len(self.buf)
+        if self.mode == "seek":
+            m = self._KEY.search(self.buf, self.pos)
+            if not m:
+                return ""
+            self.pos = m.end()
+            self.mode = "value"
+        if self.mode == "value":
+            while self.pos < len(self.buf):
+                ch = self.buf[self.pos]
+                if ch == '"':
+                    self.mode = "done"
+                    break
+                if ch != "\\":
+                    out.append(ch)
+                    self.pos += 1
+                    continue
+                if self.pos + 1 >= len(self.buf):
+                    break  # kaçış dizisinin devamını bekle
+                esc = self.buf[self.pos + 1]
+                if esc == "u":
+                    hexpart = self.buf[self.pos + 2:self.pos + 6]
+                    if len(hexpart) < 4:
+                        break
+                    try:
+                        out.append(chr(int(hexpart, 16)))
+                    except ValueError:
+                        pass
+                    self.pos += 6
+                else:
+                    out.append(self._ESCAPES.get(esc, esc))
+                    self.pos += 2
+        return "".join(out)
+
+async def stream_answer(question: str, evidence: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """Stream a completion: yields {"type": "token", "text": ...} while the answer is generated,
+    then one {"type": "final", "answer": ..., "citations": [...]} parsed like answer_with_citations.
+    """
+    payload = _build_payload(question, evidence, get_chat_settings())
+    route: Dict[str, Any] = {}
+    extractor = AnswerStreamExtractor()
+    parts: List[str] = []
+    try:
+        async for delta in chat_client.stream(payload, route):
+            parts.append(delta)
+            visible = extractor.feed(delta)
+            if visible:
+                yield {"type": "token", "text": visible}
+    except Exception as e:
+        if not parts:
+            print(f"LLM unreachable: {e}")
+            yield {"type": "final", **_llm_unreachable(evidence)}
+            return
+        # Yarıda kesilen akış: elimizdekini parse etmeyi dene
+    yield {"type": "final", **_mark_fallback(parse_answer("".join(parts), evidence), route)}
@@ -1,17 +1,34 @@
+import json
 import os
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException
+import re
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse
+import asyncio
+from sqlalchemy import delete, func, select
 from sqlalchemy.orm import Session
-from .db import Base, engine, get_db
-from .models import Document, Page, Chunk
+from sqlalchemy.ext.asyncio import AsyncSession
+from .db import Base, engine, async_engine, get_db, get_async_db
+from .models import Document, Page, Chunk, IngestJob
 from .settings import settings, get_chat_settings, update_chat_settings
-from .schemas import UploadResponse, DocumentOut, AskRequest, AskResponse, LLMSettingsOut, LLMSettingsUpdate
-from .pdf_extract import extract_pages_text
-from .chunking import chunk_pages
-from .search import fts_search, hybrid_search
+from .schemas import UploadResponse, DocumentOut, AskRequest, AskBatchRequest, AskResponse, LLMSettingsOut, LLMSettingsUpdate, JobOut, ReindexRunOut, PageOut
+from .jobs import enqueue_ingest_async, start_workers, stop_workers, job_eta_seconds
+from .pdf_extract import shutdown_executor
+from .dedup import find_duplicate
+from .blobstore import save_upload, read_range, remove_if_unreferenced, remove_if_unreferenced_async
+from . import blobstore, chat_client, page_cache, reindex, search, vector_index
+from .search import hybrid_search_async
 from .embeddings import embed_texts
-from .llm import answer_with_citations
+from .answer_cache import answer_with_cache, stream_with_cache, get_answer_cache
+from .llm import evidence_citations
+from .evidence import pack_evidence
+from .http_pool import close_clients
+from .vector_store import vector_store
+from .embedding_cache import get_embedding_cache
+from .cache import query_embedding_cache, retrieval_cache, retrieval_key_async, normalize_question
 
 app = FastAPI(title="TEXT-ONLY RAG Backend", version="0.1.0")
 
@@ -34,169 +51,341 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"] ,
     allow_headers=["*"],
+    # PDF.js range loading reads these from cross-origin /files responses
+    expose_headers=["Accept-Ranges", "Content-Range", "Content-Length", "ETag"],
 )
 
 @app.on_event("startup")
 def startup():
     os.makedirs(settings.files_dir, exist_ok=True)
     Base.metadata.create_all(bind=engine)
+    blobstore.check_legacy()
+    search.check_lexical()
+    try:
+        reindex.check_model()
+        vector_index.check_config()
+    except Exception as e:
+        print(f"Vector index check skipped: {e}")
+
+@app.on_event("startup")
+async def start_ingest_workers():
+    start_workers()
+
+@app.on_event("shutdown")
+async def stop_ingest_workers():
+    await stop_workers()
+    await reindex.stop()
+    shutdown_executor()
+    await close_clients()
+    await async_engine.dispose()
 
 @app.get("/health")
 def health():
     return {"ok": True}
 
+@app.get("/cache/stats")
+def cache_stats():
+    emb_cache = get_embedding_cache()
+    answer_cache = get_answer_cache()
+    return {
+        "embedding": emb_cache.info() if emb_cache else {"backend": "none"},
+        "query_embedding": query_embedding_cache.info(),
+        "retrieval": retrieval_cache.info(),
+        "answer": answer_cache.info() if answer_cache else {"backend": "none"},
+        "page_images": page_cache.page_cache.info(),
+        "vector_store": vector_store.info(),
+        "chat": chat_client.info(),
+    }
+
+@app.get("/admin/vector-index")
+def vector_index_status():
+    return vector_index.status()
+
+@app.post("/admin/vector-index/rebuild")
+async def rebuild_vector_index(force: bool = False):
+    """Rebuild chunks.embedding's ANN index concurrently (type/metric/storage from settings).
+    Without force, only when the index is missing/invalid, its config changed, or
+    (IVFFlat) the row count crossed the retraining threshold."""
+    if vector_index.is_running():
+        raise HTTPException(409, "Vector index rebuild already running")
+    status = await asyncio.to_thread(vector_index.status)
+    if not force and status["rebuild_reason"] is None:
+        return {"started": False, "reason": "up to date", "status": status}
+    vector_index.start_rebuild(force)
+    return {"started": True, "reason": status["rebuild_reason"] or "forced", "status": status}
+
+def _llm_settings_out() -> LLMSettingsOut:
+    chat = get_chat_settings()
+    return LLMSettingsOut(
+        chat_base_url=chat["chat_base_url"], chat_model=chat["chat_model"],
+        chat_fallbacks=[{"base_url": r["base_url"], "model": r["model"]} for r in chat["chat_fallbacks"]],
+    )
+
 @app.get("/settings", response_model=LLMSettingsOut)
 def get_settings():
-    chat = get_chat_settings()
-    return LLMSettingsOut(chat_base_url=chat["chat_base_url"], chat_model=chat["chat_model"])
+    return _llm_settings_out()
 
 @app.post("/settings", response_model=LLMSettingsOut)
 def update_settings(payload: LLMSettingsUpdate):
     updated = update_chat_settings(payload.model_dump(exclude_none=True))
-    chat = get_chat_settings()
-    return LLMSettingsOut(chat_base_url=chat["chat_base_url"], chat_model=chat["chat_model"])
+    return _llm_settings_out()
+
+def _document_out(doc: Document) -> DocumentOut:
+    return DocumentOut(
+        id=doc.id, title=doc.title, filename=doc.filename,
+        has_text_layer=doc.has_text_layer, ingest_status=doc.ingest_status
+    )
 
 @app.post("/upload", response_model=UploadResponse)
-async def upload_pdf(file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_pdf(file: UploadFile = File(...), replaces: int | None = None, db: AsyncSession = Depends(get_async_db)):
+    """Upload a PDF. Identical bytes return the existing document (duplicate=true).
+    replaces=<doc_id> uploads a revised edition of that document: unchanged pages
+    are not extracted again and unchanged chunks keep their embeddings."""
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(400, "Only PDF files are supported.")
 
     safe_name = file.filename.replace("/", "_").replace("\\", "_")
-    content = await file.read()
-    
-    # Check if running on Render (no disk) or local
-    is_cloud = os.getenv("RENDER") == "true"
-    
-    if is_cloud:
-        # Store PDF in database
-        doc = Document(
-            title=os.path.splitext(safe_name)[0], 
-            filename=safe_name, 
-            file_path=None,
-            file_data=content
-        )
+
+    target = None
+    if replaces is not None:
+        target = await db.get(Document, replaces)
+        if not target:
+            raise HTTPException(404, "Document not found")
+        if target.ingest_status not in ("done", "failed"):
+            raise HTTPException(409, "Document is being ingested")
+
+    # Streamed to disk or into a Postgres large object, hashed on the way (blobstore.py)
+    stored = await save_upload(db, file)
+    sha256 = stored["content_sha256"]
+
+    # Aynı içerik zaten yüklü: yeniden işleme (pg: rollback drops the new large object)
+    existing = target if target is not None and target.content_sha256 == sha256 else None
+    if target is None:
+        existing = await find_duplicate(db, sha256)
+    if existing is not None:
+        resp = UploadResponse(document=_document_out(existing), ingest_started=False, duplicate=True)
+        await db.rollback()
+        return resp
+
+    old_path = old_oid = None
+    if target is not None:
+        # Revised edition: same document id, new file; ingest reuses unchanged pages/chunks
+        doc = target
+        old_path, old_oid = doc.file_path, doc.blob_oid
+        doc.filename = safe_name
+        doc.uploaded_at = datetime.now(timezone.utc)
+        for k, v in stored.items():
+            setattr(doc, k, v)
     else:
-        # Store PDF on disk (local development)
-        doc_dir = os.path.join(settings.files_dir, "pdfs")
-        os.makedirs(doc_dir, exist_ok=True)
-        path = os.path.join(doc_dir, safe_name)
-        with open(path, "wb") as f:
-            f.write(content)
-        doc = Document(
-            title=os.path.splitext(safe_name)[0], 
-            filename=safe_name, 
-            file_path=os.path.abspath(path),
-            file_data=None
-        )
+        doc = Document(title=os.path.splitext(safe_name)[0], filename=safe_name, **stored)
     
-    db.add(doc)
-    db.commit()
-    db.refresh(doc)
-
-    # Ingest synchronously (MVP). Later: background queue
-    # Use content directly for text extraction
-    import io
-    has_text_layer, pages = extract_pages_text(io.BytesIO(content))
-    doc.has_text_layer = bool(has_text_layer)
-    db.add(doc)
-
-    # Store pages
-    for page_no, text in pages:
-        p = Page(document_id=doc.id, page_no=page_no, text_raw=text if text else None)
-        db.add(p)
-
-    # Create chunks only if some text exists
-    ingest_started = False
-    if has_text_layer:
-        page_objs = [{"page_no": pn, "text": t} for pn, t in pages if t and t.strip()]
-        chunks = chunk_pages(page_objs, max_chars=1800)
-        embeddings = await embed_texts([c["chunk_text"] for c in chunks]) if chunks else None
-        for idx, c in enumerate(chunks):
-            ch = Chunk(
-                document_id=doc.id,
-                section_path=c.get("section_path"),
-                page_start=c["page_start"],
-                page_end=c["page_end"],
-                chunk_text=c["chunk_text"],
-                embedding=(embeddings[idx] if embeddings else None),
-            )
-            db.add(ch)
-        ingest_started = True
+    # Extraction/chunking/embedding runs in the background ingestion workers (jobs.py)
+    job = await enqueue_ingest_async(db, doc)
+    if old_path and old_path != doc.file_path:
+        await remove_if_unreferenced_async(db, path=old_path)
+    if old_oid is not None:
+        await remove_if_unreferenced_async(db, oid=old_oid)
 
-    db.commit()
-    db.refresh(doc)
-
-    return UploadResponse(
-        document=DocumentOut(
-            id=doc.id, title=doc.title, filename=doc.filename,
-            has_text_layer=doc.has_text_layer
-        ),
-        ingest_started=ingest_started
+    return UploadResponse(document=_document_out(doc), ingest_started=True, job_id=job.id)
+
+@app.get("/jobs/{job_id}", response_model=JobOut)
+def get_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.query(IngestJob).filter(IngestJob.id == job_id).first()
+    if not job:
+        raise HTTPException(404, "Job not found")
+    return JobOut(
+        id=job.id, document_id=job.document_id, status=job.status, stage=job.stage,
+        pages_total=job.pages_total, pages_done=job.pages_done, attempts=job.attempts,
+        eta_seconds=job_eta_seconds(job), error=job.error
     )
 
 @app.get("/documents", response_model=list[DocumentOut])
 def list_documents(db: Session = Depends(get_db)):
     docs = db.query(Document).order_by(Document.id.desc()).all()
-    return [DocumentOut(id=d.id, title=d.title, filename=d.filename, has_text_layer=d.has_text_layer) for d in docs]
+    return [
+        DocumentOut(id=d.id, title=d.title, filename=d.filename, has_text_layer=d.has_text_layer, ingest_status=d.ingest_status)
+        for d in docs
+    ]
 
 @app.delete("/documents/{doc_id}")
 def delete_document(doc_id: int, db: Session = Depends(get_db)):
     doc = db.query(Document).filter(Document.id == doc_id).first()
     if not doc:
         raise HTTPException(404, "Document not found")
-    file_path = doc.file_path
+    file_path, blob_oid = doc.file_path, doc.blob_oid
+    # chunks tek DELETE ile silinir (bölümlü tabloda yalnızca belgenin bölümüne iner)
+    db.execute(delete(Chunk).where(Chunk.document_id == doc_id))
     db.delete(doc)
     db.commit()
-    try:
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
-    except Exception:
-        pass
+    remove_if_unreferenced(db, path=file_path, oid=blob_oid)
     return {"deleted": True}
 
+_BYTE_RANGE = re.compile(r"bytes=\s*([0-9]*)\s*-\s*([0-9]*)\s*")
+
+def _parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """Single 'bytes=a-b' / 'bytes=a-' / 'bytes=-n' range -> (start, end) inclusive.
+    None => serve the whole file: no header, multiple ranges, or an invalid one
+    (RFC 7233 3.1: ignored). Raises ValueError if valid but unsatisfiable (416):
+    the first byte is at or past the end, or a zero-length suffix."""
+    m = _BYTE_RANGE.fullmatch(header or "")
+    if not m or not any(m.groups()):
+        return None
+    first, last = m.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            raise ValueError(header)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        if int(last) == 0 or size == 0:
+            raise ValueError(header)
+        start, end = max(0, size - int(last)), size - 1
+    return start, end
+
+def _not_modified(request: Request, etag: str, last_modified: datetime | None) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        return inm.strip() == "*" or etag in [t.strip().removeprefix("W/") for t in inm.split(",")]
+    ims = request.headers.get("if-modified-since")
+    if ims and last_modified:
+        try:
+            return int(last_modified.timestamp()) <= int(parsedate_to_datetime(ims).timestamp())
+        except (TypeError, ValueError):
+            return False
+    return False
+
 @app.get("/files/{doc_id}")
-def get_pdf(doc_id: int, db: Session = Depends(get_db)):
-    from fastapi.responses import Response
+def get_pdf(doc_id: int, request: Request, db: Session = Depends(get_db)):
+    """The PDF with Range (single range), ETag (content sha256) and conditional GET
+    support, so PDF.js can fetch only the parts it needs. Streamed from the blob store."""
     doc = db.query(Document).filter(Document.id == doc_id).first()
     if not doc:
         raise HTTPException(404, "Document not found")
-    
-    headers = {"Content-Disposition": f"inline; filename=\"{doc.filename}\""}
-    
-    # Check if PDF is stored in database or on disk
-    if doc.file_data:
-        # Return from database (cloud mode)
-        return Response(
-            content=doc.file_data,
-            media_type="application/pdf",
-            headers=headers,
-        )
-    elif doc.file_path and os.path.exists(doc.file_path):
-        # Return from disk (local mode)
-        return FileResponse(
-            doc.file_path,
-            media_type="application/pdf",
-            headers=headers,
-        )
-    else:
+    if not blobstore.exists(doc):
         raise HTTPException(404, "PDF file not found")
 
-@app.post("/ask", response_model=AskResponse)
-async def ask(req: AskRequest, db: Session = Depends(get_db)):
-    # Evidence retrieval: FTS MVP
-    query_embedding = None
-    embedding_list = await embed_texts([req.question])
-    if embedding_list:
-        query_embedding = embedding_list[0]
-
-    evidence = hybrid_search(
-        db,
-        req.question,
-        query_embedding=query_embedding,
-        source_ids=req.source_ids,
-        limit=max(3, min(req.top_k, 12)),
+    size = blobstore.size(doc)
+    last_modified = doc.uploaded_at or doc.created_at
+    etag = f'"{doc.content_sha256}"' if doc.content_sha256 else f'"{doc.id}-{size}-{int(last_modified.timestamp())}"'
+    headers = {
+        "Content-Disposition": f"inline; filename=\"{doc.filename}\"",
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified.astimezone(timezone.utc), usegmt=True),
+        "Cache-Control": "no-cache",  # ?replaces= keeps the URL; always revalidate (cheap 304)
+    }
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    rng = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if rng and if_range and if_range.strip() != etag:
+        rng = None  # representation changed since the client's partial copy: send it all
+    try:
+        byte_range = _parse_range(rng, size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    start, end = byte_range or (0, size - 1)
+    status = 200
+    if byte_range:
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    if size == 0:
+        return Response(content=b"", media_type="application/pdf", headers=headers)
+    db.close()  # metadata is loaded; don't hold this connection while the body streams
+    return StreamingResponse(read_range(doc, start, end), status_code=status, media_type="application/pdf", headers=headers)
+
+async def _page_or_404(db: AsyncSession, doc_id: int, page_no: int) -> tuple[Document, Page, int]:
+    doc = await db.get(Document, doc_id)
+    if not doc:
+        raise HTTPException(404, "Document not found")
+    page = (await db.execute(
+        select(Page).where(Page.document_id == doc_id, Page.page_no == page_no)
+    )).scalars().first()
+    if not page:
+        raise HTTPException(404, "Page not found")
+    page_count = (await db.execute(select(func.count()).where(Page.document_id == doc_id))).scalar()
+    return doc, page, page_count
+
+@app.get("/documents/{doc_id}/pages/{page_no}", response_model=PageOut)
+async def get_page(
+    doc_id: int, page_no: int,
+    dpi: int = Query(settings.page_render_dpi, ge=24, le=settings.page_render_max_dpi),
+    format: str = Query("png", pattern="^(png|jpeg)$"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Stored text of one page plus the URL of its rendered preview (citation deep links)."""
+    doc, page, page_count = await _page_or_404(db, doc_id, page_no)
+    return PageOut(
+        document_id=doc.id, page_no=page_no, page_count=page_count, text=page.text_raw,
+        image_url=f"/documents/{doc.id}/pages/{page_no}/image?dpi={dpi}&format={format}",
     )
 
+@app.get("/documents/{doc_id}/pages/{page_no}/image")
+async def get_page_image(
+    doc_id: int, page_no: int, request: Request,
+    dpi: int = Query(settings.page_render_dpi, ge=24, le=settings.page_render_max_dpi),
+    format: str = Query("png", pattern="^(png|jpeg)$"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """One page rendered by PyMuPDF in the PDF process pool, served from the on-disk LRU (page_cache.py)."""
+    doc, _, _ = await _page_or_404(db, doc_id, page_no)
+    await db.close()  # metadata is loaded; rendering may take a while
+    etag = f'"{page_cache.content_key(doc)}-{page_no}-{dpi}.{format}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _not_modified(request, etag, None):
+        return Response(status_code=304, headers=headers)
+    if not blobstore.exists(doc):
+        raise HTTPException(404, "PDF file not found")
+    data = await page_cache.page_image(doc, page_no, dpi, format)
+    return Response(content=data, media_type=f"image/{format}", headers=headers)
+
+async def embed_questions(questions: list[str]) -> list[list[float] | None]:
+    """Query embeddings through query_embedding_cache; the misses go to one embed_texts call."""
+    keys = [(settings.openai_model, normalize_question(q)) for q in questions]
+    out = [query_embedding_cache.get(k) for k in keys]
+    missing = [i for i, v in enumerate(out) if v is None]
+    if missing:
+        embedding_list = await embed_texts([questions[i] for i in missing])
+        for i, v in zip(missing, embedding_list or []):
+            if v:
+                out[i] = v
+                query_embedding_cache.set(keys[i], v)
+    return out
+
+async def retrieve_evidence(req: AskRequest, db: AsyncSession) -> list[dict]:
+    # Evidence retrieval: FTS MVP
+    query_embedding = (await embed_questions([req.question]))[0]
+
+    limit = max(3, min(req.top_k, 12))
+    knobs = (req.fts_weight, req.vector_weight, req.ef_search, req.probes, await vector_index.query_storage_async(db))
+    rkey = await retrieval_key_async(db, req.question, req.source_ids, limit, query_embedding is not None, knobs)
+    evidence = retrieval_cache.get(rkey)
+    if evidence is None:
+        evidence = await hybrid_search_async(
+            db,
+            req.question,
+            query_embedding=query_embedding,
+            source_ids=req.source_ids,
+            limit=limit,
+            fts_weight=req.fts_weight,
+            vector_weight=req.vector_weight,
+            ef_search=req.ef_search,
+            probes=req.probes,
+        )
+        retrieval_cache.set(rkey, evidence)
+    # Prompt evidence: merged, de-duplicated, trimmed to the chat model's budget
+    return pack_evidence(req.question, evidence)
+
+@app.post("/ask", response_model=AskResponse)
+async def ask(req: AskRequest, db: AsyncSession = Depends(get_async_db)):
+    evidence = await retrieve_evidence(req, db)
+    return await answer_evidence(req.question, evidence)
+
+async def answer_evidence(question: str, evidence: list[dict]) -> AskResponse:
     if not evidence:
         return AskResponse(
             answer="Bu kaynaklarda bulunamadı",
@@ -204,7 +393,7 @@ async def ask(req: AskRequest, db: Session = Depends(get_db)):
             evidence=[]
         )
 
-    llm = await answer_with_citations(req.question, evidence)
+    llm = await answer_with_cache(question, evidence)
 
     answer = llm.get("answer", "")
     if not answer or not answer.strip():
@@ -214,19 +403,7 @@ async def ask(req: AskRequest, db: Session = Depends(get_db)):
             evidence=[]
         )
 
-    citations = llm.get("citations", [])
-
-    if not citations:
-        citations = [
-            {
-                "document_id": e["document_id"],
-                "document": e["document_title"],
-                "section": e.get("section_path"),
-                "pages": f"s.{e['page_start']}" if e["page_start"] == e["page_end"] else f"s.{e['page_start']}-{e['page_end']}",
-                "excerpt": e.get("excerpt", ""),
-            }
-            for e in evidence
-        ]
+    citations = llm.get("citations", []) or evidence_citations(evidence)
 
     return AskResponse(
         answer=answer,
@@ -234,30 +411,151 @@ async def ask(req: AskRequest, db: Session = Depends(get_db)):
         evidence=evidence
     )
 
-@app.post("/reindex")
-async def reindex_embeddings(doc_id: int | None = None, batch_size: int = 32, db: Session = Depends(get_db)):
+@app.post("/ask/batch")
+async def ask_batch(req: AskBatchRequest, db: AsyncSession = Depends(get_async_db)):
+    """Many questions in one call (evaluation runs, bulk Q&A), as NDJSON.
+
+    All questions are embedded with one embed_texts call and retrieved with one
+    statement (search.hybrid_search_batch_async); the answers (answer cache, LLM) run
+    with at most `concurrency` in flight. One line per question, in completion order:
+    {"type": "answer", "index", "id", "question", "answer", "citations", "evidence", "seconds"}
+    and a last {"type": "summary", "questions", "seconds", "questions_per_sec", ...}.
+    """
+    if len(req.questions) > settings.ask_batch_max_questions:
+        raise HTTPException(413, f"At most {settings.ask_batch_max_questions} questions per batch")
+    t0 = time.perf_counter()
+    questions = [q.question for q in req.questions]
+    scopes = [q.source_ids if q.source_ids is not None else req.source_ids for q in req.questions]
+    embeddings = await embed_questions(questions)
+    t_embed = time.perf_counter()
+    # Retrieval happens before the response starts so the request-scoped session is not needed afterwards
+    found = await search.hybrid_search_batch_async(
+        db, questions, embeddings, scopes,
+        limit=max(3, min(req.top_k, 12)),
+        fts_weight=req.fts_weight,
+        vector_weight=req.vector_weight,
+        ef_search=req.ef_search,
+        probes=req.probes,
+    )
+    evidence = [pack_evidence(q, e) for q, e in zip(questions, found)]
+    t_retrieval = time.perf_counter()
+    concurrency = req.concurrency or settings.ask_batch_concurrency
+    slots = asyncio.Semaphore(concurrency)
+
+    async def answer(i: int) -> dict:
+        async with slots:
+            line = {"type": "answer", "index": i, "id": req.questions[i].id, "question": questions[i]}
+            try:
+                line.update((await answer_evidence(questions[i], evidence[i])).model_dump())
+            except Exception as e:
+                print(f"/ask/batch question {i} failed: {e}")
+                line.update({"answer": "", "citations": [], "evidence": [], "error": str(e)})
+            line["seconds"] = round(time.perf_counter() - t0, 3)
+            return line
+
+    async def lines():
+        tasks = [asyncio.create_task(answer(i)) for i in range(len(questions))]
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield json.dumps(await done, ensure_ascii=False) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()  # istemci bağlantıyı kapattıysa kalan LLM çağrıları
+        seconds = time.perf_counter() - t0
+        yield json.dumps({
+            "type": "summary",
+            "questions": len(questions),
+            "seconds": round(seconds, 3),
+            "questions_per_sec": round(len(questions) / seconds, 2) if seconds > 0 else None,
+            "embed_seconds": round(t_embed - t0, 3),
+            "retrieval_seconds": round(t_retrieval - t_embed, 3),
+            "concurrency": concurrency,
+        }) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/ask/stream")
+async def ask_stream(req: AskRequest, db: AsyncSession = Depends(get_async_db)):
+    """Same pipeline as /ask, as Server-Sent Events:
+    evidence -> token* -> final {answer, citations} -> done."""
+    # Retrieval happens before the response starts so the request-scoped session is not needed afterwards
+    evidence = await retrieve_evidence(req, db)
+
+    async def events():
+        yield sse_event("evidence", evidence)
+        if not evidence:
+            yield sse_event("final", {"answer": "Bu kaynaklarda bulunamadı", "citations": []})
+            yield sse_event("done", {})
+            return
+        async for event in stream_with_cache(req.question, evidence):
+            if event["type"] == "token":
+                yield sse_event("token", {"text": event["text"]})
+                continue
+            answer = event.get("answer", "")
+            if not answer or not answer.strip():
+                final = {"answer": "Bu kaynaklarda bulunamadı", "citations": []}
+            else:
+                final = {"answer": answer, "citations": event.get("citations") or evidence_citations(evidence)}
+            yield sse_event("final", final)
+        yield sse_event("done", {})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _reindex_out(run) -> ReindexRunOut:
+    return ReindexRunOut(
+        id=run.id, kind=run.kind, document_id=run.document_id, model=run.model, dim=run.dim,
+        status=reindex.run_status(run), phase=run.phase, total=run.total, done=run.done, failed=run.failed,
+        last_id=run.last_id, eta_seconds=reindex.run_eta_seconds(run), error=run.error
+    )
+
+@app.post("/reindex", response_model=ReindexRunOut)
+async def reindex_embeddings(doc_id: int | None = None, batch_size: int | None = None, model: str | None = None, dim: int | None = None):
+    """Start a background reindex run (see reindex.py); poll GET /reindex/{run_id}.
+    Without model/dim: embed chunks that have no embedding yet. With a new model or
+    dim: re-embed everything into a shadow column and switch when done."""
     if settings.embeddings_provider.lower() == "none":
         raise HTTPException(400, "Embeddings provider is disabled")
+    try:
+        run = await reindex.start(doc_id, batch_size, model, dim)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except RuntimeError as e:
+        raise HTTPException(409, str(e))
+    return await asyncio.to_thread(_reindex_out, run)
 
-    query = db.query(Chunk).filter(Chunk.embedding.is_(None))
-    if doc_id is not None:
-        query = query.filter(Chunk.document_id == doc_id)
-
-    total = query.count()
-    updated = 0
-
-    offset = 0
-    while offset < total:
-        batch = query.order_by(Chunk.id).offset(offset).limit(batch_size).all()
-        if not batch:
-            break
-        embeddings = await embed_texts([c.chunk_text for c in batch])
-        if not embeddings:
-            break
-        for c, emb in zip(batch, embeddings):
-            c.embedding = emb
-            updated += 1
-        db.commit()
-        offset += batch_size
-
-    return {"updated": updated}
+@app.get("/reindex", response_model=list[ReindexRunOut])
+def list_reindex_runs():
+    return [_reindex_out(r) for r in reindex.list_runs()]
+
+@app.get("/reindex/{run_id}", response_model=ReindexRunOut)
+def get_reindex_run(run_id: int):
+    run = reindex.get_run(run_id)
+    if not run:
+        raise HTTPException(404, "Reindex run not found")
+    return _reindex_out(run)
+
+@app.post("/reindex/{run_id}/cancel", response_model=ReindexRunOut)
+def cancel_reindex_run(run_id: int):
+    run = reindex.get_run(run_id)
+    if not run:
+        raise HTTPException(404, "Reindex run not found")
+    reindex.cancel(run)
+    return _reindex_out(reindex.get_run(run_id))
+
+@app.post("/reindex/{run_id}/resume", response_model=ReindexRunOut)
+async def resume_reindex_run(run_id: int):
+    run = await asyncio.to_thread(reindex.get_run, run_id)
+    if not run:
+        raise HTTPException(404, "Reindex run not found")
+    try:
+        run = await reindex.resume(run)
+    except RuntimeError as e:
+        raise HTTPException(409, str(e))
+    return await asyncio.to_thread(_reindex_out, run)
@@ -14,5 +14,99 @@ CREATE INDEX IF NOT EXISTS ix_chunks_fts ON chunks USING GIN (fts);
 ALTER TABLE chunks
 ADD COLUMN IF NOT EXISTS embedding vector(1536);
 
+-- ANN index: HNSW + cosine (VECTOR_INDEX_TYPE / VECTOR_METRIC varsayılanları).
+-- Mevcut kurulumlardaki eski ivfflat/L2 indeksi için: POST /admin/vector-index/rebuild
+-- (CONCURRENTLY kurar ve değiştirir; ivfflat seçilirse lists ≈ sqrt(satır) veriyle eğitilir).
+-- VECTOR_STORAGE=halfvec|binary de aynı yolla geçilir: indeks ifade üzerine kurulur
+-- (embedding::halfvec(1536) / binary_quantize(embedding)::bit(1536)), kolon değişmez.
 CREATE INDEX IF NOT EXISTS ix_chunks_embedding
-ON chunks USING ivfflat (embedding vector_l2_ops) WITH (lists = 100);
+ON chunks USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+
+-- Background ingestion: documents.ingest_status (ingest_jobs tablosu create_all ile oluşur)
+ALTER TABLE documents
+ADD COLUMN IF NOT EXISTS ingest_status varchar(32) NOT NULL DEFAULT 'done';
+
+-- /ask cache invalidation: per-document index generation
+CREATE SEQUENCE IF NOT EXISTS index_generation_seq;
+ALTER TABLE documents
+ADD COLUMN IF NOT EXISTS index_generation bigint NOT NULL DEFAULT nextval('index_generation_seq');
+
+-- Content-addressed ingestion: upload hash (duplicate check) and per-page fingerprints
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_sha256 varchar(64);
+CREATE INDEX IF NOT EXISTS ix_documents_content_sha256 ON documents (content_sha256);
+ALTER TABLE pages ADD COLUMN IF NOT EXISTS content_hash varchar(64);
+
+-- Blob store: large-object reference, size and upload time (/files Range, Last-Modified)
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS blob_oid bigint;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS file_size bigint;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS uploaded_at timestamptz;
+UPDATE documents SET uploaded_at = created_at WHERE uploaded_at IS NULL;
+ALTER TABLE documents ALTER COLUMN uploaded_at SET DEFAULT now();
+
+-- PDF bytes out of the documents row: legacy bytea (file_data) rows move into large
+-- objects (hash and size filled on the way), then the column is dropped. Afterwards
+-- run VACUUM FULL documents (or pg_repack) to give the TOAST space back.
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM information_schema.columns
+             WHERE table_name = 'documents' AND column_name = 'file_data') THEN
+    UPDATE documents
+    SET blob_oid = lo_from_bytea(0, file_data),
+        file_size = octet_length(file_data),
+        content_sha256 = coalesce(content_sha256, encode(sha256(file_data), 'hex'))
+    WHERE file_data IS NOT NULL AND blob_oid IS NULL;
+    ALTER TABLE documents DROP COLUMN file_data;
+  END IF;
+END $$;
+
+-- Structure chunker (CHUNKER=structure): per-page headings the chunks were cut by
+ALTER TABLE pages ADD COLUMN IF NOT EXISTS headings jsonb;
+
+-- Lexical search (search.py): accent folding and a ranked trigram fallback.
+-- unaccent: chunks.fts also gets the lexemes of the accent-folded text (turkish_unaccent),
+--   so "seriat" finds "şerîat"; the plain turkish lexemes stay, so the stemmer still
+--   sees Turkish letters. The column is rebuilt once (rewrites chunks).
+-- pg_trgm: trigram index for words FTS doesn't match (typos, partial words).
+-- Both are contrib extensions; without them search.py keeps 'turkish' and ILIKE.
+DO $$
+DECLARE
+  body text;
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'unaccent') THEN
+    CREATE EXTENSION IF NOT EXISTS unaccent;
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'turkish_unaccent') THEN
+      CREATE TEXT SEARCH CONFIGURATION turkish_unaccent (COPY = turkish);
+      ALTER TEXT SEARCH CONFIGURATION turkish_unaccent
+        ALTER MAPPING FOR hword, hword_part, word WITH unaccent, turkish_stem;
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'chunks' AND column_name = 'fts'
+                     AND generation_expression LIKE '%turkish_unaccent%') THEN
+      DROP INDEX IF EXISTS ix_chunks_fts;
+      ALTER TABLE chunks DROP COLUMN IF EXISTS fts;
+      ALTER TABLE chunks ADD COLUMN fts tsvector GENERATED ALWAYS AS (
+        to_tsvector('turkish', coalesce(chunk_text, ''))
+        || to_tsvector('turkish_unaccent', coalesce(chunk_text, ''))
+      ) STORED;
+      CREATE INDEX ix_chunks_fts ON chunks USING GIN (fts);
+    END IF;
+  ELSE
+    RAISE NOTICE 'unaccent extension not available: FTS keeps the turkish configuration';
+  END IF;
+
+  IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    -- unaccent() is STABLE; an index needs an IMMUTABLE wrapper with the dictionary fixed
+    body := CASE WHEN EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'unaccent')
+                 THEN 'SELECT public.unaccent(''public.unaccent''::regdictionary, $1)'
+                 ELSE 'SELECT $1' END;
+    IF (SELECT prosrc FROM pg_proc WHERE proname = 'rag_unaccent') IS DISTINCT FROM body THEN
+      EXECUTE 'CREATE OR REPLACE FUNCTION rag_unaccent(text) RETURNS text '
+              || 'LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS ' || quote_literal(body);
+      DROP INDEX IF EXISTS ix_chunks_trgm;  -- built with the previous definition
+    END IF;
+    CREATE INDEX IF NOT EXISTS ix_chunks_trgm ON chunks USING GIN (rag_unaccent(chunk_text) gin_trgm_ops);
+  ELSE
+    RAISE NOTICE 'pg_trgm extension not available: FTS misses fall back to ILIKE';
+  END IF;
+END $$;
@@ -1,26 +1,38 @@
-from sqlalchemy import String, Integer, Boolean, Text, DateTime, ForeignKey, Index, LargeBinary
+from sqlalchemy import String, Integer, BigInteger, Boolean, Text, DateTime, ForeignKey, Index, Sequence
 from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from typing import Optional, List
 from pgvector.sqlalchemy import Vector
 from .settings import settings
 from .db import Base
 
+# /ask önbellek invalidasyonu için belge içerik sürümü (cache.py)
+index_generation_seq = Sequence("index_generation_seq", metadata=Base.metadata)
+
 class Document(Base):
+    # Metadata only: PDF bytes live in the blob store (file on disk or a large object,
+    # see blobstore.py), so loading or joining documents never reads them.
     __tablename__ = "documents"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     title: Mapped[str] = mapped_column(String(512), nullable=False)
     filename: Mapped[str] = mapped_column(String(512), nullable=False)
     file_path: Mapped[str] = mapped_column(String(1024), nullable=True)  # Local path (optional)
-    file_data: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)  # PDF binary for cloud
+    blob_oid: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)  # Postgres large object (BLOB_STORE=pg)
+    file_size: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    content_sha256: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, index=True)  # upload bytes; duplicate check, ETag
+    uploaded_at: Mapped[Optional[str]] = mapped_column(DateTime(timezone=True), nullable=True, server_default=func.now())  # Last-Modified
 
     has_text_layer: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
     ocr_status: Mapped[str] = mapped_column(String(32), nullable=False, default="none")  # none|queued|running|done|failed
+    ingest_status: Mapped[str] = mapped_column(String(32), nullable=False, default="done")  # queued|extracting|chunking|embedding|persisting|done|failed
+    index_generation: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default=index_generation_seq.next_value())
 
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
-    pages = relationship("Page", back_populates="document", cascade="all, delete-orphan")
-    chunks = relationship("Chunk", back_populates="document", cascade="all, delete-orphan")
+    # passive_deletes: silinen belgenin sayfa/chunk'ları yüklenmez, FK ON DELETE CASCADE siler
+    pages = relationship("Page", back_populates="document", cascade="all, delete-orphan", passive_deletes=True)
+    chunks = relationship("Chunk", back_populates="document", cascade="all, delete-orphan", passive_deletes=True)
 
 class Page(Base):
     __tablename__ = "pages"
@@ -29,6 +41,8 @@ class Page(Base):
     page_no: Mapped[int] = mapped_column(Integer, nullable=False)
 
     text_raw: Mapped[str] = mapped_column(Text, nullable=True)
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)  # pdf_extract.page_fingerprints
+    headings: Mapped[Optional[list]] = mapped_column(JSONB(none_as_null=True), nullable=True)  # CHUNKER=structure: [[rank, title, paragraph], ...]
     ocr_text: Mapped[str] = mapped_column(Text, nullable=True)  # V2
 
     document = relationship("Document", back_populates="pages")
@@ -42,7 +56,7 @@ class Chunk(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     document_id: Mapped[int] = mapped_column(ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
 
-    # “bölüm” tespiti MVP’de basit: section_path boş olabilir.
+    # "Bölüm > Alt bölüm" (CHUNKER=structure); paragraph chunker'da boş.
     section_path: Mapped[str] = mapped_column(String(1024), nullable=True)
 
     page_start: Mapped[int] = mapped_column(Integer, nullable=False)
@@ -58,3 +72,76 @@ class Chunk(Base):
     __table_args__ = (
         Index("ix_chunks_doc_pages", "document_id", "page_start", "page_end"),
     )
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    document_id: Mapped[int] = mapped_column(ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+
+    status: Mapped[str] = mapped_column(String(32), nullable=False, default="queued")  # queued|running|done|failed
+    stage: Mapped[str] = mapped_column(String(32), nullable=False, default="queued")  # Document.ingest_status ile aynı değerler
+    pages_total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    pages_done: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    started_at: Mapped[Optional[str]] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())  # heartbeat
+    finished_at: Mapped[Optional[str]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_ingest_jobs_status", "status", "id"),
+    )
+
+class ReindexRun(Base):
+    __tablename__ = "reindex_runs"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(16), nullable=False)  # missing | shadow (see reindex.py)
+    document_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # missing: tek belge; None => tümü
+    model: Mapped[str] = mapped_column(String(256), nullable=False)
+    dim: Mapped[int] = mapped_column(Integer, nullable=False)
+    batch_size: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    status: Mapped[str] = mapped_column(String(32), nullable=False, default="running")  # running|done|failed|cancelled|interrupted
+    phase: Mapped[str] = mapped_column(String(32), nullable=False, default="embed")  # embed|catchup|index|switch|backfill|done
+    last_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)  # keyset checkpoint of the current phase
+    total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    done: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    cancel_requested: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    started_at: Mapped[Optional[str]] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    finished_at: Mapped[Optional[str]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+class EmbeddingCacheEntry(Base):
+    __tablename__ = "embedding_cache"
+    # sha256(model | dim | normalized chunk text)
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    model: Mapped[str] = mapped_column(String(256), nullable=False)
+    dim: Mapped[int] = mapped_column(Integer, nullable=False)
+    embedding: Mapped[List[float]] = mapped_column(Vector(), nullable=False)
+
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    last_used_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_embedding_cache_last_used", "last_used_at"),
+    )
+
+class AnswerCacheEntry(Base):
+    __tablename__ = "answer_cache"
+    # sha256(chat model | prompt version | question | ordered evidence chunk ids)
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    chat_model: Mapped[str] = mapped_column(String(256), nullable=False)
+    result: Mapped[dict] = mapped_column(JSONB, nullable=False)
+
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    expires_at: Mapped[str] = mapped_column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_answer_cache_expires", "expires_at"),
+    )
@@ -0,0 +1,192 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from .blobstore import read_range
+from .models import Document
+from .pdf_extract import get_executor, render_page
+from .settings import settings
+
+# Rendered page images for citation previews (/documents/{id}/pages/{n}/image).
+# Pages are rendered by the PDF process pool and kept in a size-bounded on-disk LRU
+# under FILES_DIR/page_cache:
+#   img/<key[:2]>/<key>/<page>-<dpi>.<fmt>   rendered pages
+#   pdf/<key>.pdf                           local copy of a large-object PDF (workers open by path)
+# key is the document's content sha256, so entries never go stale: a revised
+# edition (/upload?replaces=) gets a new key and the old entries age out.
+# Reads bump the file mtime; once the total passes PAGE_CACHE_MAX_MB the least
+# recently used files are removed down to 90%; files used in the last
+# _EVICT_GRACE_SECONDS are kept so a PDF copy isn't removed between spill and render.
+# Several processes may share the directory; each one rescans it before evicting.
+
+_EVICT_GRACE_SECONDS = 30
+
+class DiskLRU:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def path(self, rel: str) -> str:
+        return os.path.join(self.root, rel)
+
+    def _scan(self) -> List[Tuple[float, int, str]]:
+        out = []
+        for d, _, files in os.walk(self.root):
+            for name in files:
+                p = os.path.join(d, name)
+                try:
+                    st = os.stat(p)
+                except FileNotFoundError:
+                    continue
+                out.append((st.st_mtime, st.st_size, p))
+        return out
+
+    def get(self, rel: str) -> Optional[bytes]:
+        p = self.path(rel)
+        try:
+            with open(p, "rb") as f:
+                data = f.read()
+            os.utime(p)  # LRU: son erişim
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def touch(self, rel: str) -> bool:
+        try:
+            os.utime(self.path(rel))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, rel: str, data: bytes) -> None:
+        p = self.path(rel)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(p))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        self.adopt(rel, tmp)
+
+    def adopt(self, rel: str, tmp_path: str) -> None:
+        """Move a finished file (same filesystem) into the cache."""
+        p = self.path(rel)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        n = os.path.getsize(tmp_path)
+        os.replace(tmp_path, p)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(s for _, s, _ in self._scan())
+            else:
+                self._size += n
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        entries = sorted(self._scan())
+        total = sum(s for _, s, _ in entries)
+        target = self.max_bytes * 0.9
+        recent = time.time() - _EVICT_GRACE_SECONDS
+        for mtime, size, p in entries:
+            if total <= target or mtime > recent:
+                break
+            try:
+                os.remove(p)
+                total -= size
+                self.evicted += 1
+            except FileNotFoundError:
+                pass
+        self._size = total
+
+    def info(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "dir": self.root,
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evicted": self.evicted,
+        }
+
+page_cache = DiskLRU(os.path.join(settings.files_dir, "page_cache"), settings.page_cache_max_mb * 1024 * 1024)
+
+# Aynı sayfa için eşzamanlı istekler tek render'ı bekler
+_inflight: Dict[str, asyncio.Future] = {}
+
+async def _once(rel: str, make: Callable[[], Awaitable[None]]) -> None:
+    fut = _inflight.get(rel)
+    if fut is not None:
+        return await asyncio.shield(fut)
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[rel] = fut
+    try:
+        await make()
+        fut.set_result(None)
+    except BaseException as e:
+        fut.set_exception(e)
+        fut.exception()  # bekleyen yoksa "never retrieved" uyarısı olmasın
+        raise
+    finally:
+        del _inflight[rel]
+
+def content_key(doc: Document) -> str:
+    if doc.content_sha256:
+        return doc.content_sha256
+    # Hash'siz eski dosyalar: belge + yükleme zamanı
+    return f"doc{doc.id}-{int((doc.uploaded_at or doc.created_at).timestamp())}"
+
+async def _pdf_path(doc: Document, key: str) -> str:
+    if doc.blob_oid is None:
+        return doc.file_path
+    rel = f"pdf/{key}.pdf"
+    if page_cache.touch(rel):
+        return page_cache.path(rel)
+
+    async def spill() -> None:
+        d = os.path.dirname(page_cache.path(rel))
+        os.makedirs(d, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix=".pdf", dir=d)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for piece in read_range(doc, 0, doc.file_size - 1):
+                    await asyncio.to_thread(f.write, piece)
+            await asyncio.to_thread(page_cache.adopt, rel, tmp)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    await _once(rel, spill)
+    return page_cache.path(rel)
+
+async def page_image(doc: Document, page_no: int, dpi: int, fmt: str) -> bytes:
+    """Rendered page from the cache, rendering it in the process pool on a miss."""
+    key = content_key(doc)
+    rel = f"img/{key[:2]}/{key}/{page_no}-{dpi}.{fmt}"
+    data = await asyncio.to_thread(page_cache.get, rel)
+    if data is not None:
+        return data
+
+    async def render() -> None:
+        nonlocal data
+        path = await _pdf_path(doc, key)
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(get_executor(), render_page, path, page_no, dpi, fmt)
+        await asyncio.to_thread(page_cache.put, rel, data)
+
+    await _once(rel, render)
+    if data is None:
+        # Aynı sayfayı başka bir istek render etti
+        data = await asyncio.to_thread(page_cache.get, rel)
+    if data is None:
+        await render()  # ...ve o arada evict edildi
+    return data
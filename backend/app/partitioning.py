@@ -0,0 +1,187 @@
+"""Convert chunks between the plain and the hash-partitioned layout.
+
+    python -m app.partitioning status
+    python -m app.partitioning hash --partitions 16
+    python -m app.partitioning plain
+    python -m app.partitioning drop-old
+
+Hash layout: chunks is PARTITION BY HASH (document_id) into chunks_h<n>_<i>. A
+document's chunks live in one partition, so a scoped search (source_ids) and
+deleting a document only touch the partitions of those documents; unscoped vector
+search merges one ANN scan per partition (keep n small: 8-32). The primary key
+becomes (id, document_id); chunk ids keep coming from the same sequence.
+
+The conversion copies chunks into a new table in one transaction: chunks is locked
+in SHARE mode (searches go on, ingestion and reindex writes wait), indexes are
+built on the copy (non-concurrently, the copy is invisible until commit), then the
+tables are swapped by renaming. The previous table stays as chunks_old, without its
+foreign key, until `drop-old` (or --drop-old). Not while a reindex shadow column
+exists; shares the advisory lock of index rebuilds and reindex switches.
+"""
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+from sqlalchemy import text
+from .db import engine
+from . import vector_index
+from .reindex import SHADOW_COLUMN
+
+OLD_TABLE = "chunks_old"
+_NEW_TABLE = "chunks_new"
+
+def layout(conn, table: str = "chunks") -> Dict[str, Any]:
+    strategy = conn.execute(text("""
+        SELECT p.partstrat FROM pg_partitioned_table p WHERE p.partrelid = CAST(:t AS regclass)
+    """), {"t": table}).scalar()
+    parts = vector_index.partitions(conn, table)
+    return {"layout": {"h": "hash", "l": "list", "r": "range"}.get(strategy, "plain"), "partitions": len(parts)}
+
+def status() -> Dict[str, Any]:
+    with engine.connect() as conn:
+        out = layout(conn)
+        out["rows"] = conn.execute(text("SELECT count(*) FROM chunks")).scalar()
+        if out["partitions"]:
+            sizes = [r[0] for r in conn.execute(text("""
+                SELECT s.n_live_tup FROM pg_partition_tree('chunks') t
+                JOIN pg_stat_user_tables s ON s.relid = t.relid WHERE t.isleaf
+            """))]
+            out["partition_rows"] = {"min": min(sizes), "max": max(sizes)} if sizes else None
+        out["old_table"] = conn.execute(text("SELECT to_regclass(:t) IS NOT NULL"), {"t": OLD_TABLE}).scalar()
+    return out
+
+def _copy_columns(conn) -> List[str]:
+    # Üretilen kolonlar (fts) kopyalanmaz, yeni tabloda yeniden hesaplanır
+    return [r[0] for r in conn.execute(text("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = 'chunks'::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = ''
+        ORDER BY attnum
+    """))]
+
+def _secondary_indexes(conn) -> List[Dict[str, str]]:
+    """Indexes of chunks other than the primary key and the ANN index, with their definitions."""
+    return [dict(r) for r in conn.execute(text("""
+        SELECT c.relname AS name, pg_get_indexdef(i.indexrelid) AS definition
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = 'chunks'::regclass AND NOT i.indisprimary AND c.relname <> :vec
+        ORDER BY c.relname
+    """), {"vec": vector_index.INDEX_NAME}).mappings()]
+
+def _index_on(definition: str, table: str) -> str:
+    # "CREATE INDEX ix ON [ONLY] public.chunks USING ..." -> aynı indeks <table> üzerinde
+    head, _, tail = definition.partition(" USING ")
+    head = head.split(" ON ", 1)[0]
+    return f"{head} ON {table} USING {tail}"
+
+def convert(target: str, n_partitions: int = 16, lock_timeout: str = "10s") -> Dict[str, Any]:
+    """Rewrite chunks as `target` ("hash" with n_partitions, or "plain"). Blocking."""
+    t0 = time.perf_counter()
+    conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        if not vector_index.try_lock(conn):
+            raise RuntimeError("an index rebuild or reindex switch is running")
+        try:
+            current = layout(conn)
+            if (target, n_partitions if target == "hash" else 0) == (current["layout"], current["partitions"]):
+                return {"converted": False, "reason": f"already {target}", **current}
+            if conn.execute(text("SELECT to_regclass(:t) IS NOT NULL"), {"t": OLD_TABLE}).scalar():
+                raise RuntimeError(f"{OLD_TABLE} exists: drop it first (python -m app.partitioning drop-old)")
+            if conn.execute(text("""
+                SELECT 1 FROM pg_attribute WHERE attrelid = 'chunks'::regclass AND attname = :c AND NOT attisdropped
+            """), {"c": SHADOW_COLUMN}).first():
+                raise RuntimeError(f"reindex in progress (chunks.{SHADOW_COLUMN} exists)")
+            with engine.begin() as tx:
+                rows = _rewrite(tx, target, n_partitions, lock_timeout)
+        finally:
+            vector_index.unlock(conn)
+        conn.exec_driver_sql("ANALYZE chunks")
+        return {"converted": True, "rows": rows, "seconds": round(time.perf_counter() - t0, 1), **layout(conn)}
+    finally:
+        conn.close()
+
+def _rewrite(conn, target: str, n_partitions: int, lock_timeout: str) -> int:
+    """The copy and swap; `conn` is in a transaction."""
+    conn.execute(text("SELECT set_config('lock_timeout', :t, true)"), {"t": lock_timeout})
+    conn.exec_driver_sql("LOCK TABLE chunks IN SHARE MODE")
+    columns = ", ".join(_copy_columns(conn))
+    indexes = _secondary_indexes(conn)
+    sequence = conn.execute(text("SELECT pg_get_serial_sequence('chunks', 'id')")).scalar()
+    vector = vector_index.current_index(conn)
+    embedded = conn.execute(text("SELECT count(*) FROM chunks WHERE embedding IS NOT NULL")).scalar()
+
+    like = "LIKE chunks INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING STORAGE INCLUDING COMMENTS"
+    if target == "hash":
+        conn.exec_driver_sql(f"CREATE TABLE {_NEW_TABLE} ({like}) PARTITION BY HASH (document_id)")
+        for i in range(n_partitions):
+            conn.exec_driver_sql(
+                f"CREATE TABLE chunks_h{n_partitions}_{i} PARTITION OF {_NEW_TABLE} "
+                f"FOR VALUES WITH (MODULUS {n_partitions}, REMAINDER {i})"
+            )
+    else:
+        conn.exec_driver_sql(f"CREATE TABLE {_NEW_TABLE} ({like})")
+    rows = conn.execute(text(f"INSERT INTO {_NEW_TABLE} ({columns}) SELECT {columns} FROM chunks")).rowcount
+
+    # İndeksler kopya üzerinde geçici adlarla; eski tablo takas anına kadar okunmaya devam eder
+    pkey = "(id, document_id)" if target == "hash" else "(id)"
+    conn.exec_driver_sql(f"ALTER TABLE {_NEW_TABLE} ADD CONSTRAINT {_NEW_TABLE}_pkey PRIMARY KEY {pkey}")
+    for ix in indexes:
+        conn.exec_driver_sql(_index_on(ix["definition"].replace(f" {ix['name']} ", f" {ix['name']}_new ", 1), _NEW_TABLE))
+    if vector:
+        vector_index.build_index(
+            conn, vector_index.INDEX_NAME + "_new", vector.get("built_rows") or embedded,
+            concurrently=False, table=_NEW_TABLE,
+        )
+    conn.exec_driver_sql(
+        f"ALTER TABLE {_NEW_TABLE} ADD CONSTRAINT {_NEW_TABLE}_document_id_fkey "
+        "FOREIGN KEY (document_id) REFERENCES documents (id) ON DELETE CASCADE"
+    )
+
+    # Takas: eskiler *_old, yeniler asıl adlarını alır
+    for ix in indexes:
+        conn.exec_driver_sql(f"ALTER INDEX {ix['name']} RENAME TO {ix['name']}_old")
+        conn.exec_driver_sql(f"ALTER INDEX {ix['name']}_new RENAME TO {ix['name']}")
+    if vector:
+        vector_index.rename_index(conn, vector_index.INDEX_NAME, vector_index.INDEX_NAME + "_old")
+        vector_index.rename_index(conn, vector_index.INDEX_NAME + "_new", vector_index.INDEX_NAME, table=_NEW_TABLE)
+    conn.exec_driver_sql("ALTER INDEX chunks_pkey RENAME TO chunks_old_pkey")
+    conn.exec_driver_sql("ALTER TABLE chunks DROP CONSTRAINT IF EXISTS chunks_document_id_fkey")
+    conn.exec_driver_sql(f"ALTER TABLE chunks RENAME TO {OLD_TABLE}")
+    conn.exec_driver_sql(f"ALTER TABLE {_NEW_TABLE} RENAME TO chunks")
+    conn.exec_driver_sql(f"ALTER INDEX {_NEW_TABLE}_pkey RENAME TO chunks_pkey")
+    conn.exec_driver_sql(f"ALTER TABLE chunks RENAME CONSTRAINT {_NEW_TABLE}_document_id_fkey TO chunks_document_id_fkey")
+    if sequence:
+        conn.exec_driver_sql(f"ALTER SEQUENCE {sequence} OWNED BY chunks.id")
+    return rows
+
+def drop_old() -> bool:
+    with engine.begin() as conn:
+        if not conn.execute(text("SELECT to_regclass(:t) IS NOT NULL"), {"t": OLD_TABLE}).scalar():
+            return False
+        conn.exec_driver_sql(f"DROP TABLE {OLD_TABLE}")
+    return True
+
+def main() -> None:
+    ap = argparse.ArgumentParser(prog="python -m app.partitioning", description="chunks table layout")
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("status")
+    h = sub.add_parser("hash", help="partition chunks by hash(document_id)")
+    h.add_argument("--partitions", type=int, default=16)
+    p = sub.add_parser("plain", help="back to a single chunks table")
+    for s in (h, p):
+        s.add_argument("--drop-old", action="store_true", help=f"drop {OLD_TABLE} after the swap")
+        s.add_argument("--lock-timeout", default="10s")
+    sub.add_parser("drop-old", help=f"drop {OLD_TABLE}")
+    args = ap.parse_args()
+
+    if args.command == "status":
+        out = status()
+    elif args.command == "drop-old":
+        out = {"dropped": drop_old()}
+    else:
+        out = convert(args.command, getattr(args, "partitions", 0), args.lock_timeout)
+        if out["converted"] and args.drop_old:
+            out["dropped_old"] = drop_old()
+    print(json.dumps(out, indent=2))
+
+if __name__ == "__main__":
+    main()
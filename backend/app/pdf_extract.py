@@ -1,26 +1,272 @@
 import fitz  # PyMuPDF
-from typing import List, Tuple, Union
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import asyncio
+import hashlib
 import io
+import itertools
+import multiprocessing
+import os
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from .settings import settings
 
-def extract_pages_text(pdf_source: Union[str, io.BytesIO]) -> Tuple[bool, List[Tuple[int, str]]]:
+PdfSource = Union[str, io.BytesIO]
+
+def _open(pdf_source: PdfSource) -> fitz.Document:
+    if isinstance(pdf_source, io.BytesIO):
+        return fitz.open(stream=pdf_source.getvalue(), filetype="pdf")
+    return fitz.open(pdf_source)
+
+# ---------------------------------------------------------------------------
+# Structure-aware extraction (CHUNKER=structure, see chunking.StructureChunker).
+# Page text is rebuilt from PyMuPDF text blocks, one paragraph per block ("\n\n"
+# between blocks; plain get_text("text") separates blocks with a single newline).
+# Headings come back as [rank, title, paragraph_index]; a lower rank is a higher
+# level. With an outline (get_toc) rank is the TOC level and the entry is matched
+# to the block that starts with its title; without one, blocks set at least
+# HEADING_SIZE_RATIO x the page's body font size count as headings, rank = -size.
+# ---------------------------------------------------------------------------
+
+HEADING_SIZE_RATIO = 1.15
+
+def _norm(s: str) -> str:
+    return "".join(ch for ch in s.casefold() if ch.isalnum())
+
+def _toc_by_page(doc: fitz.Document) -> Dict[int, List[Tuple[int, str]]]:
+    out: Dict[int, List[Tuple[int, str]]] = {}
+    for level, title, page_no in doc.get_toc(simple=True):
+        if page_no >= 1 and title.strip():
+            out.setdefault(page_no, []).append((level, title.strip()))
+    return out
+
+def page_structure(page: fitz.Page, toc_entries: Optional[List[Tuple[int, str]]] = None) -> Tuple[str, List[list]]:
+    """(text, headings) for one page, see above. toc_entries: this page's outline
+    entries; None => the document has no outline, detect headings by font size."""
+    blocks: List[Tuple[str, float]] = []
+    chars_by_size: Counter = Counter()
+    for b in page.get_text("dict")["blocks"]:
+        if b["type"] != 0:
+            continue
+        lines, size = [], 0.0
+        for line in b["lines"]:
+            t = "".join(span["text"] for span in line["spans"]).strip()
+            if not t:
+                continue
+            lines.append(t)
+            for span in line["spans"]:
+                n = len(span["text"].strip())
+                if n:
+                    chars_by_size[round(span["size"], 1)] += n
+                    size = max(size, span["size"])
+        if lines:
+            blocks.append(("\n".join(lines), round(size, 1)))
+
+    body = chars_by_size.most_common(1)[0][0] if chars_by_size else 0.0
+    by_font = [
+        i for i, (t, size) in enumerate(blocks)
+        if body and size >= body * HEADING_SIZE_RATIO and len(t) <= 200 and t.count("\n") < 3
+    ]
+    headings: List[list] = []
+    if toc_entries is None:
+        headings = [[-blocks[i][1], " ".join(blocks[i][0].split()), i] for i in by_font]
+    else:
+        start = 0
+        for level, title in toc_entries:
+            key = _norm(title)[:40]
+            idx = next((i for i in range(start, len(blocks)) if key and _norm(blocks[i][0]).startswith(key)), None)
+            if idx is None:
+                # Başlık metni eşleşmedi (font kodlaması vb.): sıradaki büyük puntolu blok, yoksa buradan
+                idx = next((i for i in by_font if i >= start), start)
+            headings.append([level, title, idx])
+            start = min(idx + 1, len(blocks))
+    return "\n\n".join(t for t, _ in blocks), headings
+
+def _read_pages(doc: fitz.Document, indexes: Iterable[int], structured: bool) -> Iterator[tuple]:
+    """(page_no, text) per 0-based index, or (page_no, text, headings) when structured."""
+    if not structured:
+        for i in indexes:
+            yield i + 1, (doc[i].get_text("text") or "").strip()
+        return
+    toc = _toc_by_page(doc)
+    for i in indexes:
+        yield (i + 1, *page_structure(doc[i], toc.get(i + 1, []) if toc else None))
+
+def iter_pages_text(pdf_source: PdfSource, structured: bool = False) -> Iterator[tuple]:
+    """Yield (page_no, text) one page at a time; only the current page's text is held.
+    structured=True yields (page_no, text, headings), see page_structure."""
+    doc = _open(pdf_source)
+    try:
+        yield from _read_pages(doc, range(len(doc)), structured)
+    finally:
+        doc.close()
+
+def extract_pages_text(pdf_source: PdfSource) -> Tuple[bool, List[Tuple[int, str]]]:
     """
     Extract text from PDF pages.
     pdf_source can be a file path (str) or BytesIO object.
     Returns: (has_text_layer, [(page_no, text), ...])
     """
+    pages = list(iter_pages_text(pdf_source))
+    return any(t for _, t in pages), pages
+
+def page_fingerprints(pdf_source: PdfSource) -> List[str]:
+    """Per-page sha256 of the decompressed content stream plus page geometry.
+    ~30x cheaper than get_text; an unchanged fingerprint means the page text
+    needn't be extracted again (revised editions, see ingest.py)."""
+    doc = _open(pdf_source)
+    try:
+        out = []
+        for page in doc:
+            h = hashlib.sha256(f"{tuple(page.rect)}|{page.rotation}|".encode())
+            h.update(page.read_contents())
+            out.append(h.hexdigest())
+        return out
+    finally:
+        doc.close()
+
+def extract_pages(pdf_source: PdfSource, page_nos: Iterable[int], structured: bool = False) -> List[tuple]:
+    """(page_no, text) for the given 1-based pages only; (page_no, text, headings) when structured."""
+    doc = _open(pdf_source)
+    try:
+        return list(_read_pages(doc, [n - 1 for n in page_nos], structured))
+    finally:
+        doc.close()
+
+def pdf_page_count(pdf_source: PdfSource) -> int:
+    doc = _open(pdf_source)
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+# ---------------------------------------------------------------------------
+# Parallel extraction: page ranges are sharded across a process pool.
+# Each worker opens the PDF itself from a path; in-memory sources are spilled
+# once to tmpfs (/dev/shm) so workers share the buffer instead of receiving
+# pickled copies of the whole file per shard.
+# ---------------------------------------------------------------------------
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def extract_worker_count() -> int:
+    if settings.extract_workers > 0:
+        return settings.extract_workers
+    return max(1, min(4, os.cpu_count() or 1))
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: uvicorn süreci thread'li, fork güvenli değil
+        _executor = ProcessPoolExecutor(
+            max_workers=extract_worker_count(),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def _extract_range(path: str, start: int, end: int, structured: bool = False) -> List[tuple]:
+    """Worker: extract pages [start, end) (0-based) from the PDF at path."""
+    doc = fitz.open(path)
+    try:
+        return list(_read_pages(doc, range(start, end), structured))
+    finally:
+        doc.close()
+
+def render_page(path: str, page_no: int, dpi: int, fmt: str) -> bytes:
+    """Worker: 1-based page rendered to PNG/JPEG bytes (page_cache.py)."""
+    doc = fitz.open(path)
+    try:
+        if not 1 <= page_no <= len(doc):
+            raise IndexError(f"page {page_no} out of range (1..{len(doc)})")
+        return doc[page_no - 1].get_pixmap(dpi=dpi).tobytes(fmt)
+    finally:
+        doc.close()
+
+def shard_ranges(page_count: int, workers: int, min_pages: int, max_pages: Optional[int] = None) -> List[Tuple[int, int]]:
+    """Split [0, page_count) into contiguous ranges; ~2 shards per worker for load balancing,
+    capped at max_pages per shard so streaming consumers hold a bounded amount of text."""
+    if page_count <= 0:
+        return []
+    shards = max(1, min(workers * 2, page_count // max(1, min_pages)))
+    size = -(-page_count // shards)
+    if max_pages:
+        size = min(size, max_pages)
+    return [(s, min(s + size, page_count)) for s in range(0, page_count, size)]
+
+def _spill_to_shared_file(data: bytes) -> str:
+    shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=shm_dir)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return path
+
+async def aiter_page_batches(
+    pdf_source: PdfSource,
+    workers: Optional[int] = None,
+    batch_pages: Optional[int] = None,
+    structured: bool = False,
+) -> AsyncIterator[List[tuple]]:
+    """Yield batches of (page_no, text) in page order without blocking the event loop.
+    structured=True yields (page_no, text, headings) for the structure chunker.
+
+    Small documents are read sequentially in a thread; larger ones are sharded across
+    the process pool with at most 2 * workers shards in flight, so memory stays
+    bounded by the batch size rather than the document size.
+    """
+    workers = workers or extract_worker_count()
+    batch_pages = batch_pages or settings.extract_batch_pages
+    page_count = await asyncio.to_thread(pdf_page_count, pdf_source)
+
+    if workers <= 1 or page_count < settings.extract_parallel_min_pages:
+        it = iter_pages_text(pdf_source, structured)
+        try:
+            while True:
+                batch = await asyncio.to_thread(lambda: list(itertools.islice(it, batch_pages)))
+                if not batch:
+                    break
+                yield batch
+        finally:
+            it.close()
+        return
+
+    tmp_path = None
     if isinstance(pdf_source, io.BytesIO):
-        doc = fitz.open(stream=pdf_source.read(), filetype="pdf")
+        tmp_path = await asyncio.to_thread(_spill_to_shared_file, pdf_source.getvalue())
+        path = tmp_path
     else:
-        doc = fitz.open(pdf_source)
-    
+        path = pdf_source
+
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    ranges = iter(shard_ranges(page_count, workers, settings.extract_parallel_min_pages // 2, batch_pages))
+    in_flight: List[asyncio.Future] = []
+    try:
+        for start, end in itertools.islice(ranges, workers * 2):
+            in_flight.append(loop.run_in_executor(executor, _extract_range, path, start, end, structured))
+        while in_flight:
+            batch = await in_flight.pop(0)
+            nxt = next(ranges, None)
+            if nxt:
+                in_flight.append(loop.run_in_executor(executor, _extract_range, path, *nxt, structured))
+            yield batch
+    finally:
+        for f in in_flight:
+            f.cancel()
+        if tmp_path:
+            os.remove(tmp_path)
+
+async def extract_pages_text_async(
+    pdf_source: PdfSource,
+    workers: Optional[int] = None,
+) -> Tuple[bool, List[Tuple[int, str]]]:
+    """Non-blocking, parallel variant of extract_pages_text. Same return value, pages in order."""
     pages = []
-    any_text = False
-    for i in range(len(doc)):
-        page = doc[i]
-        text = page.get_text("text") or ""
-        text = text.strip()
-        if text:
-            any_text = True
-        pages.append((i + 1, text))
-    doc.close()
-    return any_text, pages
+    async for batch in aiter_page_batches(pdf_source, workers=workers):
+        pages.extend(batch)
+    return any(t for _, t in pages), pages
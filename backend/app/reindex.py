@@ -0,0 +1,397 @@
+import asyncio
+import json
+import time
+import traceback
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import text
+from .db import SessionLocal, engine
+from .models import ReindexRun
+from .settings import settings
+from .embeddings import embed_texts
+from .bulk import update_embeddings
+from .cache import bump_generation
+from . import vector_index
+
+# Resumable background (re)embedding of chunks.
+#
+# kind=missing fills chunks.embedding where it is NULL (optionally for one document)
+# with the active model. kind=shadow re-embeds every chunk with a new model and/or
+# dimension into chunks.embedding_next, builds the ANN index on it concurrently, then
+# swaps the columns in one short transaction; search uses the old vectors until the
+# swap. Chunks are paged by keyset on chunks.id (no OFFSET, and rows that get filled
+# don't shift the pages). Up to REINDEX_CONCURRENCY embedding batches are in flight
+# while earlier batches are written, in id order. Each write commits the vectors
+# together with the run's checkpoint (reindex_runs.last_id), so a cancelled or
+# interrupted run resumes where it stopped. One run at a time: the run holds an
+# advisory lock for its whole duration.
+#
+# The model/dim of the stored vectors is recorded in the comment of chunks.embedding
+# at the swap; check_model() adopts it at startup so queries are embedded with the
+# same model as the chunks.
+
+SHADOW_COLUMN = "embedding_next"
+_SHADOW_INDEX = vector_index.INDEX_NAME + "_next"
+_LOCK_KEY = 0x7265696E6478  # pg advisory lock: one reindex run at a time across processes
+_SHADOW_PHASES = ["embed", "catchup", "index", "switch", "backfill"]
+
+_tasks: Dict[int, asyncio.Task] = {}
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _quote(s: str) -> str:
+    return "'" + s.replace("'", "''") + "'"
+
+def get_run(run_id: int) -> Optional[ReindexRun]:
+    db = SessionLocal()
+    try:
+        return db.get(ReindexRun, run_id)
+    finally:
+        db.close()
+
+def list_runs(limit: int = 20) -> List[ReindexRun]:
+    db = SessionLocal()
+    try:
+        return db.query(ReindexRun).order_by(ReindexRun.id.desc()).limit(limit).all()
+    finally:
+        db.close()
+
+def _update_run(run_id: int, **fields) -> None:
+    """Update run fields; also acts as heartbeat."""
+    db = SessionLocal()
+    try:
+        sets = ", ".join(f"{k} = :{k}" for k in fields)
+        db.execute(
+            text(f"UPDATE reindex_runs SET {sets}{', ' if sets else ''}updated_at = now() WHERE id = :run_id"),
+            {**fields, "run_id": run_id},
+        )
+        db.commit()
+    finally:
+        db.close()
+
+def _column_info(conn, column: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """(vector dimension, JSON comment) of a chunks column, or None if it doesn't exist."""
+    row = conn.execute(text("""
+        SELECT a.atttypmod, col_description(a.attrelid, a.attnum)
+        FROM pg_attribute a
+        WHERE a.attrelid = 'chunks'::regclass AND a.attname = :col AND NOT a.attisdropped
+    """), {"col": column}).first()
+    if not row:
+        return None
+    try:
+        meta = json.loads(row[1]) if row[1] else {}
+    except ValueError:
+        meta = {}
+    return row[0], meta
+
+def check_model() -> None:
+    """Startup: the stored vectors decide the embedding model (recorded by the last swap)."""
+    with engine.connect() as conn:
+        info = _column_info(conn, "embedding")
+    meta = info[1] if info else {}
+    if meta.get("model") and (meta["model"], meta.get("dim")) != (settings.openai_model, settings.embedding_dim):
+        print(
+            f"chunks.embedding holds {meta['model']} ({meta['dim']}d) vectors, not OPENAI_MODEL="
+            f"{settings.openai_model} ({settings.embedding_dim}d); using {meta['model']}. Update .env."
+        )
+        settings.openai_model, settings.embedding_dim = meta["model"], int(meta["dim"])
+
+# --- lock / status ------------------------------------------------------------
+
+def _acquire_lock():
+    conn = engine.connect()
+    if conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": _LOCK_KEY}).scalar():
+        conn.commit()
+        return conn
+    conn.close()
+    return None
+
+def _release_lock(conn) -> None:
+    try:
+        conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _LOCK_KEY})
+        conn.commit()
+    finally:
+        conn.close()
+
+def busy() -> bool:
+    """A run is active in this process or holds the lock in another one."""
+    if _tasks:
+        return True
+    conn = _acquire_lock()
+    if conn is None:
+        return True
+    _release_lock(conn)
+    return False
+
+def run_status(run: ReindexRun) -> str:
+    # 'running' in the table but nobody holds the lock: the process died mid-run
+    if run.status == "running" and run.id not in _tasks and not busy():
+        return "interrupted"
+    return run.status
+
+def run_eta_seconds(run: ReindexRun) -> Optional[float]:
+    processed = run.done + run.failed
+    if run.status != "running" or not run.started_at or not processed or not run.total:
+        return None
+    elapsed = (_now() - run.started_at).total_seconds()
+    return round(elapsed / processed * max(0, run.total - processed), 1)
+
+# --- control --------------------------------------------------------------------
+
+def _create_run(kind: str, document_id: Optional[int], model: str, dim: int, batch_size: int) -> ReindexRun:
+    db = SessionLocal()
+    try:
+        run = ReindexRun(
+            kind=kind, document_id=document_id, model=model, dim=dim, batch_size=batch_size,
+            status="running", phase="embed", started_at=_now(),
+        )
+        db.add(run)
+        db.commit()
+        db.refresh(run)
+        return run
+    finally:
+        db.close()
+
+def _spawn(run_id: int) -> None:
+    task = asyncio.create_task(_run(run_id))
+    _tasks[run_id] = task
+    task.add_done_callback(lambda _: _tasks.pop(run_id, None))
+
+async def start(
+    document_id: Optional[int] = None, batch_size: Optional[int] = None,
+    model: Optional[str] = None, dim: Optional[int] = None,
+) -> ReindexRun:
+    """Start a run. A model or dim different from the active one means a shadow run.
+    Raises ValueError for invalid arguments, RuntimeError if a run is active."""
+    model = model or settings.openai_model
+    dim = dim or settings.embedding_dim
+    kind = "missing" if (model, dim) == (settings.openai_model, settings.embedding_dim) else "shadow"
+    if kind == "shadow" and document_id is not None:
+        raise ValueError("A model/dimension change re-embeds every chunk; doc_id is not allowed")
+    if await asyncio.to_thread(busy):
+        raise RuntimeError("A reindex run is already running")
+    run = await asyncio.to_thread(_create_run, kind, document_id, model, dim, max(1, batch_size or settings.reindex_batch_size))
+    _spawn(run.id)
+    return run
+
+async def resume(run: ReindexRun) -> ReindexRun:
+    status = await asyncio.to_thread(run_status, run)
+    if status not in ("failed", "cancelled", "interrupted"):
+        raise RuntimeError(f"Run {run.id} is {status}")
+    if await asyncio.to_thread(busy):
+        raise RuntimeError("A reindex run is already running")
+    await asyncio.to_thread(
+        _update_run, run.id, status="running", cancel_requested=False, error=None, finished_at=None,
+    )
+    _spawn(run.id)
+    return await asyncio.to_thread(get_run, run.id)
+
+def cancel(run: ReindexRun) -> None:
+    """Ask the run to stop after its current batch (any process). A dead run is marked directly."""
+    if run_status(run) == "interrupted":
+        _update_run(run.id, status="cancelled", finished_at=_now())
+    elif run.status == "running":
+        _update_run(run.id, cancel_requested=True)
+
+async def stop() -> None:
+    tasks = list(_tasks.values())
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+# --- run ------------------------------------------------------------------------
+
+async def _run(run_id: int) -> None:
+    lock_conn = await asyncio.to_thread(_acquire_lock)
+    if lock_conn is None:
+        await asyncio.to_thread(
+            _update_run, run_id, status="failed", error="another reindex run holds the lock", finished_at=_now(),
+        )
+        return
+    try:
+        run = await asyncio.to_thread(get_run, run_id)
+        if run.kind == "shadow":
+            finished = await _run_shadow(run)
+        else:
+            finished = await _embed_pass(run, "embedding", "embed", run.last_id) is not None
+        if finished:
+            await asyncio.to_thread(_update_run, run_id, status="done", phase="done", finished_at=_now())
+        else:
+            await asyncio.to_thread(_update_run, run_id, status="cancelled", finished_at=_now())
+    except asyncio.CancelledError:
+        # Graceful shutdown: checkpoint is already committed; POST /reindex/{id}/resume continues
+        await asyncio.to_thread(_update_run, run_id, status="interrupted")
+        raise
+    except Exception as e:
+        print(f"Reindex run {run_id} failed: {e}")
+        traceback.print_exc()
+        await asyncio.to_thread(_update_run, run_id, status="failed", error=str(e), finished_at=_now())
+    finally:
+        await asyncio.to_thread(_release_lock, lock_conn)
+
+def _count_pending(column: str, document_id: Optional[int], after: int) -> int:
+    params: Dict[str, Any] = {"after": after}
+    doc_filter = ""
+    if document_id is not None:
+        doc_filter = "AND document_id = :doc"
+        params["doc"] = document_id
+    with engine.connect() as conn:
+        return conn.execute(
+            text(f"SELECT count(*) FROM chunks WHERE id > :after AND {column} IS NULL {doc_filter}"), params
+        ).scalar() or 0
+
+def _fetch_batch(column: str, document_id: Optional[int], after: int, limit: int):
+    # Keyset: id > son görülen id; doldurulan satırlar sonraki sayfaları kaydırmaz
+    params: Dict[str, Any] = {"after": after, "lim": limit}
+    doc_filter = ""
+    if document_id is not None:
+        doc_filter = "AND document_id = :doc"
+        params["doc"] = document_id
+    with engine.connect() as conn:
+        return conn.execute(text(f"""
+            SELECT id, document_id, chunk_text FROM chunks
+            WHERE id > :after AND {column} IS NULL {doc_filter}
+            ORDER BY id
+            LIMIT :lim
+        """), params).all()
+
+def _write_batch(run_id: int, column: str, rows, embeddings) -> bool:
+    """Write one batch and advance the checkpoint in the same transaction. Returns cancel_requested."""
+    pairs = [(r.id, e) for r, e in zip(rows, embeddings)]
+    written = sum(1 for _, e in pairs if e is not None)
+    db = SessionLocal()
+    try:
+        update_embeddings(db, pairs, column=column)
+        if column == "embedding":
+            bump_generation(db, {r.document_id for r, e in zip(rows, embeddings) if e is not None})
+        cancel_requested = db.execute(text("""
+            UPDATE reindex_runs
+            SET last_id = :last_id, done = done + :done, failed = failed + :failed, updated_at = now()
+            WHERE id = :run_id
+            RETURNING cancel_requested
+        """), {"last_id": rows[-1].id, "done": written, "failed": len(pairs) - written, "run_id": run_id}).scalar()
+        db.commit()
+        return bool(cancel_requested)
+    finally:
+        db.close()
+
+async def _embed_pass(run: ReindexRun, column: str, phase: str, after: int) -> Optional[int]:
+    """One keyset pass over chunks whose `column` is NULL, from id `after`.
+    Returns the number of chunks left without a vector (failed batches), None if cancelled."""
+    pending = await asyncio.to_thread(_count_pending, column, run.document_id, after)
+    db = SessionLocal()
+    try:
+        db.execute(
+            text("UPDATE reindex_runs SET phase = :phase, last_id = :after, total = done + failed + :pending, updated_at = now() WHERE id = :id"),
+            {"phase": phase, "after": after, "pending": pending, "id": run.id},
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    # Producer: keyset sayfaları okur ve embedding isteğini hemen başlatır; bir batch'in
+    # slotu yazıldıktan sonra boşalır, böylece en fazla REINDEX_CONCURRENCY batch
+    # (embedding'de ya da yazılmayı bekliyor) havadadır. Tüketici id sırasıyla yazar.
+    slots = asyncio.Semaphore(max(1, settings.reindex_concurrency))
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce() -> None:
+        cursor = after
+        while True:
+            await slots.acquire()
+            rows = await asyncio.to_thread(_fetch_batch, column, run.document_id, cursor, run.batch_size)
+            if not rows:
+                break
+            cursor = rows[-1].id
+            task = asyncio.create_task(embed_texts([r.chunk_text for r in rows], model=run.model, dim=run.dim))
+            await queue.put((rows, task))
+        await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    failed = 0
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            rows, task = item
+            embeddings = await task
+            if embeddings is None:
+                raise RuntimeError("Embeddings provider is disabled or not configured")
+            bad = next((len(e) for e in embeddings if e is not None and len(e) != run.dim), None)
+            if bad is not None:
+                raise RuntimeError(f"{run.model} returned {bad}-dim vectors, expected {run.dim}")
+            failed += sum(1 for e in embeddings if e is None)
+            if await asyncio.to_thread(_write_batch, run.id, column, rows, embeddings):
+                return None
+            slots.release()
+        await producer
+        return failed
+    finally:
+        producer.cancel()
+        while not queue.empty():
+            item = queue.get_nowait()
+            if item is not None:
+                item[1].cancel()
+
+def _ensure_shadow_column(run: ReindexRun) -> None:
+    owner = {"model": run.model, "dim": run.dim, "run": run.id}
+    with engine.begin() as conn:
+        conn.exec_driver_sql("SET LOCAL lock_timeout = '10s'")
+        info = _column_info(conn, SHADOW_COLUMN)
+        if info and info[1] != owner:
+            # Yarım kalmış başka bir denemenin kolonu (farklı model/boyut olabilir)
+            conn.exec_driver_sql(f"ALTER TABLE chunks DROP COLUMN {SHADOW_COLUMN}")
+            info = None
+        if not info:
+            conn.exec_driver_sql(f"ALTER TABLE chunks ADD COLUMN {SHADOW_COLUMN} vector({int(run.dim)})")
+            conn.exec_driver_sql(f"COMMENT ON COLUMN chunks.{SHADOW_COLUMN} IS {_quote(json.dumps(owner))}")
+
+def _build_and_switch(run: ReindexRun) -> None:
+    conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        # Aynı anda bir indeks işlemi: /admin/vector-index/rebuild bitene kadar bekle
+        while not vector_index.try_lock(conn):
+            time.sleep(2)
+        try:
+            if _column_info(conn, SHADOW_COLUMN) is None:
+                return  # takas önceki denemede commit edilmiş
+            _update_run(run.id, phase="index")
+            rows = conn.execute(text(f"SELECT count(*) FROM chunks WHERE {SHADOW_COLUMN} IS NOT NULL")).scalar() or 0
+            vector_index.build_index(conn, _SHADOW_INDEX, rows, column=SHADOW_COLUMN, dim=run.dim)
+
+            _update_run(run.id, phase="switch")
+            meta = json.dumps({"model": run.model, "dim": run.dim})
+            with engine.begin() as tx:
+                # Kısa ACCESS EXCLUSIVE: yalnızca katalog değişiklikleri, tablo yeniden yazılmaz
+                tx.exec_driver_sql("SET LOCAL lock_timeout = '10s'")
+                tx.exec_driver_sql("ALTER TABLE chunks DROP COLUMN embedding")
+                tx.exec_driver_sql(f"ALTER TABLE chunks RENAME COLUMN {SHADOW_COLUMN} TO embedding")
+                vector_index.rename_index(tx, _SHADOW_INDEX, vector_index.INDEX_NAME)
+                tx.exec_driver_sql(f"COMMENT ON COLUMN chunks.embedding IS {_quote(meta)}")
+                tx.execute(text("UPDATE documents SET index_generation = nextval('index_generation_seq')"))
+        finally:
+            vector_index.unlock(conn)
+    finally:
+        conn.close()
+
+async def _run_shadow(run: ReindexRun) -> bool:
+    start = _SHADOW_PHASES.index(run.phase) if run.phase in _SHADOW_PHASES else 0
+    if start <= 1:
+        await asyncio.to_thread(_ensure_shadow_column, run)
+    if start == 0 and await _embed_pass(run, SHADOW_COLUMN, "embed", run.last_id) is None:
+        return False
+    if start <= 1:
+        # Başarısız batch'ler ve pass sırasında eklenen chunk'lar; takastan sonra
+        # eklenenleri backfill doldurur
+        failed = await _embed_pass(run, SHADOW_COLUMN, "catchup", run.last_id if start == 1 else 0)
+        if failed is None:
+            return False
+        if failed:
+            raise RuntimeError(f"{failed} chunks could not be embedded with {run.model}; resume to retry")
+    if start <= 3:
+        await asyncio.to_thread(_build_and_switch, run)
+    settings.openai_model, settings.embedding_dim = run.model, run.dim
+    print(f"Reindex run {run.id}: switched to {run.model} ({run.dim}d). Set OPENAI_MODEL / EMBEDDING_DIM in .env.")
+    return await _embed_pass(run, "embedding", "backfill", run.last_id if start == 4 else 0) is not None
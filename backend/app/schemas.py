@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 
 class DocumentOut(BaseModel):
@@ -6,15 +6,70 @@ class DocumentOut(BaseModel):
     title: str
     filename: str
     has_text_layer: bool
+    ingest_status: str = "done"
 
 class UploadResponse(BaseModel):
     document: DocumentOut
     ingest_started: bool
+    job_id: Optional[int] = None
+    duplicate: bool = False  # same bytes already uploaded; `document` is the existing one
+
+class PageOut(BaseModel):
+    document_id: int
+    page_no: int
+    page_count: int
+    text: Optional[str] = None  # stored text layer (pages.text_raw)
+    image_url: str  # rendered preview, see /documents/{id}/pages/{n}/image
+
+class JobOut(BaseModel):
+    id: int
+    document_id: int
+    status: str
+    stage: str
+    pages_total: int
+    pages_done: int
+    attempts: int
+    eta_seconds: Optional[float] = None
+    error: Optional[str] = None
+
+class ReindexRunOut(BaseModel):
+    id: int
+    kind: str
+    document_id: Optional[int] = None
+    model: str
+    dim: int
+    status: str
+    phase: str
+    total: int
+    done: int
+    failed: int
+    last_id: int
+    eta_seconds: Optional[float] = None
+    error: Optional[str] = None
 
 class AskRequest(BaseModel):
     question: str
     source_ids: Optional[List[int]] = None  # None => all
     top_k: int = 8
+    fts_weight: Optional[float] = Field(None, ge=0)  # None => HYBRID_FTS_WEIGHT
+    vector_weight: Optional[float] = Field(None, ge=0)  # None => HYBRID_VECTOR_WEIGHT
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)  # HNSW recall/latency; None => HNSW_EF_SEARCH
+    probes: Optional[int] = Field(None, ge=1, le=32768)  # IVFFlat recall/latency; None => IVFFLAT_PROBES
+
+class AskBatchItem(BaseModel):
+    question: str
+    id: Optional[str] = None  # echoed on the result line (results arrive in completion order)
+    source_ids: Optional[List[int]] = None  # None => the batch's source_ids
+
+class AskBatchRequest(BaseModel):
+    questions: List[AskBatchItem] = Field(..., min_length=1)  # at most ASK_BATCH_MAX_QUESTIONS
+    source_ids: Optional[List[int]] = None  # scope of questions without their own; None => all
+    top_k: int = 8
+    fts_weight: Optional[float] = Field(None, ge=0)
+    vector_weight: Optional[float] = Field(None, ge=0)
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)
+    probes: Optional[int] = Field(None, ge=1, le=32768)
+    concurrency: Optional[int] = Field(None, ge=1, le=64)  # LLM calls in flight; None => ASK_BATCH_CONCURRENCY
 
 class CitationOut(BaseModel):
     document_id: int
@@ -25,6 +80,7 @@ class CitationOut(BaseModel):
 
 class EvidenceOut(BaseModel):
     chunk_id: int
+    chunk_ids: List[int] = []  # every chunk merged into this block (evidence.py)
     document_id: int
     document_title: str
     section_path: Optional[str] = None
@@ -37,11 +93,22 @@ class AskResponse(BaseModel):
     citations: List[CitationOut]
     evidence: List[EvidenceOut]
 
+class ChatRoute(BaseModel):
+    base_url: str
+    model: str
+    api_key: Optional[str] = None  # None => chat_api_key
+
+class ChatRouteOut(BaseModel):
+    base_url: str
+    model: str
+
 class LLMSettingsUpdate(BaseModel):
     chat_base_url: Optional[str] = None
     chat_api_key: Optional[str] = None
     chat_model: Optional[str] = None
+    chat_fallbacks: Optional[List[ChatRoute]] = None  # tried in order when the chat model fails; [] => none
 
 class LLMSettingsOut(BaseModel):
     chat_base_url: str
     chat_model: str
+    chat_fallbacks: List[ChatRouteOut] = []
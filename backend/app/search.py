@@ -1,130 +1,496 @@
+import asyncio
+import re
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
+from .db import AsyncSessionLocal, engine
+from . import vector_index
+from .settings import settings
+from .vector_store import vector_store
 
-def fts_search(db: Session, question: str, source_ids: Optional[List[int]] = None, limit: int = 10) -> List[Dict[str, Any]]:
-    # plainto_tsquery('turkish', :q)
+# Every search has a sync version (ingestion, benches, admin endpoints) and an async
+# version (request path, see db.get_async_db). Both execute the same statements,
+# built by the _*_query helpers below.
+
+_COLUMNS = """
+    c.id, c.document_id, c.section_path, c.page_start, c.page_end, c.chunk_text,
+    d.title as document_title
+"""
+
+def _source_filter(source_ids: Optional[List[int]], params: Dict[str, Any]) -> str:
+    if not source_ids:
+        return ""
+    params["source_ids"] = source_ids
+    return "AND c.document_id = ANY(:source_ids)"
+
+# Scoped vector search: the ANN index is walked over the whole corpus and the
+# document filter applied afterwards, so a few selected documents can get fewer
+# than k rows (IVFFlat probes, HNSW ef_search). When the scope has at most
+# SCOPED_EXACT_MAX_ROWS chunks they are scored exactly instead (one count query
+# first, cut at the limit). Before that, vector_store scores scopes of up to
+# VECTOR_STORE_MAX_ROWS chunks in-process; its top-k joins the query as rows.
+def _scope_count_query(source_ids: List[int]) -> Tuple[Any, Dict[str, Any]]:
+    return text("""
+        SELECT count(*) FROM (
+            SELECT 1 FROM chunks c WHERE c.document_id = ANY(:source_ids) LIMIT :cap
+        ) s
+    """), {"source_ids": source_ids, "cap": settings.scoped_exact_max_rows + 1}
+
+def _exact_scope(db: Session, source_ids: Optional[List[int]]) -> bool:
+    if not source_ids or settings.scoped_exact_max_rows <= 0:
+        return False
+    return db.execute(*_scope_count_query(source_ids)).scalar() <= settings.scoped_exact_max_rows
+
+# Lexical search. The question is parsed once per query (websearch_to_tsquery:
+# "quoted phrases", OR, -word) and ranked by cover density (ts_rank_cd). What the
+# database offers is read once (lexical_features): with unaccent, chunks.fts also
+# holds accent-folded lexemes and the query is parsed both ways; with pg_trgm,
+# questions FTS doesn't match go to a ranked trigram search instead of ILIKE.
+_lexical: Optional[Dict[str, bool]] = None
+_WORD = re.compile(r"\w+")
+# Trigram tokens: soru kalıpları ve bağlaçlar her chunk'ta geçer, aday kümesini şişirir
+_TRIGRAM_STOPWORDS = {
+    "nedir", "nasıl", "neden", "niçin", "hangi", "hangisi", "kimdir", "nerede", "zaman", "olan", "olarak",
+    "için", "gibi", "daha", "veya", "fakat", "çünkü", "kadar", "sonra", "önce", "bunun", "şunun",
+}
+
+def lexical_features() -> Dict[str, bool]:
+    global _lexical
+    if _lexical is None:
+        with engine.connect() as conn:
+            expr = conn.execute(text(
+                "SELECT generation_expression FROM information_schema.columns WHERE table_name = 'chunks' AND column_name = 'fts'"
+            )).scalar() or ""
+            trigram = conn.execute(text(
+                "SELECT count(*) FROM pg_indexes WHERE tablename = 'chunks' AND indexname = 'ix_chunks_trgm'"
+            )).scalar()
+        _lexical = {"unaccent": "turkish_unaccent" in expr, "trigram": bool(trigram)}
+    return _lexical
+
+def check_lexical() -> Dict[str, bool]:
+    """Startup check: which lexical features migrate.sql could install."""
+    global _lexical
+    _lexical = None
+    features = lexical_features()
+    missing = [name for name, ok in (("unaccent", features["unaccent"]), ("pg_trgm", features["trigram"])) if not ok]
+    if missing:
+        print(f"Lexical search without {', '.join(missing)}: install the extension(s) and run app/migrate.sql")
+    return features
+
+def _tsquery_sql(q: str = ":q") -> str:
+    if lexical_features()["unaccent"]:
+        return f"websearch_to_tsquery('turkish', {q}) || websearch_to_tsquery('turkish_unaccent', {q})"
+    return f"websearch_to_tsquery('turkish', {q})"
+
+def _fts_query(question: str, source_ids: Optional[List[int]], limit: int) -> Tuple[Any, Dict[str, Any]]:
+    params: Dict[str, Any] = {"q": question, "lim": limit}
+    sql = text(f"""
+        SELECT {_COLUMNS}
+        FROM chunks c
+        JOIN documents d ON d.id = c.document_id
+        CROSS JOIN (SELECT {_tsquery_sql()} AS query) q
+        WHERE c.fts @@ q.query
+          {_source_filter(source_ids, params)}
+        ORDER BY ts_rank_cd(c.fts, q.query) DESC, c.id
+        LIMIT :lim
+    """)
+    return sql, params
+
+def _trigram_tokens(question: str) -> List[str]:
+    words = {w for w in _WORD.findall((question or "").lower()) if len(w) >= 4 and w not in _TRIGRAM_STOPWORDS}
+    return sorted(words, key=lambda w: (-len(w), w))[:6]
+
+def _trigram_terms(question: str, params: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    # Each token: word_similarity against the accent-folded text (u.folded); rows must be
+    # close to at least one token (<%, GIN ix_chunks_trgm) and rank by the summed similarity.
+    tokens = _trigram_tokens(question)
+    if not tokens:
+        return None
+    matches, scores = [], []
+    for i, t in enumerate(tokens):
+        params[f"t{i}"] = t
+        matches.append(f"rag_unaccent(:t{i}) <% rag_unaccent(c.chunk_text)")
+        scores.append(f"word_similarity(rag_unaccent(:t{i}), u.folded)")
+    return " OR ".join(matches), " + ".join(scores)
+
+def _trigram_query(question: str, source_ids: Optional[List[int]], limit: int) -> Optional[Tuple[Any, Dict[str, Any]]]:
+    params: Dict[str, Any] = {"lim": limit}
+    terms = _trigram_terms(question, params)
+    if not terms:
+        return None
+    match, score = terms
+    sql = text(f"""
+        SELECT {_COLUMNS}
+        FROM chunks c
+        JOIN documents d ON d.id = c.document_id
+        CROSS JOIN LATERAL (SELECT rag_unaccent(c.chunk_text) AS folded) u
+        WHERE ({match})
+          {_source_filter(source_ids, params)}
+        ORDER BY {score} DESC, c.id
+        LIMIT :lim
+    """)
+    return sql, params
+
+def _fallback_query(question: str, source_ids: Optional[List[int]], limit: int) -> Optional[Tuple[Any, Dict[str, Any]]]:
+    if lexical_features()["trigram"]:
+        return _trigram_query(question, source_ids, limit)
+    return _ilike_query(question, source_ids, limit)
+
+def _ilike_query(question: str, source_ids: Optional[List[int]], limit: int) -> Optional[Tuple[Any, Dict[str, Any]]]:
+    # Fallback without pg_trgm: unranked ILIKE (sequential scan)
     tokens = [t for t in (question or "").split() if len(t) >= 3]
     patterns = [f"%{t}%" for t in tokens[:8]]
+    if not patterns:
+        patterns = [f"%{question}%"] if question else []
+    if not patterns:
+        return None
+    params: Dict[str, Any] = {"patterns": patterns, "lim": limit}
+    sql = text(f"""
+        SELECT {_COLUMNS}
+        FROM chunks c
+        JOIN documents d ON d.id = c.document_id
+        WHERE c.chunk_text ILIKE ANY(:patterns)
+          {_source_filter(source_ids, params)}
+        ORDER BY c.id DESC
+        LIMIT :lim
+    """)
+    return sql, params
+
+def _nearest(
+    params: Dict[str, Any], source_filter: str, exact: bool, hits: Optional[List[Tuple[int, float]]],
+) -> str:
+    """The id, dist subquery: pgvector (ANN or exact), or the in-process top-k (vector_store) as rows."""
+    if hits is None:
+        return vector_index.nearest_sql(where=source_filter, exact=exact)
+    params["hit_ids"] = [h[0] for h in hits]
+    params["hit_dists"] = [h[1] for h in hits]
+    return "SELECT id, dist FROM unnest(CAST(:hit_ids AS int[]), CAST(:hit_dists AS float8[])) AS h(id, dist)"
+
+def _vector_params(query_embedding: List[float], k: int) -> Dict[str, Any]:
+    # k_ann: halfvec/binary depolamada indeksten okunup tam vektörle yeniden sıralanan aday sayısı
+    return {"qvec": query_embedding, "k": k, "k_ann": vector_index.rerank_candidates(k)}
+
+def _vector_query(
+    query_embedding: List[float], source_ids: Optional[List[int]], limit: int, exact: bool = False,
+    hits: Optional[List[Tuple[int, float]]] = None,
+) -> Tuple[Any, Dict[str, Any]]:
+    params = _vector_params(query_embedding, limit)
+    nearest = _nearest(params, _source_filter(source_ids, params), exact, hits)
+    sql = text(f"""
+        SELECT {_COLUMNS}
+        FROM ({nearest}) n
+        JOIN chunks c ON c.id = n.id
+        JOIN documents d ON d.id = c.document_id
+        ORDER BY n.dist, c.id
+    """)
+    return sql, params
+
+# Tek round-trip: FTS top-K (GIN fts) ve vektör top-K (ANN indeksi) ayrı CTE'lerde,
+# RRF ile birleştirilir, documents yalnızca nihai sonuç için bir kez join edilir.
+# İç alt sorgular ORDER BY ... LIMIT olarak kalır ki planner indeksleri kullanabilsin;
+# row_number() sadece bu K satır üzerinde hesaplanır.
+# pg_trgm varsa lexical bacak fts_search gibi davranır: tsquery hiçbir satır bulamazsa
+# trigram top-K ({trigram}, NOT EXISTS tek seferlik filtre) onun yerine geçer.
+_HYBRID_SQL = """
+    WITH fts_hits AS (
+        SELECT c.id, ts_rank_cd(c.fts, q.query) AS rank
+        FROM chunks c, (SELECT {tsquery} AS query) q
+        WHERE c.fts @@ q.query {source_filter}
+        ORDER BY rank DESC, c.id
+        LIMIT :k
+    ),{trigram}
+    fts AS (
+        SELECT id, row_number() OVER (ORDER BY rank DESC, id) AS rnk
+        FROM ({lexical}) t
+    ),
+    vec AS (
+        SELECT id, row_number() OVER (ORDER BY dist, id) AS rnk
+        FROM ({nearest}
+        ) t
+    ),
+    fused AS (
+        SELECT id, sum(score) AS score
+        FROM (
+            SELECT id, :w_fts / (:rrf_k + rnk) AS score FROM fts
+            UNION ALL
+            SELECT id, :w_vec / (:rrf_k + rnk) AS score FROM vec
+        ) s
+        GROUP BY id
+    )
+    SELECT c.id, c.document_id, c.section_path, c.page_start, c.page_end, c.chunk_text,
+           d.title AS document_title, f.score
+    FROM fused f
+    JOIN chunks c ON c.id = f.id
+    JOIN documents d ON d.id = c.document_id
+    ORDER BY f.score DESC, c.id
+    LIMIT :lim
+"""
+_FTS_HITS = "SELECT id, rank FROM fts_hits"
+_WITH_TRIGRAM = _FTS_HITS + " UNION ALL SELECT id, rank FROM trgm"
+
+def _hybrid_trigram(question: str, params: Dict[str, Any], source_filter: str) -> str:
+    terms = _trigram_terms(question, params) if lexical_features()["trigram"] else None
+    if not terms:
+        return ""
+    match, score = terms
+    return f"""
+    trgm AS (
+        SELECT c.id, {score} AS rank
+        FROM chunks c CROSS JOIN LATERAL (SELECT rag_unaccent(c.chunk_text) AS folded) u
+        WHERE NOT EXISTS (SELECT 1 FROM fts_hits) AND ({match}) {source_filter}
+        ORDER BY rank DESC, c.id
+        LIMIT :k
+    ),"""
+
+def _hybrid_query(
+    question: str, query_embedding: List[float], source_ids: Optional[List[int]],
+    limit: int, k: int, w_fts: float, w_vec: float, exact: bool = False,
+    hits: Optional[List[Tuple[int, float]]] = None,
+) -> Tuple[Any, Dict[str, Any]]:
+    params: Dict[str, Any] = {
+        **_vector_params(query_embedding, k), "q": question, "lim": limit,
+        "w_fts": float(w_fts), "w_vec": float(w_vec), "rrf_k": float(settings.hybrid_rrf_k),
+    }
+    source_filter = _source_filter(source_ids, params)
+    trigram = _hybrid_trigram(question, params, source_filter)
+    sql = _HYBRID_SQL.format(
+        tsquery=_tsquery_sql(), source_filter=source_filter, trigram=trigram,
+        lexical=_WITH_TRIGRAM if trigram else _FTS_HITS, nearest=_nearest(params, source_filter, exact, hits),
+    )
+    return text(sql), params
+
+# Batch retrieval (/ask/batch): the hybrid search of every question in one statement.
+# Questions arrive as parallel arrays (unnest ... WITH ORDINALITY, b.i from 0); each
+# runs the legs of _HYBRID_SQL in a LATERAL subquery. There b.* are parameters of the
+# subquery, so the branch conditions (has a vector, scoped or not, exact or ANN) become
+# one-time filters: per question only the branch that applies touches chunks.
+# The exact decision is _exact_scope's count, per question, inside the same statement.
+# With pg_trgm each question also carries its trigram tokens (b.tokens); the trgm leg
+# only runs for questions whose tsquery matched nothing, like _HYBRID_SQL.
+# vector_store is not consulted (its top-k would be one more round trip per question).
+_BATCH_SQL = """
+    WITH b AS MATERIALIZED (
+        SELECT u.i - 1 AS i, {tsquery} AS query, CAST(u.v AS vector) AS qvec, CAST(u.s AS int[]) AS source_ids,
+               CAST(u.t AS text[]) AS tokens,
+               u.s IS NOT NULL AND (
+                   SELECT count(*) FROM (
+                       SELECT 1 FROM chunks c WHERE c.document_id = ANY(CAST(u.s AS int[])) LIMIT :cap
+                   ) n
+               ) <= :exact_max AS exact
+        FROM unnest(CAST(:b_q AS text[]), CAST(:b_vec AS text[]), CAST(:b_scope AS text[]),
+                    CAST(:b_tok AS text[]))
+             WITH ORDINALITY AS u(q, v, s, t, i)
+    )
+    SELECT b.i, r.*
+    FROM b CROSS JOIN LATERAL (
+        WITH fts_hits AS (
+            SELECT c.id, ts_rank_cd(c.fts, b.query) AS rank
+            FROM chunks c
+            WHERE c.fts @@ b.query AND :w_fts > 0
+              AND (b.source_ids IS NULL OR c.document_id = ANY(b.source_ids))
+            ORDER BY rank DESC, c.id
+            LIMIT :k
+        ),{trigram}
+        fts AS (
+            SELECT id, row_number() OVER (ORDER BY rank DESC, id) AS rnk
+            FROM ({lexical}) t
+        ),
+        vec AS (
+            SELECT id, row_number() OVER (ORDER BY dist, id) AS rnk
+            FROM ({exact}
+                UNION ALL
+                {ann}
+            ) t
+        ),
+        fused AS (
+            SELECT id, sum(score) AS score
+            FROM (
+                SELECT id, :w_fts / (:rrf_k + rnk) AS score FROM fts
+                UNION ALL
+                SELECT id, :w_vec / (:rrf_k + rnk) AS score FROM vec
+            ) s
+            GROUP BY id
+        )
+        SELECT c.id, c.document_id, c.section_path, c.page_start, c.page_end, c.chunk_text,
+               d.title AS document_title, f.score
+        FROM fused f
+        JOIN chunks c ON c.id = f.id
+        JOIN documents d ON d.id = c.document_id
+        ORDER BY f.score DESC, c.id
+        LIMIT :lim
+    ) r
+    ORDER BY b.i, r.score DESC, r.id
+"""
+
+# Per-question version of _hybrid_trigram: candidates through the index, one token at a
+# time (rag_unaccent(t) <% ..., t from b.tokens), scored by the same summed similarity.
+_BATCH_TRIGRAM = """
+        trgm AS (
+            SELECT c.id, (SELECT sum(word_similarity(rag_unaccent(t), u.folded)) FROM unnest(b.tokens) t) AS rank
+            FROM chunks c CROSS JOIN LATERAL (SELECT rag_unaccent(c.chunk_text) AS folded) u
+            WHERE b.tokens IS NOT NULL AND :w_fts > 0 AND NOT EXISTS (SELECT 1 FROM fts_hits)
+              AND c.id IN (
+                  SELECT m.id FROM unnest(b.tokens) t
+                  JOIN chunks m ON rag_unaccent(t) <% rag_unaccent(m.chunk_text)
+              )
+              AND (b.source_ids IS NULL OR c.document_id = ANY(b.source_ids))
+            ORDER BY rank DESC, c.id
+            LIMIT :k
+        ),"""
+
+def _text_array(items: List[str]) -> Optional[str]:
+    # \w+ tokens: tırnak içinde yazmak yeterli (NULL gibi kelimeler de metin kalır)
+    return "{" + ",".join(f'"{t}"' for t in items) + "}" if items else None
+
+def _vector_literal(v: Optional[List[float]]) -> Optional[str]:
+    return None if not v else "[" + ",".join(str(float(x)) for x in v) + "]"
+
+def _batch_query(
+    questions: List[str], embeddings: List[Optional[List[float]]], scopes: List[Optional[List[int]]],
+    limit: int, k: int, w_fts: float, w_vec: float,
+) -> Tuple[Any, Dict[str, Any]]:
+    trigram = lexical_features()["trigram"]
+    params: Dict[str, Any] = {
+        "b_q": list(questions),
+        "b_vec": [_vector_literal(v) for v in embeddings],
+        "b_scope": ["{" + ",".join(str(int(d)) for d in s) + "}" if s else None for s in scopes],
+        "b_tok": [_text_array(_trigram_tokens(q)) if trigram else None for q in questions],
+        "cap": settings.scoped_exact_max_rows + 1,
+        "exact_max": settings.scoped_exact_max_rows if settings.scoped_exact_max_rows > 0 else -1,
+        "k": k, "k_ann": vector_index.rerank_candidates(k), "lim": limit,
+        "w_fts": float(w_fts), "w_vec": float(w_vec), "rrf_k": float(settings.hybrid_rrf_k),
+    }
+    vec = "AND b.qvec IS NOT NULL AND :w_vec > 0"
+    exact = vector_index.nearest_sql(
+        where=f"{vec} AND b.exact AND c.document_id = ANY(b.source_ids)", exact=True, query="b.qvec",
+    )
+    ann = vector_index.nearest_sql(
+        where=f"{vec} AND NOT b.exact AND (b.source_ids IS NULL OR c.document_id = ANY(b.source_ids))",
+        query="b.qvec",
+    )
+    sql = _BATCH_SQL.format(
+        tsquery=_tsquery_sql("u.q"), exact=f"({exact})", ann=f"({ann})",
+        trigram=_BATCH_TRIGRAM if trigram else "", lexical=_WITH_TRIGRAM if trigram else _FTS_HITS,
+    )
+    return text(sql), params
+
+def _group_batch(rows, n: int) -> List[List[Dict[str, Any]]]:
+    out: List[List[Dict[str, Any]]] = [[] for _ in range(n)]
+    for r in rows:
+        out[r["i"]].append(_to_evidence(r))
+    return out
+
+def _knobs_query(ef_search: Optional[int], probes: Optional[int], candidates: int = 0) -> Optional[Tuple[Any, Dict[str, Any]]]:
+    # Per-request ANN tuning, transaction-local (set_config(..., true) == SET LOCAL).
+    # Session defaults come from HNSW_EF_SEARCH / IVFFLAT_PROBES (db.py).
+    # Note: HNSW returns at most ef_search rows, so keep it >= the requested limit.
+    # With halfvec/binary storage the first pass reads `candidates` rows, so ef_search
+    # is raised to that (pgvector caps it at 1000).
+    if vector_index.query_storage() != "full" and candidates > (ef_search or settings.hnsw_ef_search):
+        ef_search = min(1000, candidates)
+    sets, params = [], {}
+    if ef_search:
+        sets.append("set_config('hnsw.ef_search', :ef_search, true)")
+        params["ef_search"] = str(int(ef_search))
+    if probes:
+        sets.append("set_config('ivfflat.probes', :probes, true)")
+        params["probes"] = str(int(probes))
+    if not sets:
+        return None
+    return text("SELECT " + ", ".join(sets)), params
+
+def _excerpt(text: str, max_chars: int = 1200) -> str:
+    text = text.strip()
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > 0 else max_chars].rstrip() + " …"
+
+def _to_evidence(r) -> Dict[str, Any]:
+    # chunk_text: full text for evidence.pack_evidence; excerpt: display preview
+    return {
+        "chunk_id": r["id"],
+        "document_id": r["document_id"],
+        "document_title": r["document_title"],
+        "section_path": r["section_path"],
+        "page_start": r["page_start"],
+        "page_end": r["page_end"],
+        "chunk_text": r["chunk_text"],
+        "excerpt": _excerpt(r["chunk_text"]),
+    }
+
+def rrf_fuse(
+    ranked: List[List[Dict[str, Any]]],
+    weights: List[float],
+    k: float,
+    limit: int,
+) -> List[Dict[str, Any]]:
+    """Reciprocal rank fusion: score(d) = sum_i w_i / (k + rank_i(d)), rank starting at 1."""
+    scores: Dict[int, float] = {}
+    items: Dict[int, Dict[str, Any]] = {}
+    for results, w in zip(ranked, weights):
+        for rank, r in enumerate(results, start=1):
+            scores[r["chunk_id"]] = scores.get(r["chunk_id"], 0.0) + w / (k + rank)
+            items.setdefault(r["chunk_id"], r)
+    order = sorted(scores, key=lambda cid: (-scores[cid], cid))
+    return [items[cid] for cid in order[:limit]]
+
+def _resolve_weights(fts_weight: Optional[float], vector_weight: Optional[float]) -> Tuple[float, float]:
+    w_fts = settings.hybrid_fts_weight if fts_weight is None else fts_weight
+    w_vec = settings.hybrid_vector_weight if vector_weight is None else vector_weight
+    return w_fts, w_vec
+
+# --- sync -------------------------------------------------------------------
+
+def fts_search(
+    db: Session,
+    question: str,
+    source_ids: Optional[List[int]] = None,
+    limit: int = 10,
+    fallback_when_empty: bool = True,
+) -> List[Dict[str, Any]]:
+    # fallback_when_empty=False: trigram/ILIKE only if FTS itself fails. Fusion legs pass
+    # lexical_features()["trigram"] so they rank like the fused SQL (trigram leg, never ILIKE)
     rows = []
+    failed = False
     try:
-        if source_ids:
-            sql = text("""
-                SELECT c.id, c.document_id, c.section_path, c.page_start, c.page_end, c.chunk_text,
-                       d.title as document_title
-                FROM chunks c
-                JOIN documents d ON d.id = c.document_id
-                WHERE c.document_id = ANY(:source_ids)
-                  AND c.fts @@ plainto_tsquery('turkish', :q)
-                ORDER BY ts_rank(c.fts, plainto_tsquery('turkish', :q)) DESC
-                LIMIT :lim
-            """)
-            rows = db.execute(sql, {"q": question, "lim": limit, "source_ids": source_ids}).mappings().all()
-        else:
-            sql = text("""
-                SELECT c.id, c.document_id, c.section_path, c.page_start, c.page_end, c.chunk_text,
-                       d.title as document_title
-                FROM chunks c
-                JOIN documents d ON d.id = c.document_id
-                WHERE c.fts @@ plainto_tsquery('turkish', :q)
-                ORDER BY ts_rank(c.fts, plainto_tsquery('turkish', :q)) DESC
-                LIMIT :lim
-            """)
-            rows = db.execute(sql, {"q": question, "lim": limit}).mappings().all()
+        sql, params = _fts_query(question, source_ids, limit)
+        rows = db.execute(sql, params).mappings().all()
     except Exception:
+        failed = True
         try:
             db.rollback()
         except Exception:
             pass
 
-    # Fallback: simple ILIKE search if FTS is unavailable or returns no rows
-    if not rows:
-        if not patterns:
-            patterns = [f"%{question}%"] if question else []
-        if source_ids:
-            sql = text("""
-                SELECT c.id, c.document_id, c.section_path, c.page_start, c.page_end, c.chunk_text,
-                       d.title as document_title
-                FROM chunks c
-                JOIN documents d ON d.id = c.document_id
-                WHERE c.document_id = ANY(:source_ids)
-                  AND c.chunk_text ILIKE ANY(:patterns)
-                ORDER BY c.id DESC
-                LIMIT :lim
-            """)
-            rows = db.execute(sql, {"patterns": patterns, "lim": limit, "source_ids": source_ids}).mappings().all()
-        else:
-            sql = text("""
-                SELECT c.id, c.document_id, c.section_path, c.page_start, c.page_end, c.chunk_text,
-                       d.title as document_title
-                FROM chunks c
-                JOIN documents d ON d.id = c.document_id
-                WHERE c.chunk_text ILIKE ANY(:patterns)
-                ORDER BY c.id DESC
-                LIMIT :lim
-            """)
-            rows = db.execute(sql, {"patterns": patterns, "lim": limit}).mappings().all()
-
-    out = []
-    for r in rows:
-        excerpt = (r["chunk_text"][:1200]).strip()
-        out.append({
-            "chunk_id": r["id"],
-            "document_id": r["document_id"],
-            "document_title": r["document_title"],
-            "section_path": r["section_path"],
-            "page_start": r["page_start"],
-            "page_end": r["page_end"],
-            "excerpt": excerpt
-        })
-    return out
+    if not rows and (failed or fallback_when_empty):
+        fallback = _fallback_query(question, source_ids, limit)
+        if fallback:
+            rows = db.execute(*fallback).mappings().all()
+    return [_to_evidence(r) for r in rows]
+
+def _apply_knobs(db: Session, ef_search: Optional[int], probes: Optional[int], k: int = 0) -> None:
+    knobs = _knobs_query(ef_search, probes, vector_index.rerank_candidates(k))
+    if knobs:
+        db.execute(*knobs)
 
 def vector_search(
     db: Session,
     query_embedding: Optional[List[float]],
     source_ids: Optional[List[int]] = None,
     limit: int = 10,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
 ) -> List[Dict[str, Any]]:
     if not query_embedding:
         return []
-
-    if source_ids:
-        sql = text("""
-            SELECT c.id, c.document_id, c.section_path, c.page_start, c.page_end, c.chunk_text,
-                   d.title as document_title
-            FROM chunks c
-            JOIN documents d ON d.id = c.document_id
-            WHERE c.document_id = ANY(:source_ids)
-              AND c.embedding IS NOT NULL
-            ORDER BY c.embedding <-> :qvec
-            LIMIT :lim
-        """)
-        rows = db.execute(sql, {"qvec": query_embedding, "lim": limit, "source_ids": source_ids}).mappings().all()
-    else:
-        sql = text("""
-            SELECT c.id, c.document_id, c.section_path, c.page_start, c.page_end, c.chunk_text,
-                   d.title as document_title
-            FROM chunks c
-            JOIN documents d ON d.id = c.document_id
-            WHERE c.embedding IS NOT NULL
-            ORDER BY c.embedding <-> :qvec
-            LIMIT :lim
-        """)
-        rows = db.execute(sql, {"qvec": query_embedding, "lim": limit}).mappings().all()
-
-    out = []
-    for r in rows:
-        excerpt = (r["chunk_text"][:1200]).strip()
-        out.append({
-            "chunk_id": r["id"],
-            "document_id": r["document_id"],
-            "document_title": r["document_title"],
-            "section_path": r["section_path"],
-            "page_start": r["page_start"],
-            "page_end": r["page_end"],
-            "excerpt": excerpt
-        })
-    return out
+    hits = vector_store.search(source_ids, query_embedding, limit)
+    exact = hits is None and _exact_scope(db, source_ids)
+    if hits is None and not exact:
+        _apply_knobs(db, ef_search, probes, limit)
+    rows = db.execute(*_vector_query(query_embedding, source_ids, limit, exact, hits)).mappings().all()
+    return [_to_evidence(r) for r in rows]
 
 def hybrid_search(
     db: Session,
@@ -132,17 +498,213 @@ def hybrid_search(
     query_embedding: Optional[List[float]] = None,
     source_ids: Optional[List[int]] = None,
     limit: int = 10,
+    fts_weight: Optional[float] = None,
+    vector_weight: Optional[float] = None,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    w_fts, w_vec = _resolve_weights(fts_weight, vector_weight)
+    k = max(limit, settings.hybrid_candidates)
+    knobs = {"ef_search": ef_search, "probes": probes}
+
+    # Tek kaynak kullanılıyorsa füzyona gerek yok (FTS yolu trigram/ILIKE fallback'ini de korur)
+    if not query_embedding or w_vec <= 0:
+        return fts_search(db, question, source_ids=source_ids, limit=limit)
+    if w_fts <= 0:
+        return vector_search(db, query_embedding, source_ids=source_ids, limit=limit, **knobs)
+
+    try:
+        hits = vector_store.search(source_ids, query_embedding, k)
+        exact = hits is None and _exact_scope(db, source_ids)
+        sql, params = _hybrid_query(question, query_embedding, source_ids, limit, k, w_fts, w_vec, exact, hits)
+        if hits is None and not exact:
+            _apply_knobs(db, ef_search, probes, k)
+        return [_to_evidence(r) for r in db.execute(sql, params).mappings().all()]
+    except Exception as e:
+        # fts kolonu yoksa (migrate.sql çalışmamış) iki sorgu + Python'da RRF
+        print(f"Hybrid SQL failed, falling back to separate queries: {e}")
+        try:
+            db.rollback()
+        except Exception:
+            pass
+    fts = fts_search(db, question, source_ids=source_ids, limit=k,
+                     fallback_when_empty=lexical_features()["trigram"])
+    vec = vector_search(db, query_embedding, source_ids=source_ids, limit=k, **knobs)
+    return rrf_fuse([fts, vec], [w_fts, w_vec], settings.hybrid_rrf_k, limit)
+
+def hybrid_search_batch(
+    db: Session,
+    questions: List[str],
+    query_embeddings: List[Optional[List[float]]],
+    scopes: List[Optional[List[int]]],
+    limit: int = 10,
+    fts_weight: Optional[float] = None,
+    vector_weight: Optional[float] = None,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+) -> List[List[Dict[str, Any]]]:
+    """hybrid_search of many questions in one statement (_BATCH_SQL); one evidence list
+    per question, in order. Questions it finds nothing for get fts_search (trigram/ILIKE)."""
+    if not questions:
+        return []
+    w_fts, w_vec = _resolve_weights(fts_weight, vector_weight)
+    k = max(limit, settings.hybrid_candidates)
+    try:
+        _apply_knobs(db, ef_search, probes, k)
+        rows = db.execute(*_batch_query(questions, query_embeddings, scopes, limit, k, w_fts, w_vec)).mappings().all()
+        out = _group_batch(rows, len(questions))
+    except Exception as e:
+        print(f"Batch SQL failed, falling back to one search per question: {e}")
+        try:
+            db.rollback()
+        except Exception:
+            pass
+        return [
+            hybrid_search(db, q, v, s, limit, fts_weight, vector_weight, ef_search, probes)
+            for q, v, s in zip(questions, query_embeddings, scopes)
+        ]
+    for i, found in enumerate(out):
+        if not found:
+            out[i] = fts_search(db, questions[i], source_ids=scopes[i], limit=limit)
+    return out
+
+# --- async ------------------------------------------------------------------
+
+async def fts_search_async(
+    db: AsyncSession,
+    question: str,
+    source_ids: Optional[List[int]] = None,
+    limit: int = 10,
+    fallback_when_empty: bool = True,
+) -> List[Dict[str, Any]]:
+    rows = []
+    failed = False
+    try:
+        sql, params = _fts_query(question, source_ids, limit)
+        rows = (await db.execute(sql, params)).mappings().all()
+    except Exception:
+        failed = True
+        try:
+            await db.rollback()
+        except Exception:
+            pass
+
+    if not rows and (failed or fallback_when_empty):
+        fallback = _fallback_query(question, source_ids, limit)
+        if fallback:
+            rows = (await db.execute(*fallback)).mappings().all()
+    return [_to_evidence(r) for r in rows]
+
+async def _exact_scope_async(db: AsyncSession, source_ids: Optional[List[int]]) -> bool:
+    if not source_ids or settings.scoped_exact_max_rows <= 0:
+        return False
+    return (await db.execute(*_scope_count_query(source_ids))).scalar() <= settings.scoped_exact_max_rows
+
+async def _apply_knobs_async(db: AsyncSession, ef_search: Optional[int], probes: Optional[int], k: int = 0) -> None:
+    knobs = _knobs_query(ef_search, probes, vector_index.rerank_candidates(k))
+    if knobs:
+        await db.execute(*knobs)
+
+async def vector_search_async(
+    db: AsyncSession,
+    query_embedding: Optional[List[float]],
+    source_ids: Optional[List[int]] = None,
+    limit: int = 10,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    if not query_embedding:
+        return []
+    await vector_index.query_storage_async(db)
+    hits = await asyncio.to_thread(vector_store.search, source_ids, query_embedding, limit)
+    exact = hits is None and await _exact_scope_async(db, source_ids)
+    if hits is None and not exact:
+        await _apply_knobs_async(db, ef_search, probes, limit)
+    rows = (await db.execute(*_vector_query(query_embedding, source_ids, limit, exact, hits))).mappings().all()
+    return [_to_evidence(r) for r in rows]
+
+async def _on_own_session(fn, *args, **kwargs):
+    # Bir AsyncSession aynı anda tek sorgu çalıştırabilir; eşzamanlı sorgular ayrı bağlantı ister
+    async with AsyncSessionLocal() as db:
+        return await fn(db, *args, **kwargs)
+
+async def hybrid_search_async(
+    db: AsyncSession,
+    question: str,
+    query_embedding: Optional[List[float]] = None,
+    source_ids: Optional[List[int]] = None,
+    limit: int = 10,
+    fts_weight: Optional[float] = None,
+    vector_weight: Optional[float] = None,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
 ) -> List[Dict[str, Any]]:
-    fts = fts_search(db, question, source_ids=source_ids, limit=limit)
-    vec = vector_search(db, query_embedding, source_ids=source_ids, limit=limit)
-
-    combined = []
-    seen = set()
-    for r in fts + vec:
-        if r["chunk_id"] in seen:
-            continue
-        seen.add(r["chunk_id"])
-        combined.append(r)
-        if len(combined) >= limit:
-            break
-    return combined
+    """Async hybrid_search. HYBRID_STRATEGY=fused runs the single RRF query on `db`;
+    parallel runs FTS and vector top-K concurrently on two pooled connections and
+    fuses them in Python (same ranking, lower latency, two connections per request)."""
+    w_fts, w_vec = _resolve_weights(fts_weight, vector_weight)
+    k = max(limit, settings.hybrid_candidates)
+    knobs = {"ef_search": ef_search, "probes": probes}
+
+    if not query_embedding or w_vec <= 0:
+        return await fts_search_async(db, question, source_ids=source_ids, limit=limit)
+    if w_fts <= 0:
+        return await vector_search_async(db, query_embedding, source_ids=source_ids, limit=limit, **knobs)
+
+    if settings.hybrid_strategy.lower() != "parallel":
+        try:
+            await vector_index.query_storage_async(db)
+            hits = await asyncio.to_thread(vector_store.search, source_ids, query_embedding, k)
+            exact = hits is None and await _exact_scope_async(db, source_ids)
+            sql, params = _hybrid_query(question, query_embedding, source_ids, limit, k, w_fts, w_vec, exact, hits)
+            if hits is None and not exact:
+                await _apply_knobs_async(db, ef_search, probes, k)
+            return [_to_evidence(r) for r in (await db.execute(sql, params)).mappings().all()]
+        except Exception as e:
+            print(f"Hybrid SQL failed, falling back to separate queries: {e}")
+            try:
+                await db.rollback()
+            except Exception:
+                pass
+
+    fts, vec = await asyncio.gather(
+        _on_own_session(fts_search_async, question, source_ids=source_ids, limit=k,
+                        fallback_when_empty=lexical_features()["trigram"]),
+        _on_own_session(vector_search_async, query_embedding, source_ids=source_ids, limit=k, **knobs),
+    )
+    return rrf_fuse([fts, vec], [w_fts, w_vec], settings.hybrid_rrf_k, limit)
+
+async def hybrid_search_batch_async(
+    db: AsyncSession,
+    questions: List[str],
+    query_embeddings: List[Optional[List[float]]],
+    scopes: List[Optional[List[int]]],
+    limit: int = 10,
+    fts_weight: Optional[float] = None,
+    vector_weight: Optional[float] = None,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+) -> List[List[Dict[str, Any]]]:
+    if not questions:
+        return []
+    w_fts, w_vec = _resolve_weights(fts_weight, vector_weight)
+    k = max(limit, settings.hybrid_candidates)
+    try:
+        await vector_index.query_storage_async(db)
+        await _apply_knobs_async(db, ef_search, probes, k)
+        sql, params = _batch_query(questions, query_embeddings, scopes, limit, k, w_fts, w_vec)
+        out = _group_batch((await db.execute(sql, params)).mappings().all(), len(questions))
+    except Exception as e:
+        print(f"Batch SQL failed, falling back to one search per question: {e}")
+        try:
+            await db.rollback()
+        except Exception:
+            pass
+        return [
+            await hybrid_search_async(db, q, v, s, limit, fts_weight, vector_weight, ef_search, probes)
+            for q, v, s in zip(questions, query_embeddings, scopes)
+        ]
+    for i, found in enumerate(out):
+        if not found:
+            out[i] = await fts_search_async(db, questions[i], source_ids=scopes[i], limit=limit)
+    return out
@@ -0,0 +1,457 @@
+import asyncio
+import json
+import math
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+from sqlalchemy import text
+from .db import engine
+from .settings import settings
+
+# Managed ANN index on chunks.embedding.
+#
+# Type (hnsw | ivfflat) and metric (cosine | ip | l2) come from settings; search.py
+# uses the matching distance operator so queries can use the index. The index is
+# rebuilt with CREATE INDEX CONCURRENTLY under a temporary name and swapped in, so
+# reads and ingestion continue during the build. IVFFlat centroids are trained on
+# the rows present at build time: lists = round(sqrt(rows)), and a rebuild is due
+# once rows >= built_rows * VECTOR_INDEX_REBUILD_GROWTH. HNSW needs no retraining.
+# The row count used for a build is stored in the index comment.
+#
+# Storage (VECTOR_STORAGE): the heap always keeps the full float32 vector; halfvec and
+# binary only change what the index holds, via an expression index on
+# embedding::halfvec(D) or binary_quantize(embedding)::bit(D) (pgvector >= 0.7.0).
+# Queries scan VECTOR_RERANK_FACTOR x k candidates through the compact index and
+# re-rank them by exact distance on the full vectors. Switching storage is an index
+# rebuild; queries follow the storage of the live index, so they switch at the swap.
+# Every process re-reads that storage from the catalog at most every
+# _STORAGE_CHECK_SECONDS (other uvicorn workers, ingest); the swap renames the old
+# index out of the way in the same transaction as the new one takes its name, and
+# drops it only after that interval, so no query runs without an index.
+#
+# Hash-partitioned chunks (partitioning.py): a partitioned index can't be built or
+# dropped CONCURRENTLY, so the parent is created ON ONLY chunks and each partition's
+# index is built concurrently and attached (<name>_<partition>); IVFFlat lists are
+# sized for the rows of one partition.
+
+INDEX_NAME = "ix_chunks_embedding"
+_BUILD_NAME = INDEX_NAME + "_new"
+_OLD_NAME = INDEX_NAME + "_old"
+_LOCK_KEY = 0x7665637478  # pg advisory lock: one rebuild at a time across processes
+
+_OPCLASS = {"cosine": "vector_cosine_ops", "ip": "vector_ip_ops", "l2": "vector_l2_ops"}
+_OPERATOR = {"cosine": "<=>", "ip": "<#>", "l2": "<->"}
+_HALFVEC_OPCLASS = {"cosine": "halfvec_cosine_ops", "ip": "halfvec_ip_ops", "l2": "halfvec_l2_ops"}
+_METRIC_BY_OPCLASS = {
+    **{v: k for k, v in _OPCLASS.items()}, **{v: k for k, v in _HALFVEC_OPCLASS.items()}, "bit_hamming_ops": "hamming",
+}
+_STORAGES = ("full", "halfvec", "binary")
+_QUANTIZE_MIN_VERSION = (0, 7, 0)  # halfvec, binary_quantize, bit_hamming_ops
+
+# Storage the queries use: that of the live index, re-read every _STORAGE_CHECK_SECONDS
+_STORAGE_CHECK_SECONDS = 5.0
+_active_storage: Optional[str] = None
+_storage_checked = float("-inf")
+_effective_storage: Optional[str] = None
+
+_LIVE_OPCLASS_SQL = text("""
+    SELECT oc.opcname
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    JOIN pg_opclass oc ON oc.oid = i.indclass[0]
+    WHERE c.relname = :name AND i.indisvalid
+""")
+
+_state: Dict[str, Any] = {"running": False, "started_at": None, "finished_at": None, "error": None, "last": None}
+_state_lock = threading.Lock()
+
+def index_type() -> str:
+    t = settings.vector_index_type.lower()
+    if t not in ("hnsw", "ivfflat"):
+        raise ValueError(f"VECTOR_INDEX_TYPE must be hnsw or ivfflat, got {t!r}")
+    return t
+
+def metric() -> str:
+    m = settings.vector_metric.lower()
+    if m not in _OPCLASS:
+        raise ValueError(f"VECTOR_METRIC must be one of {sorted(_OPCLASS)}, got {m!r}")
+    return m
+
+def distance_operator() -> str:
+    return _OPERATOR[metric()]
+
+def storage() -> str:
+    s = settings.vector_storage.lower()
+    if s not in _STORAGES:
+        raise ValueError(f"VECTOR_STORAGE must be one of {list(_STORAGES)}, got {s!r}")
+    return s
+
+def pgvector_version(conn) -> Tuple[int, ...]:
+    v = conn.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar() or "0"
+    return tuple(int(x) for x in re.findall(r"\d+", v))
+
+def effective_storage() -> str:
+    """Configured storage, or "full" when the installed pgvector can't quantize."""
+    global _effective_storage
+    if _effective_storage is None:
+        wanted = storage()
+        if wanted != "full":
+            with engine.connect() as conn:
+                version = pgvector_version(conn)
+            if version < _QUANTIZE_MIN_VERSION:
+                print(f"VECTOR_STORAGE={wanted} needs pgvector >= 0.7.0 (installed: {'.'.join(map(str, version))}); using full vectors.")
+                wanted = "full"
+        _effective_storage = wanted
+    return _effective_storage
+
+def _storage_of(opclass: Optional[str]) -> Optional[str]:
+    if opclass is None:
+        return None
+    return "halfvec" if opclass.startswith("halfvec_") else "binary" if opclass.startswith("bit_") else "full"
+
+def _storage_stale() -> bool:
+    return time.monotonic() - _storage_checked >= _STORAGE_CHECK_SECONDS
+
+def query_storage() -> str:
+    """Storage of the live index (the configured one while there is no valid index)."""
+    if _storage_stale():
+        try:
+            with engine.connect() as conn:
+                _set_active_storage(_storage_of(conn.execute(_LIVE_OPCLASS_SQL, {"name": INDEX_NAME}).scalar()))
+        except Exception as e:
+            print(f"Vector index storage check failed: {e}")
+            _set_active_storage(_active_storage)  # bir sonraki denemeye kadar eldekini kullan
+    return _active_storage or effective_storage()
+
+async def query_storage_async(db) -> str:
+    """query_storage for the request path: the catalog is read on `db` (AsyncSession)."""
+    if _storage_stale():
+        opclass = (await db.execute(_LIVE_OPCLASS_SQL, {"name": INDEX_NAME})).scalar()
+        _set_active_storage(_storage_of(opclass))
+    return _active_storage or effective_storage()
+
+def _index_expr(column: str, storage_name: str, dim: int) -> str:
+    # Sorgudaki ifade indeksinkiyle birebir aynı olmalı, yoksa planner indeksi kullanmaz
+    if storage_name == "halfvec":
+        return f"({column}::halfvec({dim}))"
+    if storage_name == "binary":
+        return f"(binary_quantize({column})::bit({dim}))"
+    return column
+
+def rerank_candidates(k: int) -> int:
+    return k * max(1, settings.vector_rerank_factor)
+
+def nearest_sql(
+    table: str = "chunks", column: str = "embedding", where: str = "",
+    storage_name: Optional[str] = None, dim: Optional[int] = None, exact: bool = False,
+    query: str = ":qvec",
+) -> str:
+    """SELECT id, dist of the :k rows of `table` (alias c) nearest to :qvec, ordered by dist.
+
+    `query` replaces :qvec by another expression (a column of an outer query, see
+    search._BATCH_SQL).
+
+    exact=True skips the ANN index: every row matching `where` is scored on the full
+    vector. For small scopes (a few documents) this is faster than an index scan that
+    filters afterwards, and never returns fewer than :k rows because of the filter.
+
+    Full storage orders by the exact distance (index on the column). Quantized storage
+    takes :k_ann candidates ordered through the compact index expression, then re-ranks
+    them by exact distance on the full vectors.
+
+    The index scan needs ORDER BY on the distance alone (a tie-breaker column
+    such as c.id turns it into a seq scan + sort); callers order the result by
+    dist, id.
+    """
+    storage_name = storage_name or query_storage()
+    dim = dim or settings.embedding_dim
+    op = distance_operator()
+    if exact:
+        # OFFSET 0: alt sorgu düzleştirilmez, ORDER BY indekse inemez (kapsam btree ile okunur)
+        return f"""
+            SELECT e.id, e.dist
+            FROM (
+                SELECT c.id, c.{column} {op} CAST({query} AS vector) AS dist
+                FROM {table} c
+                WHERE c.{column} IS NOT NULL {where}
+                OFFSET 0
+            ) e
+            ORDER BY e.dist
+            LIMIT :k"""
+    if storage_name == "full":
+        return f"""
+            SELECT c.id, c.{column} {op} CAST({query} AS vector) AS dist
+            FROM {table} c
+            WHERE c.{column} IS NOT NULL {where}
+            ORDER BY dist
+            LIMIT :k"""
+    key = _index_expr(f"c.{column}", storage_name, dim)
+    if storage_name == "halfvec":
+        first_pass = f"{key} {op} CAST({query} AS halfvec({dim}))"
+    else:
+        first_pass = f"{key} <~> binary_quantize(CAST({query} AS vector))"
+    return f"""
+            SELECT a.id, a.{column} {op} CAST({query} AS vector) AS dist
+            FROM (
+                SELECT c.id, c.{column}
+                FROM {table} c
+                WHERE c.{column} IS NOT NULL {where}
+                ORDER BY {first_pass}
+                LIMIT :k_ann
+            ) a
+            ORDER BY dist, a.id
+            LIMIT :k"""
+
+def ivfflat_lists(rows: int) -> int:
+    if settings.ivfflat_lists > 0:
+        return settings.ivfflat_lists
+    return min(32768, max(1, round(math.sqrt(rows))))
+
+def index_ddl(
+    table: str, column: str, name: str, kind: str, metric_name: str, rows: int, concurrently: bool = True,
+    storage_name: str = "full", dim: Optional[int] = None,
+) -> str:
+    """CREATE INDEX statement for the given type/metric/storage (also used by the benches on their own table)."""
+    expr = _index_expr(column, storage_name, dim or settings.embedding_dim)
+    if storage_name == "halfvec":
+        opclass = _HALFVEC_OPCLASS[metric_name]
+    elif storage_name == "binary":
+        opclass = "bit_hamming_ops"  # işaret kuantizasyonu: cosine/ip için iyi bir ön eleme
+    else:
+        opclass = _OPCLASS[metric_name]
+    if kind == "hnsw":
+        with_opts = f"m = {settings.hnsw_m}, ef_construction = {settings.hnsw_ef_construction}"
+    else:
+        with_opts = f"lists = {ivfflat_lists(rows)}"
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}{name} ON {table} "
+        f"USING {kind} ({expr} {opclass}) WITH ({with_opts})"
+    )
+
+def partitions(conn, table: str = "chunks") -> List[str]:
+    """Leaf partitions of `table` (hash layout, see partitioning.py); [] for a plain table."""
+    return [r[0] for r in conn.execute(text(
+        "SELECT relid::regclass::text FROM pg_partition_tree(CAST(:t AS regclass)) WHERE isleaf AND level > 0 ORDER BY relid"
+    ), {"t": table})]
+
+def _embedded_rows(conn) -> int:
+    return conn.execute(text("SELECT count(*) FROM chunks WHERE embedding IS NOT NULL")).scalar() or 0
+
+def current_index(conn, name: str = INDEX_NAME) -> Optional[Dict[str, Any]]:
+    row = conn.execute(text("""
+        SELECT pg_get_indexdef(i.indexrelid), i.indisvalid, obj_description(i.indexrelid, 'pg_class'),
+               (SELECT sum(pg_relation_size(t.relid)) FROM pg_partition_tree(i.indexrelid) t), am.amname, oc.opcname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_am am ON am.oid = c.relam
+        JOIN pg_opclass oc ON oc.oid = i.indclass[0]
+        WHERE c.relname = :name
+    """), {"name": name}).first()
+    if not row:
+        return None
+    # opclass katalogdan okunur: varsayılan opclass (vector_l2_ops) indexdef'te görünmez
+    indexdef, valid, comment, size, kind, opclass = row
+    lists = re.search(r"lists='?(\d+)", indexdef)
+    storage_name = _storage_of(opclass)
+    try:
+        meta = json.loads(comment) if comment else {}
+    except ValueError:
+        meta = {}
+    return {
+        "name": name,
+        "type": kind,
+        "metric": _METRIC_BY_OPCLASS.get(opclass),  # binary: hamming; re-rank uses VECTOR_METRIC
+        "storage": storage_name,
+        "lists": int(lists.group(1)) if lists else None,
+        "valid": bool(valid),
+        "size_bytes": int(size or 0),
+        "built_rows": meta.get("rows"),
+        "built_at": meta.get("built_at"),
+        "definition": indexdef,
+    }
+
+def rebuild_reason(current: Optional[Dict[str, Any]], rows: int) -> Optional[str]:
+    """Why the index should be rebuilt now, or None."""
+    if current is None:
+        return "missing"
+    if not current["valid"]:
+        return "invalid (interrupted concurrent build)"
+    wanted = (index_type(), effective_storage(), metric())
+    have = (current["type"], current["storage"], current["metric"])
+    if have[:2] != wanted[:2] or (wanted[1] != "binary" and have[2] != wanted[2]):
+        return f"config changed: {'/'.join(map(str, have))} -> {'/'.join(wanted)}"
+    if index_type() == "ivfflat" and rows >= settings.vector_index_min_rows:
+        built = current["built_rows"] or 0  # migrate.sql'deki indeks boş tabloda kurulmuş olabilir
+        if rows >= max(1, built) * settings.vector_index_rebuild_growth:
+            return f"rows grew: {built} -> {rows}"
+    return None
+
+def status() -> Dict[str, Any]:
+    with engine.connect() as conn:
+        rows = _embedded_rows(conn)
+        current = current_index(conn)
+        n_partitions = len(partitions(conn))
+        progress = conn.execute(text("""
+            SELECT phase, blocks_done, blocks_total, tuples_done, tuples_total
+            FROM pg_stat_progress_create_index WHERE relid IN (SELECT relid FROM pg_partition_tree('chunks'))
+        """)).mappings().first()
+    with _state_lock:
+        state = dict(_state)
+    return {
+        "configured": {
+            "type": index_type(), "metric": metric(), "operator": distance_operator(),
+            "storage": effective_storage(), "rerank_factor": settings.vector_rerank_factor,
+        },
+        "query_storage": query_storage(),
+        "rows": rows,
+        "partitions": n_partitions,
+        "index": current,
+        "rebuild_reason": rebuild_reason(current, rows),
+        "build": {**state, "progress": dict(progress) if progress else None},
+    }
+
+def rebuild(force: bool = False) -> Dict[str, Any]:
+    """Build the configured index concurrently and swap it in. Blocking; run off the event loop."""
+    conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        if not try_lock(conn):
+            return {"rebuilt": False, "reason": "another rebuild is running"}
+        try:
+            rows = _embedded_rows(conn)
+            current = current_index(conn)
+            reason = rebuild_reason(current, rows) or ("forced" if force else None)
+            if reason is None:
+                return {"rebuilt": False, "reason": "up to date", "rows": rows}
+
+            drop_index(conn, _OLD_NAME)  # yarıda kalmış bir takastan
+            storage_name = build_index(conn, _BUILD_NAME, rows)
+            swap_index(_BUILD_NAME, replace=current is not None)
+            _set_active_storage(storage_name)
+            # Diğer süreçler depolamayı en geç _STORAGE_CHECK_SECONDS içinde yeniden okur;
+            # o zamana kadar eski ifadeyle gelen sorgular eski indeksi kullanır
+            time.sleep(_STORAGE_CHECK_SECONDS)
+            drop_index(conn, _OLD_NAME)
+            return {"rebuilt": True, "reason": reason, "rows": rows, "index": current_index(conn)}
+        finally:
+            unlock(conn)
+    finally:
+        conn.close()
+
+def build_index(
+    conn, name: str, rows: int, column: str = "embedding", dim: Optional[int] = None,
+    concurrently: bool = True, table: str = "chunks",
+) -> str:
+    """CREATE INDEX (CONCURRENTLY: `conn` must be AUTOCOMMIT) the configured index as `name`
+    on <table>.<column>, per partition when the table is partitioned, and record the row
+    count in its comment. Returns the storage."""
+    kind, metric_name, storage_name = index_type(), metric(), effective_storage()
+    parts = partitions(conn, table)
+    drop_index(conn, name, concurrently)
+    conn.execute(text("SELECT set_config('maintenance_work_mem', :m, false)"), {"m": settings.vector_index_build_mem})
+    try:
+        if parts:
+            per_partition = max(1, rows // len(parts))
+            conn.exec_driver_sql(index_ddl(
+                f"ONLY {table}", column, name, kind, metric_name, per_partition, concurrently=False,
+                storage_name=storage_name, dim=dim,
+            ))
+            for part in parts:
+                child = f"{name}_{part}"
+                conn.exec_driver_sql(index_ddl(
+                    part, column, child, kind, metric_name, per_partition, concurrently=concurrently,
+                    storage_name=storage_name, dim=dim,
+                ))
+                conn.exec_driver_sql(f"ALTER INDEX {name} ATTACH PARTITION {child}")
+        else:
+            conn.exec_driver_sql(index_ddl(
+                table, column, name, kind, metric_name, rows, concurrently=concurrently,
+                storage_name=storage_name, dim=dim,
+            ))
+        meta = json.dumps({"rows": rows, "built_at": datetime.now(timezone.utc).isoformat()})
+        conn.exec_driver_sql(f"COMMENT ON INDEX {name} IS {_quote(meta)}")
+    finally:
+        conn.exec_driver_sql("RESET maintenance_work_mem")
+    return storage_name
+
+def drop_index(conn, name: str, concurrently: bool = True) -> None:
+    # Bölümlü indeks CONCURRENTLY düşürülemez; bölümlerinin indeksleriyle birlikte düşer
+    kind = conn.execute(text("SELECT relkind FROM pg_class WHERE relname = :n AND relkind IN ('i', 'I')"), {"n": name}).scalar()
+    if kind is None:
+        return
+    conn.exec_driver_sql(f"DROP INDEX {'CONCURRENTLY ' if concurrently and kind == 'i' else ''}{name}")
+
+def swap_index(name: str, replace: bool = True) -> None:
+    """In one transaction: the live index becomes _OLD_NAME (replace=True) and `name`
+    becomes INDEX_NAME. Renames only take SHARE UPDATE EXCLUSIVE, so reads and writes go on."""
+    with engine.begin() as tx:
+        tx.exec_driver_sql("SET LOCAL lock_timeout = '10s'")
+        if replace:
+            rename_index(tx, INDEX_NAME, _OLD_NAME)
+        rename_index(tx, name, INDEX_NAME)
+
+def rename_index(conn, old: str, new: str, table: str = "chunks") -> None:
+    """Rename an index built by build_index, with its per-partition indexes."""
+    conn.exec_driver_sql(f"ALTER INDEX {old} RENAME TO {new}")
+    for part in partitions(conn, table):
+        conn.exec_driver_sql(f"ALTER INDEX IF EXISTS {old}_{part} RENAME TO {new}_{part}")
+
+def try_lock(conn) -> bool:
+    """Session advisory lock shared by index rebuilds and the reindex column switch."""
+    return bool(conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": _LOCK_KEY}).scalar())
+
+def unlock(conn) -> None:
+    conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _LOCK_KEY})
+
+def _set_active_storage(storage_name: Optional[str]) -> None:
+    global _active_storage, _storage_checked
+    _active_storage = storage_name
+    _storage_checked = time.monotonic()
+
+def _quote(s: str) -> str:
+    return "'" + s.replace("'", "''") + "'"
+
+def run_rebuild(force: bool = False) -> Dict[str, Any]:
+    """rebuild() with the in-process status bookkeeping shown by status()."""
+    with _state_lock:
+        if _state["running"]:
+            return {"rebuilt": False, "reason": "already running"}
+        _state.update(running=True, started_at=datetime.now(timezone.utc).isoformat(), finished_at=None, error=None)
+    try:
+        result = rebuild(force)
+        with _state_lock:
+            _state["last"] = {k: v for k, v in result.items() if k != "index"}
+        return result
+    except Exception as e:
+        print(f"Vector index rebuild failed: {e}")
+        with _state_lock:
+            _state["error"] = str(e)
+        raise
+    finally:
+        with _state_lock:
+            _state.update(running=False, finished_at=datetime.now(timezone.utc).isoformat())
+
+_tasks: Set[asyncio.Task] = set()
+
+def start_rebuild(force: bool = False) -> asyncio.Task:
+    """Schedule run_rebuild on a worker thread from async code; returns the task."""
+    task = asyncio.create_task(asyncio.to_thread(run_rebuild, force))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+def is_running() -> bool:
+    with _state_lock:
+        return bool(_state["running"])
+
+def check_config() -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Startup check: warn when the existing index doesn't match settings (queries would not use it)."""
+    with engine.connect() as conn:
+        current = current_index(conn)
+        reason = rebuild_reason(current, _embedded_rows(conn))
+    # Sorgular canlı indeksin depolamasını izler (geçersiz indeks: yapılandırma)
+    _set_active_storage(current["storage"] if current and current["valid"] else None)
+    if reason and (current is None or reason.startswith("config") or reason.startswith("invalid")):
+        print(f"Vector index {INDEX_NAME}: {reason}. Run POST /admin/vector-index/rebuild.")
+    return current, reason
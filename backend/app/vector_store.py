@@ -0,0 +1,203 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import text
+from .bulk import _vector_type_info
+from .db import engine
+from .page_cache import DiskLRU
+from .settings import settings
+from . import vector_index
+
+# In-process exact vector search for scoped queries (source_ids).
+# Most /ask calls select 1-5 documents, a few thousand chunks: scoring all of them
+# with one matmul per document is faster than the ANN index and exact.
+#   - per document: ids (int64) and the embedding matrix (VECTOR_STORE_DTYPE,
+#     float32 | float16) in .npy files under FILES_DIR/vector_store, written on first
+#     use from chunks (binary protocol) and memory-mapped afterwards; the files are a
+#     DiskLRU (VECTOR_STORE_DISK_MB)
+#   - mapped matrices (+ their norms) stay in an in-process LRU of VECTOR_STORE_MEMORY_MB
+#   - the key is the document's index_generation, bumped whenever its chunks or
+#     embeddings change (cache.bump_generation, reindex switch), so entries never go stale;
+#     in memory also VECTOR_METRIC, which the precomputed norms depend on (the files
+#     hold only ids and vectors)
+# search() returns None when the store doesn't apply (off, no scope, the scope has
+# more than VECTOR_STORE_MAX_ROWS embedded chunks, another dimension): the caller
+# uses pgvector. Distances match pgvector's operators for VECTOR_METRIC.
+
+_GENERATIONS_SQL = text("SELECT id, index_generation FROM documents WHERE id = ANY(:ids)")
+_COUNTS_SQL = text("""
+    SELECT document_id, count(*) FROM chunks
+    WHERE document_id = ANY(:ids) AND embedding IS NOT NULL
+    GROUP BY document_id
+""")
+
+class _Entry:
+    __slots__ = ("ids", "vecs", "metric", "norms", "nbytes")
+
+    def __init__(self, ids: np.ndarray, vecs: np.ndarray, metric: str):
+        self.ids = ids
+        self.vecs = vecs
+        self.metric = metric
+        # cosine: 1 / |x|, l2: |x|^2 (ip'de gerekmez); float32, satır başına bir sayı
+        sq = np.einsum("ij,ij->i", vecs, vecs, dtype=np.float32) if len(vecs) else np.zeros(0, np.float32)
+        self.norms = sq if metric == "l2" else 1.0 / np.maximum(np.sqrt(sq), 1e-12)
+        self.nbytes = ids.nbytes + vecs.nbytes + self.norms.nbytes
+
+class VectorStore:
+    def __init__(self, root: str, max_bytes: int, disk_bytes: int):
+        self.max_bytes = max_bytes
+        self.files = DiskLRU(root, disk_bytes)
+        self._entries: "OrderedDict[Tuple[int, int, str], _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.hits = 0
+        self.disk_loads = 0
+        self.db_loads = 0
+        self.fallbacks = 0
+
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _rel(self, doc_id: int, generation: int, part: str) -> str:
+        return f"{doc_id % 256:02x}/{doc_id}-{generation}.{settings.vector_store_dtype}.{part}.npy"
+
+    def _cached(self, key: Tuple[int, int, str]) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _keep(self, key: Tuple[int, int, str], entry: _Entry) -> None:
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= old.nbytes
+
+    def _open(self, key: Tuple[int, int, str]) -> Optional[_Entry]:
+        """Memory-map the document's files if they are on disk."""
+        doc_id, generation, metric = key
+        ids_rel, vecs_rel = self._rel(doc_id, generation, "ids"), self._rel(doc_id, generation, "vecs")
+        if not (self.files.touch(ids_rel) and self.files.touch(vecs_rel)):
+            return None
+        try:
+            ids = np.load(self.files.path(ids_rel), mmap_mode="r")
+            vecs = np.load(self.files.path(vecs_rel), mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return None  # arada silinmiş / yarım dosya: DB'den yeniden yazılır
+        return _Entry(ids, vecs, metric)
+
+    def _write(self, key: Tuple[int, int, str]) -> _Entry:
+        """Read the document's embeddings from chunks and write its files."""
+        with engine.connect() as conn:
+            raw = conn.connection.driver_connection
+            with raw.cursor() as cur:
+                from pgvector.psycopg import register_vector_info
+                register_vector_info(cur, _vector_type_info(raw))
+                cur.execute(
+                    "SELECT id, embedding FROM chunks WHERE document_id = %s AND embedding IS NOT NULL ORDER BY id",
+                    (key[0],), binary=True,
+                )
+                rows = cur.fetchall()
+        ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        vecs = (np.stack([r[1] for r in rows]) if rows else np.zeros((0, 0), np.float32))
+        vecs = vecs.astype(settings.vector_store_dtype, copy=False)
+        for part, arr in (("ids", ids), ("vecs", vecs)):
+            rel = self._rel(key[0], key[1], part)
+            os.makedirs(os.path.dirname(self.files.path(rel)), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.files.path(rel)), suffix=".npy")
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, arr)
+            self.files.adopt(rel, tmp)
+        return self._open(key) or _Entry(ids, vecs, key[2])
+
+    def search(self, source_ids: Optional[Sequence[int]], query: Sequence[float], k: int) -> Optional[List[Tuple[int, float]]]:
+        """[(chunk_id, distance), ...] of the k chunks of source_ids nearest to query, or None (use pgvector)."""
+        if not self.enabled() or not source_ids or k <= 0:
+            return None
+        metric = vector_index.metric()
+        with engine.connect() as conn:
+            keys = [(d, g, metric) for d, g in conn.execute(_GENERATIONS_SQL, {"ids": sorted(set(source_ids))})]
+            entries: Dict[Tuple[int, int, str], _Entry] = {}
+            for key in keys:
+                entry = self._cached(key)
+                if entry is None:
+                    entry = self._open(key)
+                    if entry is not None:
+                        self.disk_loads += 1
+                        self._keep(key, entry)
+                if entry is not None:
+                    entries[key] = entry
+            missing = [key for key in keys if key not in entries]
+            counts = dict(conn.execute(_COUNTS_SQL, {"ids": [key[0] for key in missing]}).all()) if missing else {}
+        rows = sum(len(e.ids) for e in entries.values()) + sum(counts.values())
+        if rows > settings.vector_store_max_rows:
+            self.fallbacks += 1
+            return None
+        for key in missing:
+            with self._load_lock:
+                entry = self._cached(key)
+                if entry is None:
+                    entry = self._write(key)
+                    self.db_loads += 1
+                    self._keep(key, entry)
+            entries[key] = entry
+        if not missing:
+            self.hits += 1
+        return self._top_k(list(entries.values()), np.asarray(query, dtype=np.float32), k, metric)
+
+    def _top_k(self, entries: List[_Entry], q: np.ndarray, k: int, metric: str) -> Optional[List[Tuple[int, float]]]:
+        entries = [e for e in entries if len(e.ids)]
+        if not entries:
+            return []
+        if any(e.vecs.shape[1] != len(q) for e in entries):
+            self.fallbacks += 1
+            return None  # farklı boyut (reindex takası sürüyor): pgvector
+        dists, ids = [], []
+        for e in entries:
+            dot = e.vecs @ q if e.vecs.dtype == np.float32 else e.vecs.astype(np.float32) @ q
+            if metric == "cosine":
+                d = 1.0 - dot * e.norms / max(float(np.linalg.norm(q)), 1e-12)
+            elif metric == "ip":
+                d = -dot
+            else:
+                d = np.sqrt(np.maximum(e.norms - 2.0 * dot + float(q @ q), 0.0))
+            dists.append(d)
+            ids.append(e.ids)
+        dist = np.concatenate(dists) if len(dists) > 1 else dists[0]
+        chunk_ids = np.concatenate(ids) if len(ids) > 1 else ids[0]
+        if k < len(dist):
+            top = np.argpartition(dist, k - 1)[:k]
+        else:
+            top = np.arange(len(dist))
+        top = top[np.lexsort((chunk_ids[top], dist[top]))]
+        return [(int(chunk_ids[i]), float(dist[i])) for i in top]
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled(),
+            "documents": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "max_rows": settings.vector_store_max_rows,
+            "dtype": settings.vector_store_dtype,
+            "hits": self.hits,
+            "disk_loads": self.disk_loads,
+            "db_loads": self.db_loads,
+            "fallbacks": self.fallbacks,
+            "files": self.files.info(),
+        }
+
+vector_store = VectorStore(
+    os.path.join(settings.files_dir, "vector_store"),
+    settings.vector_store_memory_mb * 1024 * 1024,
+    settings.vector_store_disk_mb * 1024 * 1024,
+)
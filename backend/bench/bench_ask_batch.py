@@ -0,0 +1,137 @@
+"""Bulk Q&A throughput: N serial /ask calls vs. one /ask/batch call.
+
+Questions are three adjacent words of random chunks of the current database (run
+it on a corpus), --scoped of them restricted to the chunk's document. Requests go
+through the ASGI app in-process (httpx.ASGITransport). The LLM is simulated
+(--llm-ms per answer, +-25% jitter) unless --real-llm; the answer cache is off so
+every question reaches it. --embed-ms > 0 replaces the embedding provider by random
+unit vectors with that latency per embed_texts call (otherwise the configured
+provider, i.e. FTS only with EMBEDDINGS_PROVIDER=none).
+
+Reported per run: questions/sec, wall time, embed_texts calls and SQL statements
+(both engines). For /ask/batch the summary line's embed and retrieval times too.
+
+Usage (from backend/):
+    python -m bench.bench_ask_batch --questions 100 --llm-ms 800 --concurrency 1 4 16
+    python -m bench.bench_ask_batch --questions 200 --embed-ms 150 --scoped 0.5
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import httpx
+from sqlalchemy import event, text
+import app.answer_cache as answer_cache
+import app.main as main_module
+from app.db import SessionLocal, async_engine, engine
+from app.settings import settings
+
+counts = {"sql": 0, "embed": 0}
+
+def count_sql(*_args) -> None:
+    counts["sql"] += 1
+
+def make_questions(n: int, scoped: float, seed: int):
+    rnd = random.Random(seed)
+    db = SessionLocal()
+    try:
+        rows = db.execute(text("SELECT document_id, chunk_text FROM chunks ORDER BY random() LIMIT :n"), {"n": n * 4}).all()
+    finally:
+        db.close()
+    out = []
+    for doc_id, chunk in rows:
+        words = [w for w in chunk.split() if len(w) >= 4 and w.isalpha()]
+        if len(words) < 3:
+            continue
+        i = rnd.randrange(len(words) - 2)
+        item = {"question": " ".join(words[i:i + 3])}
+        if rnd.random() < scoped:
+            item["source_ids"] = [doc_id]
+        out.append(item)
+        if len(out) == n:
+            break
+    return out
+
+def patch(args) -> None:
+    settings.answer_cache_backend = "none"
+    if not args.real_llm:
+        async def fake_answer(question, evidence):
+            await asyncio.sleep(args.llm_ms / 1000 * random.uniform(0.75, 1.25))
+            return {"answer": f"({len(evidence)} kanıt) {question}", "citations": []}
+        answer_cache.answer_with_citations = fake_answer
+    real_embed = main_module.embed_texts
+
+    async def embed(texts, model=None, dim=None):
+        counts["embed"] += 1
+        if args.embed_ms <= 0:
+            return await real_embed(texts, model, dim)
+        await asyncio.sleep(args.embed_ms / 1000)
+        out = []
+        for t in texts:
+            rnd = random.Random(t)
+            v = [rnd.gauss(0, 1) for _ in range(settings.embedding_dim)]
+            norm = math.sqrt(sum(x * x for x in v)) or 1.0
+            out.append([x / norm for x in v])
+        return out
+    main_module.embed_texts = embed
+
+def reset() -> None:
+    counts["sql"] = counts["embed"] = 0
+    main_module.query_embedding_cache.clear()
+    main_module.retrieval_cache.clear()
+
+def report(label: str, n: int, seconds: float, extra: str = "") -> None:
+    print(f"{label:<22}{n / seconds:>10.2f}{seconds:>9.2f}{counts['embed']:>7}{counts['sql']:>6}  {extra}")
+
+async def run(args) -> None:
+    questions = make_questions(args.questions, args.scoped, args.seed)
+    if not questions:
+        raise SystemExit("no chunks with text: upload some documents first")
+    n = len(questions)
+    print(f"{n} questions ({sum('source_ids' in q for q in questions)} scoped), "
+          f"LLM {'real' if args.real_llm else f'{args.llm_ms:.0f} ms simulated'}, "
+          f"embeddings {f'{args.embed_ms:.0f} ms simulated' if args.embed_ms > 0 else settings.embeddings_provider}")
+    print(f"{'run':<22}{'q/sec':>10}{'sec':>9}{'embed':>7}{'sql':>6}")
+    transport = httpx.ASGITransport(app=main_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        reset()
+        t0 = time.perf_counter()
+        for q in questions:
+            r = await client.post("/ask", json={**q, "top_k": args.top_k})
+            r.raise_for_status()
+        report("serial /ask", n, time.perf_counter() - t0)
+
+        for c in args.concurrency:
+            reset()
+            t0 = time.perf_counter()
+            r = await client.post("/ask/batch", json={"questions": questions, "top_k": args.top_k, "concurrency": c})
+            r.raise_for_status()
+            lines = [json.loads(line) for line in r.text.splitlines() if line]
+            seconds = time.perf_counter() - t0
+            summary = lines[-1]
+            answered = sum(1 for line in lines if line["type"] == "answer")
+            assert answered == n, f"{answered} answers for {n} questions"
+            report(f"/ask/batch c={c}", n, seconds,
+                   f"embed {summary['embed_seconds']:.2f}s, retrieval {summary['retrieval_seconds']:.2f}s")
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--questions", type=int, default=100)
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    ap.add_argument("--scoped", type=float, default=0.0, help="fraction of questions with source_ids")
+    ap.add_argument("--top-k", type=int, default=8)
+    ap.add_argument("--llm-ms", type=float, default=800)
+    ap.add_argument("--real-llm", action="store_true", help="call CHAT_BASE_URL instead of simulating")
+    ap.add_argument("--embed-ms", type=float, default=0, help="> 0: simulated embeddings with this latency per call")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    patch(args)
+    event.listen(engine, "before_cursor_execute", count_sql)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_sql)
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
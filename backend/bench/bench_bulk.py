@@ -0,0 +1,75 @@
+"""Rows/sec for writing chunks: ORM unit-of-work vs. executemany vs. binary COPY.
+
+Needs a database with migrate.sql applied (DATABASE_URL). Rows are written under a
+throwaway document that is deleted afterwards.
+
+Usage (from backend/):
+    python -m bench.bench_bulk --rows 5000
+"""
+import argparse
+import random
+import time
+from sqlalchemy import insert, text
+from app.db import SessionLocal
+from app.models import Document, Chunk
+from app.settings import settings
+import app.bulk as bulk
+
+def make_rows(doc_id: int, n: int, with_embeddings: bool):
+    rnd = random.Random(0)
+    rows = []
+    for i in range(n):
+        rows.append({
+            "document_id": doc_id,
+            "section_path": None,
+            "page_start": i // 3 + 1,
+            "page_end": i // 3 + 1,
+            "chunk_text": "Sulh ve harb hususundaki nizamlar. " * 40,
+            "embedding": [rnd.random() for _ in range(settings.embedding_dim)] if with_embeddings else None,
+        })
+    return rows
+
+def run_orm(db, rows):
+    for r in rows:
+        db.add(Chunk(**r))
+    db.commit()
+
+def run_executemany(db, rows):
+    db.execute(insert(Chunk), rows)
+    db.commit()
+
+def run_copy(db, rows):
+    assert bulk.write_chunks(db, rows) == "copy"
+    db.commit()
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=5000)
+    ap.add_argument("--no-embeddings", action="store_true")
+    args = ap.parse_args()
+
+    db = SessionLocal()
+    doc = Document(title="bench_bulk", filename="bench_bulk.pdf")
+    db.add(doc)
+    db.commit()
+    doc_id = doc.id
+    rows = make_rows(doc_id, args.rows, not args.no_embeddings)
+
+    print(f"{args.rows} chunk rows, embeddings={'no' if args.no_embeddings else settings.embedding_dim}")
+    print(f"{'path':<14}{'seconds':>10}{'rows/s':>12}")
+    try:
+        for name, fn in (("orm", run_orm), ("executemany", run_executemany), ("copy binary", run_copy)):
+            db.execute(text("DELETE FROM chunks WHERE document_id = :d"), {"d": doc_id})
+            db.commit()
+            t0 = time.perf_counter()
+            fn(db, rows)
+            dt = time.perf_counter() - t0
+            print(f"{name:<14}{dt:>10.3f}{args.rows / dt:>12.0f}")
+    finally:
+        db.rollback()
+        db.execute(text("DELETE FROM documents WHERE id = :d"), {"d": doc_id})
+        db.commit()
+        db.close()
+
+if __name__ == "__main__":
+    main()
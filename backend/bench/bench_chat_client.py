@@ -0,0 +1,121 @@
+"""Chat completions under a burst: one httpx.AsyncClient per request (before) vs. chat_client.
+
+Starts a local OpenAI-compatible server that answers after --latency-ms and replies
+429 (Retry-After: 1) while more than --provider-limit requests are in flight, like a
+rate-limited hosted provider. --requests completions are sent --burst at a time:
+  legacy  new AsyncClient(timeout=120) per call, no limit, no retry (llm.py before)
+  pooled  chat_client.complete: keep-alive pool, CHAT_CONCURRENCY per provider
+          (set to --provider-limit), retries with jittered backoff
+Reported: answered, p50/p95 latency of answered calls, 429s and TCP connections
+seen by the server.
+
+Usage (from backend/):
+    python -m bench.bench_chat_client --requests 200 --burst 50 --provider-limit 8
+    python -m bench.bench_chat_client --latency-ms 1500 --provider-limit 4
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from app import chat_client, http_pool
+from app.settings import settings, update_chat_settings
+
+def provider_app(limit: int, latency: float, stats: dict) -> FastAPI:
+    app = FastAPI()
+    state = {"inflight": 0}
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        stats["connections"].add((request.client.host, request.client.port))
+        if state["inflight"] >= limit:
+            stats["429"] += 1
+            return JSONResponse({"error": "rate limited"}, status_code=429, headers={"Retry-After": "1"})
+        state["inflight"] += 1
+        try:
+            await asyncio.sleep(latency)
+        finally:
+            state["inflight"] -= 1
+        return {"choices": [{"message": {"content": json.dumps({"answer": body["model"], "citations": []})}}]}
+
+    return app
+
+def serve(app: FastAPI, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+async def legacy(payload: dict) -> bool:
+    url = settings.chat_base_url.rstrip("/") + "/chat/completions"
+    try:
+        async with httpx.AsyncClient(timeout=120) as client:
+            r = await client.post(url, json={**payload, "model": settings.chat_model})
+            r.raise_for_status()
+            r.json()["choices"][0]["message"]["content"]
+    except Exception:
+        return False
+    return True
+
+async def pooled(payload: dict) -> bool:
+    try:
+        await chat_client.complete(payload)
+    except chat_client.ChatError:
+        return False
+    return True
+
+async def run(fn, n: int, burst: int):
+    payload = {"messages": [{"role": "user", "content": "soru"}], "max_tokens": 16}
+    times, ok = [], 0
+    t0 = time.perf_counter()
+    for start in range(0, n, burst):
+        async def one():
+            t = time.perf_counter()
+            answered = await fn(payload)
+            return answered, (time.perf_counter() - t) * 1000
+        for answered, ms in await asyncio.gather(*(one() for _ in range(min(burst, n - start)))):
+            ok += answered
+            if answered:
+                times.append(ms)
+    await http_pool.close_clients()
+    chat_client._semaphores.clear()  # asyncio.run başına yeni event loop
+    return ok, times, time.perf_counter() - t0
+
+def p95(xs):
+    return sorted(xs)[min(len(xs) - 1, int(0.95 * len(xs)))] if xs else float("nan")
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--burst", type=int, default=50, help="requests sent at once")
+    ap.add_argument("--provider-limit", type=int, default=8, help="server: 429 above this many in flight")
+    ap.add_argument("--latency-ms", type=float, default=300)
+    ap.add_argument("--port", type=int, default=18181)
+    args = ap.parse_args()
+
+    stats = {"429": 0, "connections": set()}
+    server = serve(provider_app(args.provider_limit, args.latency_ms / 1000, stats), args.port)
+    settings.chat_concurrency = args.provider_limit
+    settings.chat_base_url, settings.chat_model = f"http://127.0.0.1:{args.port}/v1", "bench"
+    update_chat_settings({"chat_base_url": settings.chat_base_url, "chat_model": "bench", "chat_fallbacks": []})
+
+    print(f"{args.requests} requests in bursts of {args.burst}; provider: {args.latency_ms:.0f} ms, "
+          f"429 above {args.provider_limit} in flight")
+    print(f"{'client':<9}{'answered':>10}{'p50 ms':>9}{'p95 ms':>9}{'sec':>7}{'429s':>7}{'conns':>7}")
+    for label, fn in (("legacy", legacy), ("pooled", pooled)):
+        stats["429"] = 0
+        stats["connections"].clear()
+        ok, times, seconds = asyncio.run(run(fn, args.requests, args.burst))
+        print(f"{label:<9}{ok:>10}{statistics.median(times) if times else float('nan'):>9.0f}{p95(times):>9.0f}"
+              f"{seconds:>7.1f}{stats['429']:>7}{len(stats['connections']):>7}")
+    server.should_exit = True
+
+if __name__ == "__main__":
+    main()
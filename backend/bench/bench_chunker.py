@@ -0,0 +1,213 @@
+"""Paragraph vs. structure chunker (CHUNKER): retrieval quality and throughput.
+
+Builds a synthetic book with PyMuPDF's Story (h1 chapters, h2 sections, normal and
+oversized paragraphs; outline on, or off with --no-toc so headings come from font
+sizes) or uses --pdf. Each section hides "facts": one sentence with a unique key
+(direct questions) and one whose wording repeats in every section and only the
+section's topic word, which appears in the h2 heading alone, tells it apart
+(section questions). A question is answered at k if one of the top-k chunks contains
+the whole fact sentence. Ranking is in-memory BM25 over chunk text, and for
+"+section" over section_path + chunk text (what a section filter/boost can use).
+Throughput: extraction pages/s (get_text("text") vs. get_text("dict")) and
+chunking chunks/s on the extracted pages.
+
+Usage (from backend/):
+    python -m bench.bench_chunker --chapters 12 --sections 6
+    python -m bench.bench_chunker --no-toc --max-chars 1200 --overlap 150
+"""
+import argparse
+import math
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+import unicodedata
+from collections import Counter
+import fitz
+from app.chunking import IncrementalChunker, StructureChunker
+from app.pdf_extract import iter_pages_text
+
+WORDS = (
+    "devlet ordu asker nizam kanun hukum sefer eyalet kadi vezir padisah divan timar sipahi "
+    "yeniceri hazine vergi mukataa sancak beylerbeyi defter ferman reaya kale liman tersane"
+).split()
+TOPICS = ["tuna", "bosna", "misir", "bagdat", "kirim", "rodos", "tebriz", "halep", "budin", "sofya",
+          "kefe", "trablus", "cezayir", "erzurum", "van", "musul", "basra", "yemen", "sam", "konya"]
+
+def sentence(rnd: random.Random) -> str:
+    return " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(8, 18))).capitalize() + "."
+
+def build_book(chapters: int, sections: int, seed: int):
+    """[(chapter, section, topic, [paragraph, ...]), ...] and the facts [(question_kind, question, sentence)]."""
+    rnd = random.Random(seed)
+    book, facts = [], []
+    for c in range(1, chapters + 1):
+        for s in range(1, sections + 1):
+            topic = f"{TOPICS[(c * sections + s) % len(TOPICS)]}{c}x{s}"
+            paras = []
+            for p in range(rnd.randint(3, 7)):
+                n = rnd.randint(30, 60) if rnd.random() < 0.15 else rnd.randint(3, 8)  # arada dev paragraf
+                paras.append([sentence(rnd) for _ in range(n)])
+            key = f"kod{c}q{s}"
+            direct = f"Kayitta {key} numarali hukum kale muhafizlarinin {rnd.randint(100, 999)} akce alacagini bildirir."
+            scoped = f"Bu bolgede liman resmi {rnd.randint(10, 99)} akce olarak yazilmistir."
+            for fact in (direct, scoped):
+                para = paras[rnd.randrange(len(paras))]
+                para.insert(rnd.randrange(len(para) + 1), fact)
+            facts.append(("direct", f"{key} numarali hukum muhafiz akce", direct))
+            facts.append(("section", f"{topic} liman resmi akce", scoped))
+            book.append((f"Bolum {c}: {rnd.choice(WORDS).capitalize()} meseleleri", f"{c}.{s} {topic.capitalize()} kayitlari",
+                         topic, [" ".join(p) for p in paras]))
+    return book, facts
+
+def write_pdf(path: str, book, toc: bool) -> None:
+    html, last_chapter = [], None
+    for chapter, section, _, paras in book:
+        if chapter != last_chapter:
+            html.append(f"<h1>{chapter}</h1>")
+            last_chapter = chapter
+        html.append(f"<h2>{section}</h2>")
+        html.extend(f"<p>{p}</p>" for p in paras)
+    story = fitz.Story("".join(html), user_css="body {font-size: 10pt;} h1 {font-size: 18pt;} h2 {font-size: 13pt;}")
+    writer = fitz.DocumentWriter(path)
+    outline = []
+
+    def record(pos):
+        if pos.heading and pos.open_close & 1:
+            outline.append([pos.heading, pos.text, pos.page_num + 1])
+
+    page, more = 0, 1
+    while more:
+        dev = writer.begin_page(fitz.paper_rect("a4"))
+        more, _ = story.place(fitz.paper_rect("a4") + (50, 50, -50, -50))
+        story.element_positions(record, {"page_num": page})
+        story.draw(dev)
+        writer.end_page()
+        page += 1
+    writer.close()
+    if toc:
+        doc = fitz.open(path)
+        doc.set_toc(outline)
+        doc.saveIncr()
+        doc.close()
+
+_TOKEN = re.compile(r"\w+")
+
+def flatten(s: str) -> str:
+    # ligatürler (ﬁ) ve satır sonları karşılaştırmayı bozmasın
+    return " ".join(unicodedata.normalize("NFKC", s).split())
+
+def tokens(s: str):
+    return _TOKEN.findall(flatten(s).casefold())
+
+def bm25_rank(docs, queries, k: int):
+    """Top-k doc indexes per query (BM25, k1=1.2, b=0.75)."""
+    tfs = [Counter(tokens(d)) for d in docs]
+    lens = [sum(tf.values()) for tf in tfs]
+    avg = statistics.mean(lens) if lens else 1.0
+    df = Counter(t for tf in tfs for t in tf)
+    n = len(docs)
+    postings = {}
+    for i, tf in enumerate(tfs):
+        for t in tf:
+            postings.setdefault(t, []).append(i)
+    out = []
+    for q in queries:
+        scores = Counter()
+        for t in set(tokens(q)):
+            idf = math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5)) if df[t] else 0.0
+            for i in postings.get(t, ()):
+                f = tfs[i][t]
+                scores[i] += idf * f * 2.2 / (f + 1.2 * (0.25 + 0.75 * lens[i] / avg))
+        out.append([i for i, _ in scores.most_common(k)])
+    return out
+
+def answered(chunks, ranked, facts, k: int, kind: str) -> float:
+    flat = [flatten(c) for c in chunks]
+    hits = [any(fact in flat[i] for i in r[:k]) for r, (kd, _, fact) in zip(ranked, facts) if kd == kind]
+    return sum(hits) / len(hits) if hits else 0.0
+
+def run_chunker(make, pages):
+    chunker = make()
+    out = []
+    for page in pages:
+        out.extend(chunker.feed(page[0], page[1], page[2] if len(page) > 2 else None))
+    out.extend(chunker.finish())
+    return out
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pdf", help="use this PDF (throughput and size stats only; no questions)")
+    ap.add_argument("--chapters", type=int, default=10)
+    ap.add_argument("--sections", type=int, default=6)
+    ap.add_argument("--no-toc", action="store_true", help="no outline: headings from font sizes")
+    ap.add_argument("--max-chars", type=int, default=1800)
+    ap.add_argument("--overlap", type=int, default=200)
+    ap.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    facts, tmp = [], None
+    path = args.pdf
+    if not path:
+        book, facts = build_book(args.chapters, args.sections, args.seed)
+        tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+        tmp.close()
+        write_pdf(tmp.name, book, toc=not args.no_toc)
+        path = tmp.name
+    try:
+        extracted = {}
+        for mode, structured in (("paragraph", False), ("structure", True)):
+            best = float("inf")
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                pages = list(iter_pages_text(path, structured))
+                best = min(best, time.perf_counter() - t0)
+            extracted[mode] = (pages, best)
+        n_pages = len(extracted["paragraph"][0])
+        print(f"{os.path.basename(path)}: {n_pages} pages, outline={'no' if args.no_toc or args.pdf else 'yes'}, "
+              f"max_chars={args.max_chars}, overlap={args.overlap}, {len(facts)} questions")
+
+        makers = {
+            "paragraph": lambda: IncrementalChunker(max_chars=args.max_chars),
+            "structure": lambda: StructureChunker(max_chars=args.max_chars, overlap_chars=args.overlap),
+        }
+        print(f"{'chunker':<12}{'pages/s':>9}{'chunks/s':>11}{'chunks':>8}{'mean':>7}{'max':>7}{'>max':>6}{'w/ sect':>9}")
+        results = {}
+        for mode, make in makers.items():
+            pages, extract_s = extracted[mode]
+            best = float("inf")
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                chunks = run_chunker(make, pages)
+                best = min(best, time.perf_counter() - t0)
+            sizes = [len(c["chunk_text"]) for c in chunks]
+            with_section = sum(1 for c in chunks if c["section_path"]) / len(chunks) if chunks else 0.0
+            print(f"{mode:<12}{n_pages / extract_s:>9.0f}{len(chunks) / best:>11.0f}{len(chunks):>8}"
+                  f"{statistics.mean(sizes):>7.0f}{max(sizes):>7}{sum(s > args.max_chars for s in sizes):>6}{with_section:>9.0%}")
+            results[mode] = chunks
+
+        if facts:
+            kmax = max(args.k)
+            print("\nquestions answered at k (whole fact sentence inside a top-k chunk, BM25):")
+            header = "".join(f"{f'{kind}@{k}':>12}" for kind in ("direct", "section") for k in args.k)
+            print(f"{'ranking':<22}{header}")
+            questions = [q for _, q, _ in facts]
+            for mode, chunks in results.items():
+                texts = [c["chunk_text"] for c in chunks]
+                variants = [("text", texts)]
+                if any(c["section_path"] for c in chunks):
+                    variants.append(("+section", [f"{c['section_path'] or ''}\n{c['chunk_text']}" for c in chunks]))
+                for label, docs in variants:
+                    ranked = bm25_rank(docs, questions, kmax)
+                    row = "".join(f"{answered(texts, ranked, facts, k, kind):>12.3f}" for kind in ("direct", "section") for k in args.k)
+                    print(f"{mode + ' ' + label:<22}{row}")
+    finally:
+        if tmp:
+            os.remove(tmp.name)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Prompt size, packing cost and time-to-first-token: raw top-k excerpts vs. evidence.pack_evidence.
+
+Questions are made from the database's own chunks: a random sentence of a random chunk
+becomes the "answer", its longer words the question. Each question is answered with
+the FTS top --top-k, then the prompt is built twice with llm._build_payload:
+  raw:    every result as chunk_text[:1200] (the previous behaviour)
+  packed: pack_evidence (merge neighbours, drop near-duplicates, trim to the budget)
+"kept" is the fraction of questions whose answer sentence is still in the prompt.
+--ttft streams both prompts to the configured chat endpoint (CHAT_BASE_URL) and
+reports time to the first token.
+
+--synthetic N writes a throwaway document of N overlapping chunks (with repeated
+passages, like re-uploaded editions) and deletes it afterwards; otherwise the
+documents already in DATABASE_URL are used.
+
+Usage (from backend/):
+    python -m bench.bench_evidence --synthetic 2000 --questions 200
+    python -m bench.bench_evidence --questions 50 --ttft 10
+    python -m bench.bench_evidence --budget 1000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import httpx
+from sqlalchemy import text
+from app.bulk import write_chunks
+from app.db import SessionLocal
+from app.embeddings import approx_tokens
+from app.evidence import evidence_budget, pack_evidence
+from app.llm import _build_payload
+from app.models import Document
+from app.search import fts_search
+from app.settings import get_chat_settings
+from app.chunking import split_sentences
+
+WORDS = (
+    "devlet ordu asker nizam kanun hukum sefer eyalet kadi vezir padisah divan timar sipahi "
+    "yeniceri hazine vergi mukataa sancak beylerbeyi defter ferman reaya kale liman tersane"
+).split()
+
+def build_synthetic(db, n_chunks: int, seed: int) -> int:
+    """Chunks of ~1500 chars; each repeats the tail of the previous one (chunk overlap),
+    every 10th repeats an earlier chunk nearly verbatim (a second edition of a passage)."""
+    rnd = random.Random(seed)
+    doc = Document(title="bench_evidence", filename="bench_evidence.pdf")
+    db.add(doc)
+    db.commit()
+    rows, texts, tail = [], [], ""
+    for i in range(n_chunks):
+        if i % 10 == 9 and texts:
+            body = rnd.choice(texts).replace(".", ",", 1)
+        else:
+            body = " ".join(
+                " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(8, 16))).capitalize() + f" kayit{i}x{j}."
+                for j in range(rnd.randint(10, 14))
+            )
+        chunk = f"{tail} {body}".strip()
+        texts.append(body)
+        tail = body[-200:].split(" ", 1)[-1]
+        rows.append({"document_id": doc.id, "section_path": None, "page_start": i // 3 + 1, "page_end": i // 3 + 1,
+                     "chunk_text": chunk, "embedding": None})
+    write_chunks(db, rows)
+    db.commit()
+    return doc.id
+
+def make_questions(db, n: int, seed: int, source_ids):
+    rnd = random.Random(seed)
+    where = "WHERE document_id = ANY(:ids)" if source_ids else ""
+    params = {"ids": source_ids} if source_ids else {}
+    rows = db.execute(text(f"SELECT chunk_text FROM chunks {where} ORDER BY random() LIMIT :n"), {**params, "n": n}).all()
+    questions = []
+    for (chunk_text,) in rows:
+        sentences = [s for s in split_sentences(" ".join(chunk_text.split())) if len(s.split()) >= 6]
+        if not sentences:
+            continue
+        answer = rnd.choice(sentences)
+        words = [w.strip(".,;:") for w in answer.split() if len(w) > 4]
+        questions.append({"question": " ".join(rnd.sample(words, min(6, len(words)))), "answer": answer})
+    return questions
+
+def prompt_tokens(payload) -> int:
+    return sum(approx_tokens(m["content"]) for m in payload["messages"])
+
+def p95(xs):
+    return sorted(xs)[min(len(xs) - 1, int(0.95 * len(xs)))]
+
+async def ttft(payload) -> float:
+    chat = get_chat_settings()
+    url = chat["chat_base_url"].rstrip("/") + "/chat/completions"
+    headers = {"Authorization": f"Bearer {chat['chat_api_key']}"}
+    t0 = time.perf_counter()
+    async with httpx.AsyncClient(timeout=120) as client:
+        async with client.stream("POST", url, json={**payload, "stream": True}, headers=headers) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if line.startswith("data:") and '"content"' in line:
+                    return time.perf_counter() - t0
+    return time.perf_counter() - t0
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--synthetic", type=int, default=0, help="write a throwaway document with N chunks")
+    ap.add_argument("--questions", type=int, default=100)
+    ap.add_argument("--top-k", type=int, default=12)
+    ap.add_argument("--budget", type=int, default=None, help="evidence tokens (default: evidence_budget for CHAT_MODEL)")
+    ap.add_argument("--ttft", type=int, default=0, help="stream this many questions to the chat endpoint")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    db = SessionLocal()
+    doc_id = None
+    try:
+        if args.synthetic:
+            doc_id = build_synthetic(db, args.synthetic, args.seed)
+        source_ids = [doc_id] if doc_id else None
+        questions = make_questions(db, args.questions, args.seed, source_ids)
+        if not questions:
+            print("no chunks: ingest some documents or use --synthetic N")
+            return
+        chat_model = get_chat_settings()["chat_model"]
+        print(f"{len(questions)} questions, top_k={args.top_k}, chat model {chat_model}, "
+              f"evidence budget {args.budget or evidence_budget(questions[0]['question'])} tokens")
+
+        stats = {"raw": {"tokens": [], "blocks": [], "kept": 0}, "packed": {"tokens": [], "blocks": [], "kept": 0}}
+        pack_ms, payloads = [], []
+        for q in questions:
+            results = fts_search(db, q["question"], source_ids=source_ids, limit=args.top_k)
+            raw = [{**r, "excerpt": r["chunk_text"][:1200].strip()} for r in results]
+            t0 = time.perf_counter()
+            packed = pack_evidence(q["question"], results, budget=args.budget)
+            pack_ms.append((time.perf_counter() - t0) * 1000)
+            pair = {}
+            for name, evidence in (("raw", raw), ("packed", packed)):
+                payload = _build_payload(q["question"], evidence, {"chat_model": chat_model})
+                s = stats[name]
+                s["tokens"].append(prompt_tokens(payload))
+                s["blocks"].append(len(evidence))
+                s["kept"] += any(q["answer"] in " ".join(e["excerpt"].split()) for e in evidence)
+                pair[name] = payload
+            payloads.append(pair)
+
+        print(f"{'prompt':<10}{'blocks':>8}{'tokens':>9}{'p95':>8}{'kept':>8}")
+        for name, s in stats.items():
+            print(f"{name:<10}{statistics.mean(s['blocks']):>8.1f}{statistics.mean(s['tokens']):>9.0f}"
+                  f"{p95(s['tokens']):>8}{s['kept'] / len(questions):>8.1%}")
+        saved = 1 - statistics.mean(stats["packed"]["tokens"]) / statistics.mean(stats["raw"]["tokens"])
+        print(f"prompt tokens -{saved:.0%}; pack_evidence p50 {statistics.median(pack_ms):.2f} ms, p95 {p95(pack_ms):.2f} ms")
+
+        if args.ttft:
+            for name in ("raw", "packed"):
+                times = [asyncio.run(ttft(pair[name])) for pair in payloads[:args.ttft]]
+                print(f"ttft {name:<8} p50 {statistics.median(times) * 1000:.0f} ms, p95 {p95(times) * 1000:.0f} ms")
+    finally:
+        if doc_id:
+            db.execute(text("DELETE FROM documents WHERE id = :id"), {"id": doc_id})
+            db.commit()
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Pages/sec of PDF text extraction vs. number of worker processes.
+
+Usage (from backend/):
+    python -m bench.bench_extract                 # synthetic 400-page PDF
+    python -m bench.bench_extract path/to/file.pdf --workers 1 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import fitz
+from app.settings import settings
+from app.pdf_extract import extract_pages_text, extract_pages_text_async, shutdown_executor
+
+LOREM = (
+    "Devlet-i Aliyye'nin sulh ve harb hususundaki nizamları, ordunun tertibi ve "
+    "serhadlerin muhafazası hakkında yazılmış risaleler bu bölümde incelenmiştir. "
+)
+
+def make_synthetic_pdf(path: str, pages: int) -> None:
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), f"Sayfa {i + 1}\n\n" + LOREM * 30, fontsize=9)
+    doc.save(path)
+    doc.close()
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("pdf", nargs="?")
+    ap.add_argument("--pages", type=int, default=400)
+    ap.add_argument("--workers", type=int, nargs="+", default=None)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    path = args.pdf
+    tmp = None
+    if not path:
+        tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+        tmp.close()
+        make_synthetic_pdf(tmp.name, args.pages)
+        path = tmp.name
+
+    cpus = os.cpu_count() or 1
+    workers = args.workers or sorted({1, 2, 4, cpus})
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        _, pages = extract_pages_text(path)
+        best = min(best, time.perf_counter() - t0)
+    n = len(pages)
+    print(f"{n} pages, {cpus} cpus")
+    print(f"{'mode':<14}{'best s':>10}{'pages/s':>12}{'speedup':>10}")
+    print(f"{'sequential':<14}{best:>10.3f}{n / best:>12.1f}{1.0:>10.2f}")
+    baseline = best
+
+    for w in workers:
+        shutdown_executor()
+        settings.extract_workers = w
+        # pool'u ısıt (spawn maliyeti ölçüme girmesin)
+        asyncio.run(extract_pages_text_async(path, workers=w))
+        best = float("inf")
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            asyncio.run(extract_pages_text_async(path, workers=w))
+            best = min(best, time.perf_counter() - t0)
+        print(f"{'pool x' + str(w):<14}{best:>10.3f}{n / best:>12.1f}{baseline / best:>10.2f}")
+
+    shutdown_executor()
+    if tmp:
+        os.remove(tmp.name)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Lexical search latency and hits: the previous FTS path vs. search.fts_search.
+
+Writes a throwaway document of --chunks synthetic chunks (Zipf-distributed pseudo-words
+with Turkish letters and transliteration marks: â î û ş ç ğ ı ö ü) and asks four kinds
+of questions, each made from one target chunk:
+  words:  three of its rarer words
+  phrase: two adjacent words in quotes
+  folded: its accented words typed without marks ("seriat" for "şerîat")
+  typo:   its rarest long word with one letter changed (FTS misses; fallback path)
+hit@10 = the target chunk is in the top 10.
+
+"legacy" is the SQL search.py used before: plainto_tsquery written twice, ts_rank on
+every match, ILIKE '%tok%' ordered by id when FTS finds nothing. "current" is
+fts_search: websearch_to_tsquery computed once, ts_rank_cd, the unaccent lexemes and
+the pg_trgm fallback when migrate.sql could install them (printed at start).
+
+Usage (from backend/):
+    python -m bench.bench_fts --chunks 200000 --queries 200
+    python -m bench.bench_fts --chunks 20000 --kinds folded typo
+"""
+import argparse
+import itertools
+import random
+import statistics
+import time
+from sqlalchemy import text
+from app.bulk import write_chunks
+from app.db import SessionLocal
+from app.models import Document
+from app import search
+
+VOWELS = list("aeıioöuü") + ["â", "î", "û"]
+CONSONANTS = list("bcçdfgğhklmnprsştvyz")
+FOLD = str.maketrans("âîûşçğıöü", "aiuscgiou")
+KINDS = ("words", "phrase", "folded", "typo")
+
+def make_vocab(n: int, rnd: random.Random):
+    vocab = set()
+    while len(vocab) < n:
+        vocab.add("".join(rnd.choice(CONSONANTS) + rnd.choice(VOWELS) for _ in range(rnd.randint(2, 4))))
+    return sorted(vocab)
+
+def build_corpus(db, n_chunks: int, words_per_chunk: int, seed: int):
+    rnd = random.Random(seed)
+    vocab = make_vocab(40000, rnd)
+    rnd.shuffle(vocab)
+    cum = list(itertools.accumulate(1.0 / (r + 1) ** 1.05 for r in range(len(vocab))))
+    rank = {w: r for r, w in enumerate(vocab)}
+    doc = Document(title="bench_fts", filename="bench_fts.pdf")
+    db.add(doc)
+    db.commit()
+    texts = []
+    for start in range(0, n_chunks, 5000):
+        rows = []
+        for i in range(start, min(n_chunks, start + 5000)):
+            words = rnd.choices(vocab, cum_weights=cum, k=words_per_chunk)
+            texts.append(words)
+            rows.append({"document_id": doc.id, "section_path": None, "page_start": i // 4 + 1, "page_end": i // 4 + 1,
+                         "chunk_text": " ".join(words) + ".", "embedding": None})
+        write_chunks(db, rows)
+        db.commit()
+    ids = [r[0] for r in db.execute(text("SELECT id FROM chunks WHERE document_id = :d ORDER BY id"), {"d": doc.id}).all()]
+    return doc.id, ids, texts, rank
+
+def make_questions(ids, texts, rank, kind: str, n: int, rnd: random.Random):
+    out = []
+    while len(out) < n:
+        i = rnd.randrange(len(texts))
+        words = texts[i]
+        rare = sorted(set(words), key=lambda w: -rank[w])
+        if kind == "words":
+            q = " ".join(rare[:3])
+        elif kind == "phrase":
+            j = max(range(len(words) - 1), key=lambda j: rank[words[j]] + rank[words[j + 1]])
+            q = f'"{words[j]} {words[j + 1]}"'
+        elif kind == "folded":
+            marked = [w for w in rare[:8] if w.translate(FOLD) != w][:2]
+            if not marked:
+                continue
+            q = " ".join(w.translate(FOLD) for w in marked)
+        else:
+            long = [w for w in rare[:6] if len(w) >= 6]
+            if not long:
+                continue
+            w = long[0]
+            k = rnd.randrange(1, len(w) - 1)
+            q = w[:k] + ("x" if w[k] != "x" else "y") + w[k + 1:]
+        out.append((q, ids[i]))
+    return out
+
+def legacy_search(db, question: str, source_ids, limit: int):
+    params = {"q": question, "lim": limit, "source_ids": source_ids}
+    rows = db.execute(text("""
+        SELECT c.id FROM chunks c JOIN documents d ON d.id = c.document_id
+        WHERE c.fts @@ plainto_tsquery('turkish', :q) AND c.document_id = ANY(:source_ids)
+        ORDER BY ts_rank(c.fts, plainto_tsquery('turkish', :q)) DESC, c.id
+        LIMIT :lim
+    """), params).all()
+    if rows:
+        return [r[0] for r in rows], False
+    patterns = [f"%{t}%" for t in question.split() if len(t) >= 3][:8] or [f"%{question}%"]
+    rows = db.execute(text("""
+        SELECT c.id FROM chunks c JOIN documents d ON d.id = c.document_id
+        WHERE c.chunk_text ILIKE ANY(:patterns) AND c.document_id = ANY(:source_ids)
+        ORDER BY c.id DESC
+        LIMIT :lim
+    """), {"patterns": patterns, "lim": limit, "source_ids": source_ids}).all()
+    return [r[0] for r in rows], True
+
+def current_search(db, question: str, source_ids, limit: int):
+    rows = db.execute(*search._fts_query(question, source_ids, limit)).mappings().all()
+    if rows:
+        return [r["id"] for r in rows], False
+    fallback = search._fallback_query(question, source_ids, limit)
+    return ([r["id"] for r in db.execute(*fallback).mappings().all()] if fallback else []), True
+
+def p95(xs):
+    return sorted(xs)[min(len(xs) - 1, int(0.95 * len(xs)))]
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=100000)
+    ap.add_argument("--words", type=int, default=90, help="words per chunk")
+    ap.add_argument("--queries", type=int, default=100, help="per kind")
+    ap.add_argument("--kinds", nargs="+", default=list(KINDS), choices=KINDS)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    features = search.check_lexical()
+    db = SessionLocal()
+    doc_id = None
+    try:
+        t0 = time.perf_counter()
+        doc_id, ids, texts, rank = build_corpus(db, args.chunks, args.words, args.seed)
+        db.execute(text("ANALYZE chunks"))
+        db.commit()
+        print(f"{args.chunks} chunks written in {time.perf_counter() - t0:.0f}s; "
+              f"unaccent={'yes' if features['unaccent'] else 'no'}, pg_trgm={'yes' if features['trigram'] else 'no'}")
+        rnd = random.Random(args.seed + 1)
+        print(f"{'kind':<8}{'engine':<9}{f'hit@{args.k}':>8}{'fallback':>10}{'p50 ms':>9}{'p95 ms':>9}")
+        for kind in args.kinds:
+            questions = make_questions(ids, texts, rank, kind, args.queries, rnd)
+            for name, fn in (("legacy", legacy_search), ("current", current_search)):
+                fn(db, questions[0][0], [doc_id], args.k)  # ısınma
+                hits, fallbacks, times = 0, 0, []
+                for q, target in questions:
+                    t = time.perf_counter()
+                    found, fell_back = fn(db, q, [doc_id], args.k)
+                    times.append((time.perf_counter() - t) * 1000)
+                    db.rollback()
+                    hits += target in found
+                    fallbacks += fell_back
+                n = len(questions)
+                print(f"{kind:<8}{name:<9}{hits / n:>8.1%}{fallbacks / n:>10.0%}"
+                      f"{statistics.median(times):>9.1f}{p95(times):>9.1f}")
+    finally:
+        if doc_id:
+            db.rollback()
+            db.execute(text("DELETE FROM documents WHERE id = :id"), {"id": doc_id})
+            db.commit()
+        db.close()
+
+if __name__ == "__main__":
+    main()
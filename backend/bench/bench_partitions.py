@@ -0,0 +1,206 @@
+"""Plain vs. hash-partitioned chunks: scoped search, unscoped ANN and document deletes.
+
+Builds two scratch tables shaped like chunks (bench_chunks_plain, and
+bench_chunks_hash partitioned by hash(document_id) into --partitions), each with
+--docs documents x --chunks-per-doc chunks of Zipf pseudo-words and clustered,
+L2-normalized vectors, a GIN fts index, a (document_id) btree and the configured ANN
+index (app.vector_index, full storage). Both are dropped at the end.
+
+Measured per layout:
+  scoped vector: source_ids of 1/10/100 documents, "ann" = nearest_sql as before
+                 (the planner usually walks the ANN index and filters afterwards) and
+                 "exact" (search.py's path for scopes up to SCOPED_EXACT_MAX_ROWS
+                 chunks); "rows" = returned/k, recall against exact
+  scoped fts:    two words of a chunk in scope
+  unscoped ANN:  recall@k against exact, p50/p95
+  delete:        DELETE of one document's chunks (rolled back)
+
+Usage (from backend/):
+    python -m bench.bench_partitions --docs 10000 --chunks-per-doc 20
+    python -m bench.bench_partitions --docs 20000 --partitions 32 --scopes 1 5 50
+"""
+import argparse
+import itertools
+import math
+import random
+import statistics
+import time
+from sqlalchemy import text
+from app.db import SessionLocal
+import app.bulk as bulk
+import app.vector_index as vector_index
+
+LAYOUTS = ("plain", "hash")
+VOWELS = list("aeıioöuü")
+CONSONANTS = list("bcçdfgğhklmnprsştvyz")
+
+def table(layout: str) -> str:
+    return f"bench_chunks_{layout}"
+
+def create_table(db, layout: str, dim: int, partitions: int) -> None:
+    name = table(layout)
+    db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+    columns = f"""
+        id bigint NOT NULL, document_id int NOT NULL, chunk_text text NOT NULL, embedding vector({dim}),
+        fts tsvector GENERATED ALWAYS AS (to_tsvector('turkish', chunk_text)) STORED
+    """
+    if layout == "hash":
+        db.execute(text(f"CREATE TABLE {name} ({columns}, PRIMARY KEY (id, document_id)) PARTITION BY HASH (document_id)"))
+        for i in range(partitions):
+            db.execute(text(
+                f"CREATE TABLE {name}_{i} PARTITION OF {name} FOR VALUES WITH (MODULUS {partitions}, REMAINDER {i})"
+            ))
+    else:
+        db.execute(text(f"CREATE TABLE {name} ({columns}, PRIMARY KEY (id))"))
+    db.commit()
+
+def make_vocab(n: int, rnd: random.Random):
+    vocab = set()
+    while len(vocab) < n:
+        vocab.add("".join(rnd.choice(CONSONANTS) + rnd.choice(VOWELS) for _ in range(rnd.randint(2, 4))))
+    return sorted(vocab)
+
+def generate(docs: int, per_doc: int, dim: int, seed: int):
+    """Rows (id, document_id, text, vector) in batches; a document's vectors share a topic center."""
+    rnd = random.Random(seed)
+    vocab = make_vocab(20000, rnd)
+    cum = list(itertools.accumulate(1.0 / (r + 1) ** 1.05 for r in range(len(vocab))))
+    centers = [[rnd.gauss(0, 1) for _ in range(dim)] for _ in range(64)]
+    chunk_id, batch = 0, []
+    for doc in range(1, docs + 1):
+        center = centers[rnd.randrange(len(centers))]
+        for _ in range(per_doc):
+            chunk_id += 1
+            v = [x + rnd.gauss(0, 0.8) for x in center]
+            norm = math.sqrt(sum(x * x for x in v)) or 1.0
+            batch.append((chunk_id, doc, " ".join(rnd.choices(vocab, cum_weights=cum, k=60)), [x / norm for x in v]))
+        if len(batch) >= 20000:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def load(db, layouts, args) -> float:
+    t0 = time.perf_counter()
+    for rows in generate(args.docs, args.chunks_per_doc, args.dim, args.seed):
+        for layout in layouts:
+            bulk._copy_rows(db, table(layout), ("id", "document_id", "chunk_text", "embedding"),
+                            ("int8", "int4", "text", "vector"), rows)
+        db.commit()
+    return time.perf_counter() - t0
+
+def build_indexes(db, layout: str, rows: int, dim: int) -> float:
+    name = table(layout)
+    t0 = time.perf_counter()
+    db.execute(text(f"CREATE INDEX {name}_doc ON {name} (document_id)"))
+    db.execute(text(f"CREATE INDEX {name}_fts ON {name} USING gin (fts)"))
+    db.execute(text(vector_index.index_ddl(
+        name, "embedding", f"{name}_vec", vector_index.index_type(), vector_index.metric(), rows,
+        concurrently=False, storage_name="full", dim=dim,
+    )))
+    db.execute(text(f"ANALYZE {name}"))
+    db.commit()
+    return time.perf_counter() - t0
+
+def nearest(db, layout: str, q, k: int, scope=None, exact: bool = False):
+    params = {"qvec": q, "k": k}
+    where = ""
+    if scope:
+        params["source_ids"] = scope
+        where = "AND c.document_id = ANY(:source_ids)"
+    sql = vector_index.nearest_sql(table=table(layout), where=where, storage_name="full", dim=len(q), exact=exact)
+    return [r[0] for r in db.execute(text(sql), params).all()]
+
+def fts(db, layout: str, question: str, k: int, scope):
+    return [r[0] for r in db.execute(text(f"""
+        SELECT c.id FROM {table(layout)} c, (SELECT websearch_to_tsquery('turkish', :q) AS query) q
+        WHERE c.fts @@ q.query AND c.document_id = ANY(:source_ids)
+        ORDER BY ts_rank_cd(c.fts, q.query) DESC, c.id LIMIT :k
+    """), {"q": question, "k": k, "source_ids": scope}).all()]
+
+def timed(db, fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(db, *args, **kwargs)
+    ms = (time.perf_counter() - t0) * 1000
+    db.rollback()
+    return out, ms
+
+def p95(xs):
+    return sorted(xs)[min(len(xs) - 1, int(0.95 * len(xs)))]
+
+def line(label: str, times, rows=None, recall=None) -> None:
+    extra = f"{rows:>8.2f}" if rows is not None else f"{'':>8}"
+    extra += f"{recall:>8.3f}" if recall is not None else f"{'':>8}"
+    print(f"{label:<30}{extra}{statistics.median(times):>9.2f}{p95(times):>9.2f}")
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=10000)
+    ap.add_argument("--chunks-per-doc", type=int, default=20)
+    ap.add_argument("--dim", type=int, default=64)
+    ap.add_argument("--partitions", type=int, default=16)
+    ap.add_argument("--scopes", type=int, nargs="+", default=[1, 10, 100], help="documents per scoped query")
+    ap.add_argument("--queries", type=int, default=50)
+    ap.add_argument("--deletes", type=int, default=50)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rows = args.docs * args.chunks_per_doc
+    db = SessionLocal()
+    try:
+        for layout in LAYOUTS:
+            create_table(db, layout, args.dim, args.partitions)
+        load_s = load(db, LAYOUTS, args)
+        print(f"{args.docs} documents, {rows} chunks, dim {args.dim}, {vector_index.index_type()} "
+              f"({vector_index.metric()}), hash partitions {args.partitions}; loaded in {load_s:.0f}s")
+        for layout in LAYOUTS:
+            print(f"  {layout}: indexes built in {build_indexes(db, layout, rows, args.dim):.0f}s")
+
+        rnd = random.Random(args.seed + 1)
+        queries = [v for batch in generate(args.queries, 1, args.dim, args.seed) for _, _, _, v in batch]
+        words = db.execute(text(f"SELECT chunk_text FROM {table('plain')} ORDER BY random() LIMIT 1")).scalar().split()
+        db.rollback()
+        scopes = {n: [rnd.sample(range(1, args.docs + 1), n) for _ in queries] for n in args.scopes}
+        victims = rnd.sample(range(1, args.docs + 1), args.deletes)
+
+        print(f"\n{'query':<30}{'rows':>8}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}")
+        for layout in LAYOUTS:
+            print(f"[{layout}]")
+            for n, scope_list in scopes.items():
+                truth = [nearest(db, layout, q, args.k, s, exact=True) for q, s in zip(queries, scope_list)]
+                db.rollback()
+                for label, exact in (("ann", False), ("exact", True)):
+                    found, times = [], []
+                    for q, s in zip(queries, scope_list):
+                        out, ms = timed(db, nearest, layout, q, args.k, s, exact=exact)
+                        found.append(out)
+                        times.append(ms)
+                    returned = statistics.mean(len(f) / args.k for f in found)
+                    recall = statistics.mean(len(set(f) & set(t)) / max(1, len(t)) for f, t in zip(found, truth))
+                    line(f"vector {n:>3} docs {label}", times, returned, recall)
+                times = [timed(db, fts, layout, " ".join(rnd.sample(words, 2)), args.k, s)[1] for s in scope_list]
+                line(f"fts    {n:>3} docs", times)
+
+            truth = [nearest(db, layout, q, args.k, exact=True) for q in queries]
+            db.rollback()
+            found, times = zip(*(timed(db, nearest, layout, q, args.k) for q in queries))
+            recall = statistics.mean(len(set(f) & set(t)) / args.k for f, t in zip(found, truth))
+            line("vector unscoped ann", times, statistics.mean(len(f) / args.k for f in found), recall)
+
+            times = []
+            for doc in victims:
+                t0 = time.perf_counter()
+                db.execute(text(f"DELETE FROM {table(layout)} WHERE document_id = :d"), {"d": doc})
+                times.append((time.perf_counter() - t0) * 1000)
+                db.rollback()
+            line("delete document", times)
+    finally:
+        db.rollback()
+        for layout in LAYOUTS:
+            db.execute(text(f"DROP TABLE IF EXISTS {table(layout)}"))
+        db.commit()
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Index memory, recall and latency of VECTOR_STORAGE=full | halfvec | binary.
+
+Builds one ANN index per storage on its own table (bench_quant, dropped afterwards)
+and runs the same queries search.py runs (vector_index.nearest_sql): quantized
+storage reads k * rerank candidates through the compact index and re-ranks them on
+the full vectors. Recall is against exact search with index scans disabled. Vectors
+are clustered and L2-normalized like embedding-model output (see bench_vector_index);
+binary quantization does noticeably better on real embeddings than on random data.
+
+Usage (from backend/):
+    python -m bench.bench_quantization --rows 20000 --dim 1536
+    python -m bench.bench_quantization --storages full binary --rerank 1 4 8 16
+"""
+import argparse
+import random
+import statistics
+import time
+from sqlalchemy import text
+from app.db import SessionLocal
+from app.settings import settings
+import app.bulk as bulk
+import app.vector_index as vector_index
+from bench.bench_vector_index import make_vectors, percentile
+
+TABLE = "bench_quant"
+
+def run_queries(db, sql, queries, k, k_ann, ef_search):
+    results, latencies = [], []
+    for q in queries:
+        if ef_search:
+            db.execute(text(f"SET LOCAL hnsw.ef_search = {ef_search}"))
+        else:
+            db.execute(text("SET LOCAL enable_indexscan = off"))
+        t0 = time.perf_counter()
+        results.append([r[0] for r in db.execute(text(sql), {"qvec": q, "k": k, "k_ann": k_ann}).all()])
+        latencies.append((time.perf_counter() - t0) * 1000)
+        db.rollback()
+    return results, latencies
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=20000)
+    ap.add_argument("--dim", type=int, default=settings.embedding_dim)
+    ap.add_argument("--clusters", type=int, default=50)
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--storages", nargs="+", default=["full", "halfvec", "binary"])
+    ap.add_argument("--rerank", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--ef-search", type=int, default=settings.hnsw_ef_search)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    metric = vector_index.metric()
+    rnd = random.Random(args.seed)
+    data = make_vectors(args.rows, args.dim, args.clusters, rnd)
+    queries = make_vectors(args.queries, args.dim, args.clusters, random.Random(args.seed + 1))
+
+    db = SessionLocal()
+    try:
+        version = vector_index.pgvector_version(db)
+        storages = [s for s in args.storages if s == "full" or version >= vector_index._QUANTIZE_MIN_VERSION]
+        if storages != args.storages:
+            print(f"pgvector {'.'.join(map(str, version))}: halfvec/binary need >= 0.7.0, skipped")
+
+        db.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        db.execute(text(f"CREATE TABLE {TABLE} (id serial PRIMARY KEY, embedding vector({args.dim}))"))
+        bulk._copy_rows(db, TABLE, ("embedding",), ("vector",), [(v,) for v in data])
+        db.commit()
+        db.execute(text(f"ANALYZE {TABLE}"))
+        db.commit()
+        table_size = db.execute(text(f"SELECT pg_total_relation_size('{TABLE}')")).scalar()
+
+        print(f"{args.rows} rows x {args.dim} dims, {args.queries} queries, recall@{args.k}, metric={metric}, "
+              f"hnsw ef_search>={args.ef_search}; table (heap+toast) {table_size / 1024 / 1024:.1f} MiB")
+        print(f"{'search':<28}{'recall':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        exact_sql = vector_index.nearest_sql(table=TABLE, storage_name="full", dim=args.dim)
+        truth, latencies = run_queries(db, exact_sql, queries, args.k, args.k, None)
+        print(f"{'exact (seq scan)':<28}{1.0:>10.3f}{statistics.median(latencies):>10.2f}{percentile(latencies, 95):>10.2f}")
+
+        for storage_name in storages:
+            name = f"ix_{TABLE}_{storage_name}"
+            db.execute(text("SELECT set_config('maintenance_work_mem', :m, false)"), {"m": settings.vector_index_build_mem})
+            t0 = time.perf_counter()
+            db.execute(text(vector_index.index_ddl(
+                TABLE, "embedding", name, "hnsw", metric, args.rows, concurrently=False,
+                storage_name=storage_name, dim=args.dim,
+            )))
+            db.commit()
+            build = time.perf_counter() - t0
+            size = db.execute(text("SELECT pg_relation_size(CAST(:n AS regclass))"), {"n": name}).scalar()
+            print(f"-- {storage_name}: build {build:.1f}s, index {size / 1024 / 1024:.1f} MiB ({size / args.rows:.0f} B/row)")
+
+            sql = vector_index.nearest_sql(table=TABLE, storage_name=storage_name, dim=args.dim)
+            for factor in ([1] if storage_name == "full" else args.rerank):
+                k_ann = args.k * factor
+                # search.py ile aynı: HNSW en fazla ef_search satır döndürür
+                results, latencies = run_queries(db, sql, queries, args.k, k_ann, min(1000, max(args.ef_search, k_ann)))
+                recall = statistics.mean(len(set(r) & set(t)) / args.k for r, t in zip(results, truth))
+                label = storage_name if storage_name == "full" else f"{storage_name} rerank x{factor}"
+                print(f"{label:<28}{recall:>10.3f}{statistics.median(latencies):>10.2f}{percentile(latencies, 95):>10.2f}")
+            db.execute(text(f"DROP INDEX {name}"))
+            db.commit()
+    finally:
+        db.rollback()
+        db.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        db.commit()
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Recall vs. latency of the ANN index (HNSW ef_search / IVFFlat probes sweeps) against exact search.
+
+Works on its own table (bench_vectors, dropped afterwards) so the chunks index is not
+touched. Vectors are clustered Gaussian points, L2-normalized like embedding-model
+output; queries are drawn from the same distribution. Ground truth is exact search
+with index scans disabled. Index DDL comes from app.vector_index, so HNSW_M,
+HNSW_EF_CONSTRUCTION, IVFFLAT_LISTS and VECTOR_METRIC apply.
+
+Usage (from backend/):
+    python -m bench.bench_vector_index --rows 20000 --dim 256
+    python -m bench.bench_vector_index --types ivfflat --probes 1 4 16 64
+"""
+import argparse
+import math
+import random
+import statistics
+import time
+from sqlalchemy import text
+from app.db import SessionLocal
+from app.settings import settings
+import app.bulk as bulk
+import app.vector_index as vector_index
+
+TABLE = "bench_vectors"
+
+def make_vectors(n: int, dim: int, clusters: int, rnd: random.Random):
+    centers = [[rnd.gauss(0, 1) for _ in range(dim)] for _ in range(clusters)]
+    out = []
+    for _ in range(n):
+        c = centers[rnd.randrange(clusters)]
+        v = [x + rnd.gauss(0, 0.6) for x in c]
+        norm = math.sqrt(sum(x * x for x in v)) or 1.0
+        out.append([x / norm for x in v])
+    return out
+
+def percentile(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def search(db, op: str, q, k: int):
+    return [r[0] for r in db.execute(
+        text(f"SELECT id FROM {TABLE} ORDER BY embedding {op} CAST(:q AS vector) LIMIT :k"), {"q": q, "k": k}
+    ).all()]
+
+def run_queries(db, op, queries, k, setup_sql=None):
+    results, latencies = [], []
+    for q in queries:
+        if setup_sql:
+            db.execute(text(setup_sql))
+        t0 = time.perf_counter()
+        results.append(search(db, op, q, k))
+        latencies.append((time.perf_counter() - t0) * 1000)
+        db.rollback()  # SET LOCAL ayarlarını sıfırla
+    return results, latencies
+
+def report(label, results, truth, latencies, k):
+    recall = statistics.mean(len(set(r) & set(t)) / k for r, t in zip(results, truth))
+    print(f"{label:<24}{recall:>10.3f}{statistics.median(latencies):>10.2f}{percentile(latencies, 95):>10.2f}")
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=20000)
+    ap.add_argument("--dim", type=int, default=256)
+    ap.add_argument("--clusters", type=int, default=50)
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--types", nargs="+", default=["hnsw", "ivfflat"])
+    ap.add_argument("--ef-search", type=int, nargs="+", default=[10, 20, 40, 80, 160])
+    ap.add_argument("--probes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    metric = vector_index.metric()
+    op = vector_index.distance_operator()
+    rnd = random.Random(args.seed)
+    data = make_vectors(args.rows, args.dim, args.clusters, rnd)
+    queries = make_vectors(args.queries, args.dim, args.clusters, random.Random(args.seed + 1))
+
+    db = SessionLocal()
+    try:
+        db.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        db.execute(text(f"CREATE TABLE {TABLE} (id serial PRIMARY KEY, embedding vector({args.dim}))"))
+        bulk._copy_rows(db, TABLE, ("embedding",), ("vector",), [(v,) for v in data])
+        db.commit()
+        db.execute(text(f"ANALYZE {TABLE}"))
+        db.commit()
+
+        print(f"{args.rows} rows x {args.dim} dims, {args.queries} queries, recall@{args.k}, metric={metric}")
+        print(f"{'search':<24}{'recall':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        truth, latencies = run_queries(db, op, queries, args.k, "SET LOCAL enable_indexscan = off")
+        report("exact (seq scan)", truth, truth, latencies, args.k)
+
+        for kind in args.types:
+            name = f"ix_{TABLE}_{kind}"
+            db.execute(text("SELECT set_config('maintenance_work_mem', :m, false)"), {"m": settings.vector_index_build_mem})
+            t0 = time.perf_counter()
+            db.execute(text(vector_index.index_ddl(TABLE, "embedding", name, kind, metric, args.rows, concurrently=False)))
+            db.commit()
+            build = time.perf_counter() - t0
+            size = db.execute(text("SELECT pg_relation_size(CAST(:n AS regclass))"), {"n": name}).scalar()
+            extra = f", lists={vector_index.ivfflat_lists(args.rows)}" if kind == "ivfflat" else ""
+            print(f"-- {kind}: build {build:.1f}s, {size / 1024 / 1024:.1f} MiB{extra}")
+            if kind == "hnsw":
+                sweep = [(f"hnsw ef_search={v}", f"SET LOCAL hnsw.ef_search = {v}") for v in args.ef_search]
+            else:
+                sweep = [(f"ivfflat probes={v}", f"SET LOCAL ivfflat.probes = {v}") for v in args.probes]
+            for label, setup in sweep:
+                results, latencies = run_queries(db, op, queries, args.k, setup)
+                report(label, results, truth, latencies, args.k)
+            db.execute(text(f"DROP INDEX {name}"))
+            db.commit()
+    finally:
+        db.rollback()
+        db.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        db.commit()
+        db.close()
+
+if __name__ == "__main__":
+    main()
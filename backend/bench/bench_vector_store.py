@@ -0,0 +1,135 @@
+"""Scoped vector search: pgvector (ANN index, exact SQL) vs. the in-process store (vector_store.py).
+
+Writes --docs throwaway documents of --chunks-per-doc chunks with clustered,
+L2-normalized vectors of EMBEDDING_DIM into chunks (deleted afterwards) and queries
+scopes of --scopes documents. Ground truth is pgvector exact (nearest_sql(exact=True)).
+  ann        nearest_sql as before SCOPED_EXACT_MAX_ROWS (ANN index, filter afterwards)
+  sql exact  the scoped exact SQL path
+  store warm the matrices in the in-process LRU (the steady state)
+for VECTOR_STORE_DTYPE float32 and float16. Per document, the one-off costs:
+  cold       read its embeddings from chunks and write the .npy files (first query)
+  disk       memory-map the files and compute the norms (a new worker, or after eviction)
+Store times include its generation lookup (one round trip); pgvector times are the
+query alone.
+
+Usage (from backend/):
+    python -m bench.bench_vector_store --docs 20 --chunks-per-doc 1000 --scopes 1 5 20
+    python -m bench.bench_vector_store --queries 200 --k 40
+"""
+import argparse
+import math
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from sqlalchemy import text
+from app.bulk import write_chunks
+from app.db import SessionLocal
+from app.models import Document
+from app.settings import settings
+from app import search
+from app.vector_store import VectorStore
+
+def make_vectors(n: int, dim: int, centers, rnd: random.Random):
+    out = []
+    for _ in range(n):
+        c = centers[rnd.randrange(len(centers))]
+        v = [x + rnd.gauss(0, 0.7) for x in c]
+        norm = math.sqrt(sum(x * x for x in v)) or 1.0
+        out.append([x / norm for x in v])
+    return out
+
+def build(db, docs: int, per_doc: int, dim: int, rnd: random.Random, centers):
+    ids = []
+    for i in range(docs):
+        doc = Document(title=f"bench_vector_store {i}", filename="bench_vector_store.pdf")
+        db.add(doc)
+        db.commit()
+        vectors = make_vectors(per_doc, dim, centers, rnd)
+        write_chunks(db, [{"document_id": doc.id, "section_path": None, "page_start": j + 1, "page_end": j + 1,
+                           "chunk_text": f"chunk {j}", "embedding": v} for j, v in enumerate(vectors)])
+        db.commit()
+        ids.append(doc.id)
+    db.execute(text("ANALYZE chunks"))
+    db.commit()
+    return ids
+
+def pg_nearest(db, q, scope, k: int, exact: bool):
+    rows = db.execute(*search._vector_query(q, scope, k, exact)).mappings().all()
+    db.rollback()
+    return [r["id"] for r in rows]
+
+def p95(xs):
+    return sorted(xs)[min(len(xs) - 1, int(0.95 * len(xs)))]
+
+def report(label: str, found, truth, times, k: int) -> None:
+    returned = statistics.mean(len(f) / k for f in found)
+    recall = statistics.mean(len(set(f) & set(t)) / max(1, len(t)) for f, t in zip(found, truth))
+    print(f"{label:<22}{returned:>7.2f}{recall:>8.3f}{statistics.median(times):>9.2f}{p95(times):>9.2f}")
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, (time.perf_counter() - t0) * 1000
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=20)
+    ap.add_argument("--chunks-per-doc", type=int, default=1000)
+    ap.add_argument("--scopes", type=int, nargs="+", default=[1, 5, 20], help="documents per query")
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    dim = settings.embedding_dim
+    rnd = random.Random(args.seed)
+    centers = [[rnd.gauss(0, 1) for _ in range(dim)] for _ in range(32)]
+    db = SessionLocal()
+    doc_ids, tmp = [], tempfile.mkdtemp(prefix="bench_vector_store")
+    try:
+        t0 = time.perf_counter()
+        doc_ids = build(db, args.docs, args.chunks_per_doc, dim, rnd, centers)
+        print(f"{args.docs} documents x {args.chunks_per_doc} chunks, dim {dim}, written in {time.perf_counter() - t0:.0f}s")
+        queries = make_vectors(args.queries, dim, centers, rnd)
+        keys = [tuple(r) for r in db.execute(
+            text("SELECT id, index_generation FROM documents WHERE id = ANY(:ids)"), {"ids": doc_ids})]
+        db.rollback()
+
+        print(f"\nper document ({args.chunks_per_doc} chunks){'':<4}{'p50 ms':>9}{'max ms':>9}")
+        stores = {}
+        for dtype in ("float32", "float16"):
+            settings.vector_store_dtype = dtype
+            store = VectorStore(f"{tmp}/{dtype}", 1 << 40, 1 << 40)
+            cold = [timed(store._write, key)[1] for key in keys]
+            disk = [timed(store._open, key)[1] for key in keys]
+            for key in keys:
+                store._keep(key, store._open(key))
+            print(f"{'store ' + dtype + ' cold':<30}{statistics.median(cold):>9.2f}{max(cold):>9.2f}  (read chunks, write .npy)")
+            print(f"{'store ' + dtype + ' disk':<30}{statistics.median(disk):>9.2f}{max(disk):>9.2f}  (mmap + norms)")
+            stores[dtype] = store
+
+        print(f"\n{'path':<22}{'rows':>7}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}")
+        for n in args.scopes:
+            scopes = [rnd.sample(doc_ids, min(n, len(doc_ids))) for _ in queries]
+            print(f"[{n} docs, {n * args.chunks_per_doc} chunks]")
+            truth = [pg_nearest(db, q, s, args.k, True) for q, s in zip(queries, scopes)]
+            for label, exact in (("ann", False), ("sql exact", True)):
+                found, times = zip(*(timed(pg_nearest, db, q, s, args.k, exact) for q, s in zip(queries, scopes)))
+                report(label, found, truth, times, args.k)
+            for dtype, store in stores.items():
+                settings.vector_store_dtype = dtype
+                found, times = zip(*(timed(store.search, s, q, args.k) for q, s in zip(queries, scopes)))
+                report(f"store {dtype} warm", [[i for i, _ in f] for f in found], truth, times, args.k)
+    finally:
+        settings.vector_store_dtype = "float32"
+        db.rollback()
+        if doc_ids:
+            db.execute(text("DELETE FROM documents WHERE id = ANY(:ids)"), {"ids": doc_ids})
+            db.commit()
+        db.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
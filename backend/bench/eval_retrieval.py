@@ -0,0 +1,177 @@
+"""Offline retrieval evaluation: recall@k and latency for fts / vector / concat / rrf.
+
+Two modes:
+
+* synthetic (default): writes a throwaway document with --chunks generated chunks and
+  deterministic hashed bag-of-words embeddings, asks one question per sampled chunk
+  (half use a "synonym" only the embedding knows, half use the exact rare terms) and
+  deletes everything afterwards. Needs only DATABASE_URL + migrate.sql.
+* --questions FILE: evaluates against the documents already in the database, embedding
+  questions with the configured provider. FILE is JSONL, one question per line:
+      {"question": "...", "relevant_chunks": [12, 13]}
+      {"question": "...", "relevant_pages": [[3, 41], [3, 42]]}   # [document_id, page]
+  A hit is any returned chunk listed in relevant_chunks or whose page range covers a
+  relevant page.
+
+"concat" is the previous hybrid behaviour (FTS results first, then vector results).
+
+Usage (from backend/):
+    python -m bench.eval_retrieval --chunks 3000 --questions-n 200
+    python -m bench.eval_retrieval --questions eval/questions.jsonl --k 3 5 10
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import statistics
+import time
+from sqlalchemy import text
+from app.db import SessionLocal
+from app.models import Document
+from app.settings import settings
+from app.search import fts_search, vector_search, hybrid_search
+from app.bulk import write_chunks
+
+FILLER = (
+    "devlet ordu asker nizam kanun hüküm sefer eyalet kadı vezir padişah divan "
+    "timar sipahi yeniçeri hazine vergi mukataa sancak beylerbeyi defter ferman"
+).split()
+
+FILLER_SET = set(FILLER)
+
+def hashed_embedding(words, dim: int):
+    # "esanlamN" ile "ozelN" aynı boyuta düşer: FTS'nin bilmediği bir eş anlamlıyı taklit eder
+    v = [0.0] * dim
+    for w in words:
+        w = w.replace("esanlam", "ozel")
+        h = hashlib.sha1(w.encode("utf-8")).digest()
+        idx = int.from_bytes(h[:4], "little") % dim
+        v[idx] += (0.2 if w in FILLER_SET else 1.0) * (1.0 if h[4] & 1 else -1.0)
+    norm = math.sqrt(sum(x * x for x in v)) or 1.0
+    return [x / norm for x in v]
+
+def concat_search(db, question, query_embedding, source_ids, limit):
+    fts = fts_search(db, question, source_ids=source_ids, limit=limit)
+    vec = vector_search(db, query_embedding, source_ids=source_ids, limit=limit)
+    out, seen = [], set()
+    for r in fts + vec:
+        if r["chunk_id"] not in seen:
+            seen.add(r["chunk_id"])
+            out.append(r)
+    return out[:limit]
+
+METHODS = {
+    "fts": lambda db, q, e, s, lim: fts_search(db, q, source_ids=s, limit=lim),
+    "vector": lambda db, q, e, s, lim: vector_search(db, e, source_ids=s, limit=lim),
+    "concat": concat_search,
+    "rrf": lambda db, q, e, s, lim: hybrid_search(db, q, query_embedding=e, source_ids=s, limit=lim),
+}
+
+def build_synthetic(db, n_chunks: int, n_questions: int, seed: int):
+    rnd = random.Random(seed)
+    topics = [[f"konu{t}k{j}" for j in range(6)] for t in range(max(1, n_chunks // 3))]
+    doc = Document(title="eval_retrieval", filename="eval_retrieval.pdf")
+    db.add(doc)
+    db.commit()
+    rows, words_by_chunk = [], []
+    for i in range(n_chunks):
+        topic = topics[i % len(topics)]
+        words = rnd.sample(topic, 4) + [f"ozel{i}", f"ozel{i}b"] + rnd.choices(FILLER, k=30)
+        rnd.shuffle(words)
+        words_by_chunk.append(words)
+        rows.append({
+            "document_id": doc.id, "section_path": None, "page_start": i + 1, "page_end": i + 1,
+            "chunk_text": " ".join(words), "embedding": hashed_embedding(words, settings.embedding_dim),
+        })
+    write_chunks(db, rows)
+    db.commit()
+    ids = [r[0] for r in db.execute(
+        text("SELECT id FROM chunks WHERE document_id = :d ORDER BY page_start"), {"d": doc.id}
+    ).all()]
+    questions = []
+    for i in rnd.sample(range(n_chunks), min(n_questions, n_chunks)):
+        words = words_by_chunk[i]
+        # Yarısında özel kelime yerine eş anlamlısı (FTS kaçırır, vektör bulur),
+        # diğer yarısında özel kelimelerin kendisi + genel kelimeler (ikisi de bulmalı)
+        topic_words = [w for w in words if w.startswith("konu")][:2]
+        if len(questions) % 2:
+            q_words = [f"esanlam{i}"] + topic_words
+        else:
+            q_words = [f"ozel{i}", f"ozel{i}b"] + rnd.sample(FILLER, 3)
+        questions.append({
+            "question": " ".join(q_words),
+            "embedding": hashed_embedding(q_words, settings.embedding_dim),
+            "relevant_chunks": [ids[i]],
+        })
+    return doc.id, questions
+
+def load_questions(path: str):
+    from app.embeddings import embed_texts
+    with open(path, encoding="utf-8") as f:
+        questions = [json.loads(line) for line in f if line.strip()]
+    embeddings = asyncio.run(embed_texts([q["question"] for q in questions])) or [None] * len(questions)
+    for q, e in zip(questions, embeddings):
+        q["embedding"] = e
+    return questions
+
+def is_hit(r, q) -> bool:
+    if r["chunk_id"] in set(q.get("relevant_chunks") or []):
+        return True
+    for doc_id, page in q.get("relevant_pages") or []:
+        if r["document_id"] == doc_id and r["page_start"] <= page <= r["page_end"]:
+            return True
+    return False
+
+def percentile(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def evaluate(db, questions, ks, source_ids):
+    max_k = max(ks)
+    print(f"{len(questions)} questions, candidates/index={max(max_k, settings.hybrid_candidates)}, rrf_k={settings.hybrid_rrf_k}")
+    header = f"{'method':<8}" + "".join(f"{'R@' + str(k):>8}" for k in ks) + f"{'p50 ms':>9}{'p95 ms':>9}"
+    print(header)
+    for name, fn in METHODS.items():
+        hits = {k: 0 for k in ks}
+        latencies = []
+        for q in questions:
+            t0 = time.perf_counter()
+            results = fn(db, q["question"], q["embedding"], source_ids, max_k)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            for k in ks:
+                if any(is_hit(r, q) for r in results[:k]):
+                    hits[k] += 1
+        n = len(questions) or 1
+        print(f"{name:<8}" + "".join(f"{hits[k] / n:>8.3f}" for k in ks)
+              + f"{statistics.median(latencies):>9.2f}{percentile(latencies, 95):>9.2f}")
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--questions", help="JSONL question set (default: synthetic corpus)")
+    ap.add_argument("--chunks", type=int, default=3000)
+    ap.add_argument("--questions-n", type=int, default=200)
+    ap.add_argument("--k", type=int, nargs="+", default=[3, 5, 10])
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    db = SessionLocal()
+    doc_id = None
+    try:
+        if args.questions:
+            questions = load_questions(args.questions)
+            evaluate(db, questions, args.k, None)
+        else:
+            doc_id, questions = build_synthetic(db, args.chunks, args.questions_n, args.seed)
+            evaluate(db, questions, args.k, [doc_id])
+    finally:
+        db.rollback()
+        if doc_id is not None:
+            db.execute(text("DELETE FROM chunks WHERE document_id = :d"), {"d": doc_id})
+            db.execute(text("DELETE FROM documents WHERE id = :d"), {"d": doc_id})
+            db.commit()
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import asyncio
+import pytest
+from app import answer_cache
+from app.answer_cache import AnswerCache, MemoryBackend
+from app.settings import runtime_settings
+
+def test_owner_cancelled_waiter_still_gets_result():
+    async def run():
+        cache = AnswerCache(MemoryBackend())
+        started, release = asyncio.Event(), asyncio.Event()
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            started.set()
+            await release.wait()
+            return {"answer": "cevap", "citations": []}
+
+        owner = asyncio.create_task(cache.get_or_compute("k", "m", compute))
+        await started.wait()
+        waiter = asyncio.create_task(cache.get_or_compute("k", "m", compute))
+        await asyncio.sleep(0)
+        owner.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        assert (await waiter)["answer"] == "cevap"
+        # Sonuç iptale rağmen önbelleğe yazıldı
+        assert await cache.get_or_compute("k", "m", compute) == {"answer": "cevap", "citations": []}
+        return cache, calls
+
+    cache, calls = asyncio.run(run())
+    assert calls == 1
+    assert (cache.misses, cache.coalesced, cache.hits) == (1, 1, 1)
+    assert not cache._inflight
+
+def test_stream_and_ask_share_one_llm_call(monkeypatch):
+    calls = {"stream": 0, "ask": 0}
+
+    async def fake_stream(question, evidence):
+        calls["stream"] += 1
+        for part in ("ce", "vap"):
+            await asyncio.sleep(0.01)
+            yield {"type": "token", "text": part}
+        yield {"type": "final", "answer": "cevap", "citations": []}
+
+    async def fake_answer(question, evidence):
+        calls["ask"] += 1
+        return {"answer": "başka", "citations": []}
+
+    monkeypatch.setattr(answer_cache, "stream_answer", fake_stream)
+    monkeypatch.setattr(answer_cache, "answer_with_citations", fake_answer)
+    monkeypatch.setattr(answer_cache.settings, "answer_cache_backend", "memory")
+    monkeypatch.setattr(answer_cache, "_cache", AnswerCache(MemoryBackend()))
+    evidence = [{"chunk_id": 1}]
+
+    async def consume():
+        return [e async for e in answer_cache.stream_with_cache("soru", evidence)]
+
+    async def run():
+        first = asyncio.create_task(consume())
+        await asyncio.sleep(0.005)  # ilk akış başladı, henüz bitmedi
+        return await asyncio.gather(first, consume(), answer_cache.answer_with_cache("soru", evidence))
+
+    streamed, joined, asked = asyncio.run(run())
+    assert [e["type"] for e in streamed] == ["token", "token", "final"]
+    assert joined == [{"type": "token", "text": "cevap"}, {"type": "final", "answer": "cevap", "citations": []}]
+    assert asked == {"answer": "cevap", "citations": []}
+    assert calls == {"stream": 1, "ask": 0}
+    assert answer_cache._cache.coalesced == 2
+
+def test_error_reaches_every_caller_and_is_not_cached():
+    async def run():
+        cache = AnswerCache(MemoryBackend())
+        started, release = asyncio.Event(), asyncio.Event()
+        calls = 0
+
+        async def failing():
+            nonlocal calls
+            calls += 1
+            started.set()
+            await release.wait()
+            raise ValueError("llm")
+
+        owner = asyncio.create_task(cache.get_or_compute("k", "m", failing))
+        await started.wait()
+        waiter = asyncio.create_task(cache.get_or_compute("k", "m", failing))
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(owner, waiter, return_exceptions=True)
+        assert [type(r) for r in results] == [ValueError, ValueError]
+        assert not cache._inflight
+
+        async def ok():
+            return {"answer": "cevap", "citations": []}
+        assert (await cache.get_or_compute("k", "m", ok))["answer"] == "cevap"
+        return cache, calls
+
+    cache, calls = asyncio.run(run())
+    assert calls == 1
+    assert (cache.misses, cache.coalesced, cache.hits) == (2, 1, 0)
+
+def test_failed_answers_are_not_stored():
+    async def run():
+        cache = AnswerCache(MemoryBackend())
+        results = iter([{"answer": "yok", "llm_failed": True}, {"answer": "cevap"}])
+
+        async def compute():
+            return next(results)
+        first = await cache.get_or_compute("k", "m", compute)
+        second = await cache.get_or_compute("k", "m", compute)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first["llm_failed"] and second == {"answer": "cevap"}
+
+def test_key_depends_on_every_chat_route(monkeypatch):
+    def key(base_url, fallbacks):
+        monkeypatch.setattr(runtime_settings, "chat_base_url", base_url)
+        monkeypatch.setattr(runtime_settings, "chat_model", "m")
+        monkeypatch.setattr(runtime_settings, "chat_fallbacks", fallbacks)
+        return answer_cache.answer_key(answer_cache.routes(), "p", "Soru?", [1, 2])
+
+    base = key("http://a/v1", [])
+    assert key("http://a/v1", []) == base
+    assert key("http://b/v1", []) != base
+    fallback = [{"base_url": "http://f/v1", "model": "m2"}]
+    assert key("http://a/v1", fallback) != base
+    assert key("http://a/v1", [{**fallback[0], "api_key": "x"}]) == key("http://a/v1", fallback)
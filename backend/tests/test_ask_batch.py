@@ -0,0 +1,146 @@
+import asyncio
+import json
+import random
+import httpx
+import pytest
+from sqlalchemy.exc import OperationalError
+from app import main, search
+from app.db import SessionLocal
+from app.models import Chunk, Document
+from app.schemas import AskResponse
+from app.settings import settings
+
+@pytest.fixture
+def batch(monkeypatch):
+    """POST /ask/batch with embeddings, retrieval and answers faked; returns (lines, status, calls)."""
+    calls = {"embed": [], "search": 0}
+    delays = {"yavaş": 0.05, "orta": 0.02}
+
+    async def fake_embed(texts, model=None, dim=None):
+        calls["embed"].append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    async def fake_search(db, questions, embeddings, scopes, **knobs):
+        calls["search"] += 1
+        assert len(questions) == len(embeddings) == len(scopes)
+        return [[] for _ in questions]
+
+    async def fake_answer(question, evidence):
+        await asyncio.sleep(delays.get(question, 0))
+        if question == "hata":
+            raise RuntimeError("llm down")
+        return AskResponse(answer=f"cevap: {question}", citations=[], evidence=[])
+
+    async def no_db():
+        yield None
+
+    monkeypatch.setattr(main, "embed_texts", fake_embed)
+    monkeypatch.setattr(search, "hybrid_search_batch_async", fake_search)
+    monkeypatch.setattr(main, "answer_evidence", fake_answer)
+    monkeypatch.setitem(main.app.dependency_overrides, main.get_async_db, no_db)
+    main.query_embedding_cache.clear()
+
+    def post(body):
+        async def go():
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post("/ask/batch", json=body)
+        r = asyncio.run(go())
+        lines = [json.loads(x) for x in r.text.splitlines() if x] if r.status_code == 200 else []
+        return lines, r.status_code, calls
+
+    return post
+
+def test_lines_in_completion_order_with_errors_and_summary(batch):
+    questions = [{"question": "yavaş", "id": "a"}, {"question": "hata", "id": "b"},
+                 {"question": "orta", "id": "c"}, {"question": "hızlı", "id": "d"}]
+    lines, status, calls = batch({"questions": questions, "concurrency": 4})
+    assert status == 200
+    answers, summary = lines[:-1], lines[-1]
+    assert [line["id"] for line in answers] == ["b", "d", "c", "a"]
+    assert [line["index"] for line in answers] == [1, 3, 2, 0]
+    failed = answers[0]
+    assert failed["type"] == "answer" and failed["error"] == "llm down" and failed["answer"] == ""
+    assert all("error" not in line and line["answer"] == f"cevap: {line['question']}" for line in answers[1:])
+    assert summary["type"] == "summary" and summary["questions"] == 4 and summary["concurrency"] == 4
+    # Tüm sorular tek embedding çağrısı ve tek arama ile
+    assert calls["embed"] == [["yavaş", "hata", "orta", "hızlı"]]
+    assert calls["search"] == 1
+
+def test_cached_embeddings_are_not_requested_again(batch):
+    batch({"questions": [{"question": "bir"}, {"question": "iki"}]})
+    _, _, calls = batch({"questions": [{"question": "bir"}, {"question": "üç"}, {"question": "iki"}]})
+    assert calls["embed"] == [["bir", "iki"], ["üç"]]
+
+def test_question_limit(batch, monkeypatch):
+    monkeypatch.setattr(settings, "ask_batch_max_questions", 2)
+    _, status, calls = batch({"questions": [{"question": "a"}, {"question": "b"}, {"question": "c"}]})
+    assert status == 413
+    assert calls["embed"] == [] and calls["search"] == 0
+    assert batch({"questions": []})[1] == 422
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        session.connection()
+    except OperationalError as e:
+        session.close()
+        pytest.skip(f"database unavailable: {e}")
+    yield session
+    session.rollback()
+    session.close()
+
+def test_batch_sql_matches_single_searches(db, monkeypatch):
+    monkeypatch.setattr(search.vector_store, "max_bytes", 0)  # ayrı bağlantı: commit edilmemiş satırları görmez
+    rnd = random.Random(1)
+    words = ["devlet", "kanun", "ordu", "sulh", "vergi", "tımar", "sancak", "divan", "kadı", "vakıf"]
+
+    def vec():
+        return [rnd.gauss(0, 1) for _ in range(settings.embedding_dim)]
+
+    docs = []
+    for d in range(3):
+        doc = Document(title=f"test_ask_batch {d}", filename="test_ask_batch.pdf")
+        db.add(doc)
+        db.flush()
+        docs.append(doc.id)
+        for i in range(30):
+            text = " ".join(rnd.choice(words) for _ in range(12))
+            db.add(Chunk(document_id=doc.id, page_start=i + 1, page_end=i + 1, chunk_text=text, embedding=vec()))
+    db.flush()
+    questions = ["devlet kanun", "ordu sulh", "vergi", "bulunmayan kelime", "tımar sancak"]
+    embeddings = [vec(), vec(), None, vec(), vec()]
+    scopes = [docs, [docs[0]], [docs[1], docs[2]], docs, [docs[2]]]
+    with monkeypatch.context() as m:
+        m.setattr(search, "hybrid_search", None)  # tek statement: soru başına aramaya düşmemeli
+        batched = search.hybrid_search_batch(db, questions, embeddings, scopes, limit=8)
+    assert len(batched) == len(questions)
+    for q, v, s, got in zip(questions, embeddings, scopes, batched):
+        single = search.hybrid_search(db, q, v, s, limit=8)
+        assert [e["chunk_id"] for e in got] == [e["chunk_id"] for e in single], q
+        assert all(e["document_id"] in s for e in got)
+
+def test_fused_search_falls_back_to_trigrams(db, monkeypatch):
+    if not search.lexical_features()["trigram"]:
+        pytest.skip("pg_trgm not installed")
+    monkeypatch.setattr(search.vector_store, "max_bytes", 0)
+    rnd = random.Random(2)
+
+    def vec():
+        return [rnd.gauss(0, 1) for _ in range(settings.embedding_dim)]
+
+    doc = Document(title="test_ask_batch trigram", filename="test_ask_batch.pdf")
+    db.add(doc)
+    db.flush()
+    texts = ["sancakbeyi tayin edildi"] + [f"vergi defteri {i}" for i in range(20)]
+    chunks = [Chunk(document_id=doc.id, page_start=i + 1, page_end=i + 1, chunk_text=t, embedding=vec())
+              for i, t in enumerate(texts)]
+    db.add_all(chunks)
+    db.flush()
+    question, embedding = "sancakbeyy", vec()  # yazım hatası: tsquery eşleşmez
+    assert not search.fts_search(db, question, [doc.id], fallback_when_empty=False)
+    fused = search.hybrid_search(db, question, embedding, [doc.id], limit=8)
+    assert chunks[0].id in [e["chunk_id"] for e in fused]
+    batched = search.hybrid_search_batch(db, [question], [embedding], [[doc.id]], limit=8)[0]
+    assert [e["chunk_id"] for e in batched] == [e["chunk_id"] for e in fused]
@@ -0,0 +1,47 @@
+from app.chunking import StructureChunker, split_heading
+
+def words(text):
+    return text.split()
+
+def chunk(pages, max_chars=1800, overlap_chars=200):
+    c = StructureChunker(max_chars=max_chars, overlap_chars=overlap_chars)
+    out = []
+    for page_no, text, headings in pages:
+        out.extend(c.feed(page_no, text, headings))
+    return out + c.finish()
+
+def covered(chunks, text):
+    """Every word of text appears in the chunks, in order (overlap may repeat some)."""
+    got = iter(w for c in chunks for w in words(c["chunk_text"]))
+    return all(any(w == g for g in got) for w in words(text))
+
+def test_split_heading():
+    assert split_heading("1. Giris\nİlk cümle.\nİkinci", "1. Giriş") == ("1. Giris", "İlk cümle.\nİkinci")
+    assert split_heading("Osmanlı Devletinde\nKanunnameler\nMetin.", "Osmanlı Devletinde Kanunnameler") == (
+        "Osmanlı Devletinde\nKanunnameler", "Metin.")
+    assert split_heading("Sıradan paragraf\nsatırı", "Başka Başlık") == ("Sıradan paragraf", "satırı")
+
+def test_run_in_heading_then_overflow_keeps_text():
+    run_in = "1. Giris\n" + " ".join(f"Giriş cümlesi {i} burada." for i in range(42))
+    para = " ".join(f"Sonraki paragrafın {i}. cümlesi." for i in range(57))[:1596]
+    text = f"{run_in}\n\n{para}"
+    chunks = chunk([(1, text, [[1, "1. Giris", 0]])])
+    assert [c["section_path"] for c in chunks] == ["1. Giris", "1. Giris"]
+    assert chunks[0]["chunk_text"].startswith("1. Giris")
+    assert covered(chunks, text)
+    assert all(len(c["chunk_text"]) <= 1800 for c in chunks)
+
+def test_heading_on_body_block_and_long_heading_block():
+    # TOC eşleşmedi: başlık sıradan, uzun bir gövde bloğuna düştü
+    body = "\n".join(f"Satır {i}: devletin kanunları burada anlatılır." for i in range(60))
+    nxt = "Kısa paragraf."
+    text = f"{body}\n\n{nxt}"
+    chunks = chunk([(3, text, [[1, "Kanunlar", 0]])], max_chars=600, overlap_chars=100)
+    assert covered(chunks, text)
+    assert all(len(c["chunk_text"]) <= 600 for c in chunks)
+
+def test_heading_only_buffer_is_emitted():
+    chunks = chunk([(1, "Bölüm 1\n\n" + "x " * 400, [[1, "Bölüm 1", 0]]), (2, "Son Bölüm", [[1, "Son Bölüm", 0]])],
+                   max_chars=500)
+    assert chunks[-1]["chunk_text"] == "Son Bölüm"
+    assert chunks[0]["chunk_text"].startswith("Bölüm 1")
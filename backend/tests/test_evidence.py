@@ -0,0 +1,50 @@
+from app.embeddings import approx_tokens
+from app.evidence import pack_evidence
+from app.llm import evidence_block
+
+def hit(chunk_id, text, document_id=1, page=1, section="1. Giriş", title="tez"):
+    return {
+        "chunk_id": chunk_id, "document_id": document_id, "document_title": title, "section_path": section,
+        "page_start": page, "page_end": page, "chunk_text": text, "excerpt": text[:100],
+    }
+
+def test_empty():
+    assert pack_evidence("soru", [], budget=1000) == []
+
+def test_neighbours_merge_without_overlap():
+    a = "Devlet-i Aliyye ordusu serhadlerde kışladı. Sulh müzakereleri kışın başladı ve uzun sürdü."
+    b = "Sulh müzakereleri kışın başladı ve uzun sürdü. Antlaşma baharda imzalandı."
+    packed = pack_evidence("sulh antlaşması", [hit(11, b, page=4), hit(10, a, page=3)], budget=1000)
+    assert len(packed) == 1
+    assert packed[0]["chunk_ids"] == [10, 11]
+    assert (packed[0]["page_start"], packed[0]["page_end"]) == (3, 4)
+    assert packed[0]["excerpt"].count("Sulh müzakereleri") == 1
+    assert packed[0]["excerpt"].endswith("Antlaşma baharda imzalandı.")
+
+def test_rank_order_and_near_duplicates():
+    text = "Kanunname-i Osmani reayanın vergilerini ve tımar sisteminin işleyişini ayrıntılı olarak düzenler."
+    evidence = [
+        hit(50, "Yeniçeri ocağının kuruluşu ve devşirme usulü bu bölümde anlatılır.", document_id=2),
+        hit(10, text, document_id=1),
+        hit(90, text, document_id=3),  # başka belgede aynı metin
+    ]
+    packed = pack_evidence("kanunname vergi", evidence, budget=1000)
+    assert [p["document_id"] for p in packed] == [2, 1]
+
+def test_budget_is_respected_and_long_blocks_trimmed(monkeypatch):
+    from app import evidence
+    monkeypatch.setattr(evidence.settings, "evidence_block_max_tokens", 60)
+    filler = " ".join(f"Bu cümle konuyla ilgisiz bir ayrıntı {i} anlatır." for i in range(40))
+    long = filler + " Tımar sistemi sipahilere toprak geliri bağlar. " + filler
+    evidence_items = [hit(i * 10, long, document_id=i, section=None) for i in range(1, 6)]
+    budget = 200
+    packed = pack_evidence("tımar sistemi nedir", evidence_items, budget=budget)
+    assert packed
+    used = sum(approx_tokens(evidence_block(i, p)) + 1 for i, p in enumerate(packed, start=1))
+    assert used <= budget
+    assert "Tımar sistemi sipahilere toprak geliri bağlar." in packed[0]["excerpt"]
+    assert "…" in packed[0]["excerpt"]
+
+def test_first_block_always_included():
+    packed = pack_evidence("soru", [hit(1, "Uzun bir metin. " * 200)], budget=0)
+    assert len(packed) == 1 and packed[0]["excerpt"]
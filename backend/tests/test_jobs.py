@@ -0,0 +1,91 @@
+import threading
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app import jobs
+from app.db import SessionLocal
+from app.models import Chunk, Document, IngestJob
+
+@pytest.fixture
+def job():
+    """A document with a job claimed as attempt 1; deleted (with its job and chunks) afterwards."""
+    db = SessionLocal()
+    try:
+        db.connection()
+    except OperationalError as e:
+        db.close()
+        pytest.skip(f"database unavailable: {e}")
+    doc = Document(title="test_jobs", filename="test_jobs.pdf", ingest_status="running")
+    db.add(doc)
+    db.flush()
+    row = IngestJob(document_id=doc.id, status="running", stage="extracting", attempts=1)
+    db.add(row)
+    db.commit()
+    ids = (row.id, doc.id)
+    yield ids
+    db.execute(text("DELETE FROM documents WHERE id = :id"), {"id": ids[1]})
+    db.commit()
+    db.close()
+
+def _reclaim(job_id: int) -> None:
+    # Başka bir worker'ın bayat job'u yeniden alması
+    with SessionLocal() as db:
+        db.execute(text("""
+            UPDATE ingest_jobs SET attempts = attempts + 1, updated_at = now() - interval '1 hour'
+            WHERE id = :id
+        """), {"id": job_id})
+        db.commit()
+
+def _job(job_id: int):
+    with SessionLocal() as db:
+        return db.execute(text("""
+            SELECT j.stage, j.attempts, j.updated_at, d.ingest_status
+            FROM ingest_jobs j JOIN documents d ON d.id = j.document_id WHERE j.id = :id
+        """), {"id": job_id}).first()
+
+def test_update_job_only_for_current_claim(job):
+    job_id, doc_id = job
+    assert jobs._update_job(job_id, doc_id, 1, stage="embedding")
+    _reclaim(job_id)
+    assert not jobs._update_job(job_id, doc_id, 1, stage="persisting")
+    stage, attempts, _, status = _job(job_id)
+    assert (stage, attempts, status) == ("embedding", 2, "embedding")
+
+def test_lost_claim_blocks_commit(job):
+    job_id, doc_id = job
+    db = SessionLocal()
+    jobs._guard_claim(db, job_id, 1)
+    try:
+        db.add(Chunk(document_id=doc_id, page_start=1, page_end=1, chunk_text="ilk"))
+        db.commit()  # claim hâlâ bizde
+        _reclaim(job_id)
+        db.add(Chunk(document_id=doc_id, page_start=2, page_end=2, chunk_text="ikinci"))
+        with pytest.raises(jobs.ClaimLost):
+            db.commit()
+        db.rollback()
+        texts = db.execute(text("SELECT chunk_text FROM chunks WHERE document_id = :id"), {"id": doc_id}).scalars().all()
+        assert texts == ["ilk"]
+    finally:
+        db.close()
+
+def test_heartbeat_runs_until_claim_is_lost(job, monkeypatch):
+    job_id, doc_id = job
+    monkeypatch.setattr(jobs.settings, "ingest_heartbeat_seconds", 0.05)
+    with SessionLocal() as db:
+        db.execute(text("UPDATE ingest_jobs SET updated_at = now() - interval '1 hour' WHERE id = :id"), {"id": job_id})
+        db.commit()
+    before = _job(job_id)[2]
+    stop = threading.Event()
+    beat = threading.Thread(target=jobs._heartbeat, args=(job_id, doc_id, 1, stop), daemon=True)
+    beat.start()
+    try:
+        for _ in range(100):
+            if _job(job_id)[2] > before:
+                break
+            stop.wait(0.05)
+        assert _job(job_id)[2] > before
+        _reclaim(job_id)
+        beat.join(timeout=5)
+        assert not beat.is_alive()  # claim başkasında: heartbeat kendiliğinden durur
+    finally:
+        stop.set()
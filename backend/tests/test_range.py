@@ -0,0 +1,33 @@
+import pytest
+from app.main import _parse_range
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=500-", (500, 999)),
+    ("bytes=0-5000", (0, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=999-999", (999, 999)),
+    ("bytes=0-1,5-6", None),  # birden fazla aralık: tüm dosya
+    ("items=0-1", None),
+    # Geçersiz başlık yok sayılır (RFC 7233 3.1): tüm dosya, 200
+    ("bytes=5-2", None),
+    ("bytes=a-b", None),
+    ("bytes=-", None),
+    ("bytes=1-2x", None),
+])
+def test_parse_range(header, expected):
+    assert _parse_range(header, 1000) == expected
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=1000-2000", "bytes=-0"])
+def test_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        _parse_range(header, 1000)
+
+def test_empty_file():
+    with pytest.raises(ValueError):
+        _parse_range("bytes=0-", 0)
+    with pytest.raises(ValueError):
+        _parse_range("bytes=-10", 0)
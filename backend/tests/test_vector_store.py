@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app import vector_index
+from app.db import engine
+from app.vector_store import VectorStore, _Entry
+
+# The in-process top-k must agree with pgvector's operators (ordering and distances)
+
+_SQL = """
+    SELECT u.i, CAST(u.v AS vector) {op} CAST(:q AS vector) AS d
+    FROM unnest(CAST(:ids AS bigint[]), CAST(:vecs AS text[])) AS u(i, v)
+    ORDER BY d, u.i
+    LIMIT :k
+"""
+
+@pytest.fixture(scope="module")
+def conn():
+    try:
+        with engine.connect() as c:
+            c.execute(text("SELECT CAST('[1]' AS vector)"))
+            yield c
+    except OperationalError as e:
+        pytest.skip(f"database unavailable: {e}")
+
+def _literal(v) -> str:
+    return "[" + ",".join(repr(float(x)) for x in v) + "]"
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+@pytest.mark.parametrize("metric", ["cosine", "ip", "l2"])
+def test_top_k_matches_pgvector(conn, tmp_path, metric, dtype):
+    rng = np.random.default_rng(7)
+    dim, k = 64, 10
+    docs = [rng.normal(size=(n, dim)).astype(dtype) for n in (40, 25, 1)]
+    ids = [np.arange(n, dtype=np.int64) + 1000 * (d + 1) for d, n in enumerate((40, 25, 1))]
+    q = rng.normal(size=dim).astype(np.float32)
+    store = VectorStore(str(tmp_path), 1 << 20, 0)
+    got = store._top_k([_Entry(i, v, metric) for i, v in zip(ids, docs)], q, k, metric)
+
+    all_ids = np.concatenate(ids)
+    all_vecs = np.concatenate(docs).astype(np.float32)  # pgvector'e giden değerler (float16 ise yuvarlanmış)
+    rows = conn.execute(text(_SQL.format(op=vector_index._OPERATOR[metric])), {
+        "q": _literal(q), "ids": all_ids.tolist(), "vecs": [_literal(v) for v in all_vecs], "k": k,
+    }).all()
+    assert [i for i, _ in got] == [r[0] for r in rows]
+    assert np.allclose([d for _, d in got], [r[1] for r in rows], rtol=1e-4, atol=1e-4)
+
+def test_top_k_empty_and_other_dimension(tmp_path):
+    store = VectorStore(str(tmp_path), 1 << 20, 0)
+    empty = _Entry(np.zeros(0, np.int64), np.zeros((0, 0), np.float32), "cosine")
+    assert store._top_k([empty], np.ones(4, np.float32), 5, "cosine") == []
+    entry = _Entry(np.arange(3, dtype=np.int64), np.ones((3, 8), np.float32), "cosine")
+    assert store._top_k([entry], np.ones(4, np.float32), 5, "cosine") is None
+    assert store.fallbacks == 1
@@ -14,6 +14,7 @@ type Doc = {
   title: string;
   filename: string;
   has_text_layer: boolean;
+  ingest_status?: string;
 };
 
 type Citation = {
@@ -83,6 +84,7 @@ export default function Home() {
 
   const [docs, setDocs] = useState<Doc[]>([]);
   const [uploading, setUploading] = useState(false);
+  const [ingestInfo, setIngestInfo] = useState<string>("");
   const [question, setQuestion] = useState("");
   const [sourceIds, setSourceIds] = useState<number[]>([]);
   const [answer, setAnswer] = useState<string>("");
@@ -94,6 +96,8 @@ export default function Home() {
   const [leftWidth, setLeftWidth] = useState(50);
   const [dragging, setDragging] = useState(false);
   const [sourcesOpen, setSourcesOpen] = useState(false);
+  // Citation hover önizlemesi: backend'in cache'lediği sayfa görüntüsü
+  const [preview, setPreview] = useState<{ src: string; x: number; y: number } | null>(null);
   const containerRef = useRef<HTMLDivElement>(null);
 
   const theme = darkMode ? themes.dark : themes.light;
@@ -159,13 +163,37 @@ export default function Home() {
       fd.append("file", file);
       const r = await fetch(API_BASE + "/upload", { method: "POST", body: fd });
       if (!r.ok) throw new Error(await r.text());
+      const data = await r.json();
       await refreshDocs();
       ev.target.value = "";
+      if (data.job_id) await waitForJob(data.job_id);
+      // Ayni icerik zaten yuklu: mevcut belgeyi ac
+      if (data.duplicate) {
+        setSelectedDocId(data.document.id);
+        setSelectedPage(1);
+      }
     } catch (e: any) {
       alert(e?.message || String(e));
     } finally {
       setUploading(false);
+      setIngestInfo("");
+    }
+  }
+
+  // Ingest arka planda calisir; /jobs/{id} ile ilerlemeyi takip et
+  async function waitForJob(jobId: number) {
+    while (true) {
+      const r = await fetch(API_BASE + "/jobs/" + jobId);
+      if (!r.ok) throw new Error(await r.text());
+      const job = await r.json();
+      if (job.status === "done") break;
+      if (job.status === "failed") throw new Error(job.error || "Ingest basarisiz");
+      const pages = job.pages_total ? ` ${job.pages_done}/${job.pages_total} sayfa` : "";
+      const eta = job.eta_seconds != null ? ` (~${Math.ceil(job.eta_seconds)} sn)` : "";
+      setIngestInfo(`${job.stage}${pages}${eta}`);
+      await new Promise((res) => setTimeout(res, 1500));
     }
+    await refreshDocs();
   }
 
   async function onAsk() {
@@ -176,15 +204,42 @@ export default function Home() {
     try {
       const payload: any = { question, top_k: 8 };
       if (sourceIds.length) payload.source_ids = sourceIds;
-      const r = await fetch(API_BASE + "/ask", {
+      const r = await fetch(API_BASE + "/ask/stream", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify(payload),
       });
-      if (!r.ok) throw new Error(await r.text());
-      const data = await r.json();
-      setAnswer(data.answer || "");
-      setCitations(data.citations || []);
+      if (!r.ok || !r.body) throw new Error(await r.text());
+      // SSE: evidence -> token* -> final -> done
+      const reader = r.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let streamed = "";
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let sep;
+        while ((sep = buffer.indexOf("\n\n")) !== -1) {
+          const raw = buffer.slice(0, sep);
+          buffer = buffer.slice(sep + 2);
+          let event = "message";
+          let data = "";
+          for (const line of raw.split("\n")) {
+            if (line.startsWith("event:")) event = line.slice(6).trim();
+            else if (line.startsWith("data:")) data += line.slice(5).trim();
+          }
+          if (!data) continue;
+          const parsed = JSON.parse(data);
+          if (event === "token") {
+            streamed += parsed.text;
+            setAnswer(streamed);
+          } else if (event === "final") {
+            setAnswer(parsed.answer || "");
+            setCitations(parsed.citations || []);
+          }
+        }
+      }
     } catch (e: any) {
       alert(e?.message || String(e));
     } finally {
@@ -374,7 +429,7 @@ export default function Home() {
               <span>Dosya Sec</span>
               <input type="file" accept="application/pdf" onChange={onUpload} disabled={uploading} style={{ display: "none" }} />
             </label>
-            {uploading && <span style={{ color: theme.accent, fontSize: 14, fontWeight: 500 }}>Yukleniyor...</span>}
+            {uploading && <span style={{ color: theme.accent, fontSize: 14, fontWeight: 500 }}>{ingestInfo ? "Isleniyor: " + ingestInfo : "Yukleniyor..."}</span>}
           </div>
         </div>
 
@@ -503,6 +558,12 @@ export default function Home() {
                       <button
                         key={i}
                         onClick={() => openCitation(citation.document_id, firstPage)}
+                        onMouseEnter={(e) => setPreview({
+                          src: `${API_BASE}/documents/${citation.document_id}/pages/${firstPage}/image?dpi=48`,
+                          x: e.clientX,
+                          y: e.clientY,
+                        })}
+                        onMouseLeave={() => setPreview(null)}
                         style={{
                           background: theme.accent,
                           color: "#fff",
@@ -542,6 +603,24 @@ export default function Home() {
                 return <span key={i}>{part}</span>;
               })}
             </div>
+            {preview && (
+              <img
+                src={preview.src}
+                alt=""
+                style={{
+                  position: "fixed",
+                  left: preview.x + 12,
+                  top: Math.max(8, preview.y - 160),
+                  width: 220,
+                  border: "1px solid " + theme.cardBorder,
+                  borderRadius: 6,
+                  boxShadow: "0 8px 24px rgba(0,0,0,0.18)",
+                  background: "#fff",
+                  pointerEvents: "none",
+                  zIndex: 50,
+                }}
+              />
+            )}
           </div>
         )}
       </div>
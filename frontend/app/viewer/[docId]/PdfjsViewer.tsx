@@ -26,7 +26,14 @@ export default function PdfjsViewer({ docId, page, highlight }: { docId: string;
       pdfjsLib.GlobalWorkerOptions.workerSrc =
         "https://cdnjs.cloudflare.com/ajax/libs/pdf.js/4.2.67/pdf.worker.min.js";
       const url = `${API_BASE}/files/${docId}`;
-      pdfDoc = await pdfjsLib.getDocument(url).promise;
+      // Range istekleri: backend /files Accept-Ranges + Content-Length döner, PDF.js yalnızca
+      // gereken parçaları ister (tüm dosyayı indirmeden ilk sayfa açılır)
+      pdfDoc = await pdfjsLib.getDocument({
+        url,
+        disableStream: true,
+        disableAutoFetch: true,
+        rangeChunkSize: 65536,
+      }).promise;
       if (destroyed) return;
       const eventBus = new pdfjsViewer.EventBus();
       pdfLinkService = new pdfjsViewer.PDFLinkService({ eventBus });